@@ -0,0 +1,221 @@
+"""
+Mergeable per-barcode partial aggregates.
+
+A BarcodeAggregate summarizes every record seen for one barcode in constant
+space relative to the record count: running min/max price, name → count
+and category → count tallies, the set of suppliers and, with
+track_prices, a bounded price sketch for quantiles. Aggregates are
+picklable and merge associatively, so files can be pre-aggregated in
+worker processes and reduced in the parent.
+
+The sketch is only kept when something reads quantiles (priceRange
+percentiles, the price history median): it holds up to
+2 * PRICE_SKETCH_SIZE floats per barcode and travels with every spill
+run, partial and checkpoint.
+
+Merging partials in the same order the records would have been read
+reproduces the single-pass result exactly, including how ties in the
+name/category votes resolve (Counters keep first-seen order).
+"""
+
+import math
+from collections import Counter
+
+# The price sketch keeps price → count exactly up to 2 * PRICE_SKETCH_SIZE
+# distinct prices, then merges the closest neighbours down to PRICE_SKETCH_SIZE
+# weighted centroids (a streaming histogram), so its size stays bounded no
+# matter how many stores report a barcode
+PRICE_SKETCH_SIZE = 64
+
+
+def compress_prices(prices, size=PRICE_SKETCH_SIZE):
+    """
+    Reduce a price → weight dict to at most `size` entries by repeatedly
+    merging the two closest prices into their weighted mean.
+    """
+    centroids = sorted(prices.items())
+    while len(centroids) > size:
+        i = min(range(len(centroids) - 1), key=lambda j: centroids[j + 1][0] - centroids[j][0])
+        (low, w_low), (high, w_high) = centroids[i], centroids[i + 1]
+        weight = w_low + w_high
+        centroids[i : i + 2] = [((low * w_low + high * w_high) / weight, weight)]
+    return dict(centroids)
+
+
+def price_quantile(prices, q):
+    """
+    Nearest-rank quantile (0 ≤ q ≤ 1) of a price → weight dict: the
+    smallest price whose cumulative weight reaches ceil(q * total), so
+    q=0 is the minimum and q=1 the maximum.
+    """
+    items = sorted(prices.items())
+    total = sum(weight for _, weight in items)
+    # round() so that e.g. 0.3 * 10 counts as rank 3, not 4
+    rank = max(1, math.ceil(round(q * total, 9)))
+    seen = 0
+    for price, weight in items:
+        seen += weight
+        if seen >= rank:
+            return price
+    return items[-1][0]
+
+
+class BarcodeAggregate:
+    """
+    Partial aggregate of all records seen for a single barcode.
+
+    Args:
+        track_prices: keep the price sketch, so price_quantile() works
+            between the minimum and the maximum
+    """
+
+    __slots__ = ("min_price", "max_price", "prices", "names", "categories", "suppliers")
+
+    def __init__(self, track_prices=False):
+        self.min_price = float("inf")
+        self.max_price = float("-inf")
+        # Price sketch: price → count (see PRICE_SKETCH_SIZE), None if not tracked
+        self.prices = {} if track_prices else None
+        self.names = Counter()
+        self.categories = Counter()
+        self.suppliers = set()
+
+    def add(self, name, price, category="", supplier=""):
+        """Fold a single record into the aggregate."""
+        self.names[name] += 1
+        if price < self.min_price:
+            self.min_price = price
+        if price > self.max_price:
+            self.max_price = price
+        prices = self.prices
+        if prices is not None:
+            prices[price] = prices.get(price, 0) + 1
+            if len(prices) > 2 * PRICE_SKETCH_SIZE:
+                self.prices = compress_prices(prices)
+        if category:
+            self.categories[category] += 1
+        if supplier:
+            self.suppliers.add(supplier)
+
+    def merge(self, other):
+        """
+        Fold `other` into this aggregate in place and return self.
+
+        `other` is treated as coming after `self` in read order. The
+        result keeps a price sketch only if both sides do.
+        """
+        if other.min_price < self.min_price:
+            self.min_price = other.min_price
+        if other.max_price > self.max_price:
+            self.max_price = other.max_price
+        prices = self.prices
+        if prices is not None and other.prices is None:
+            self.prices = None
+        elif prices is not None:
+            for price, count in other.prices.items():
+                prices[price] = prices.get(price, 0) + count
+            if len(prices) > 2 * PRICE_SKETCH_SIZE:
+                self.prices = compress_prices(prices)
+        self.names.update(other.names)
+        self.categories.update(other.categories)
+        self.suppliers |= other.suppliers
+        return self
+
+    def price_quantile(self, q):
+        """
+        Nearest-rank price quantile (exact up to 2 * PRICE_SKETCH_SIZE distinct prices).
+
+        Raises:
+            ValueError: for 0 < q < 1 if the aggregate doesn't track prices
+        """
+        if q <= 0:
+            return self.min_price
+        if q >= 1:
+            return self.max_price
+        if self.prices is None:
+            raise ValueError("Price quantiles need an aggregate built with track_prices=True")
+        return price_quantile(self.prices, q)
+
+    def __getstate__(self):
+        return (self.min_price, self.max_price, self.prices, self.names, self.categories, self.suppliers)
+
+    def __setstate__(self, state):
+        (self.min_price, self.max_price, self.prices, self.names, self.categories, self.suppliers) = state
+
+    def __eq__(self, other):
+        if not isinstance(other, BarcodeAggregate):
+            return NotImplemented
+        return self.__getstate__() == other.__getstate__()
+
+    def __repr__(self):
+        return (
+            f"BarcodeAggregate(min_price={self.min_price}, max_price={self.max_price}, "
+            f"names={dict(self.names)}, suppliers={sorted(self.suppliers)})"
+        )
+
+
+def aggregate_records(records, aggregates=None, track_prices=False):
+    """
+    Fold an iterable of product records into per-barcode aggregates.
+
+    Args:
+        records: Iterable of records with barcode/name/price/category/supplier,
+            or a columnar.RecordColumns / ColumnView (read without building dicts)
+        aggregates: Existing dict to fold into (default: a new dict)
+        track_prices: keep a price sketch per barcode, for price quantiles
+
+    Returns:
+        (aggregates, record_count)
+    """
+    if aggregates is None:
+        aggregates = {}
+
+    iter_rows = getattr(records, "iter_rows", None)
+    if iter_rows is not None:
+        return aggregate_rows(iter_rows(), aggregates, track_prices=track_prices)
+
+    record_count = 0
+    for rec in records:
+        record_count += 1
+        barcode = rec["barcode"]
+        agg = aggregates.get(barcode)
+        if agg is None:
+            agg = aggregates[barcode] = BarcodeAggregate(track_prices)
+        agg.add(rec["name"], rec["price"], rec.get("category"), rec.get("supplier"))
+
+    return aggregates, record_count
+
+
+def aggregate_rows(rows, aggregates=None, track_prices=False):
+    """
+    Like aggregate_records, for (barcode, name, price, category, supplier)
+    tuples such as columnar.RecordColumns.iter_rows() yields.
+    """
+    if aggregates is None:
+        aggregates = {}
+
+    record_count = 0
+    for barcode, name, price, category, supplier in rows:
+        record_count += 1
+        agg = aggregates.get(barcode)
+        if agg is None:
+            agg = aggregates[barcode] = BarcodeAggregate(track_prices)
+        agg.add(name, price, category, supplier)
+
+    return aggregates, record_count
+
+
+def merge_aggregates(target, source):
+    """
+    Merge a barcode → BarcodeAggregate dict into `target` in place.
+
+    `source` is treated as coming after `target` in read order.
+    Returns target.
+    """
+    for barcode, agg in source.items():
+        existing = target.get(barcode)
+        if existing is None:
+            target[barcode] = agg
+        else:
+            existing.merge(agg)
+    return target
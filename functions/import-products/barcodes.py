@@ -0,0 +1,260 @@
+"""
+Barcode (GTIN) normalization for cross-chain matching.
+
+Chains publish the same product's ItemCode in different shapes: a GTIN-13
+as "7290000000015", padded to 14 digits as "07290000000015", a UPC-A
+(GTIN-12) with or without its leading zero. normalize_barcode() maps all
+of them to one canonical key: the digits with leading zeros and
+surrounding whitespace dropped. firestore_sync.product_doc_id is derived
+from this key, so document IDs follow the same matching.
+
+Codes that aren't real GTINs are flagged as internal:
+- non-numeric codes, and numeric ones shorter than 8 or longer than 14
+  digits once zeros are stripped
+- codes whose GS1 check digit doesn't match
+- restricted-circulation numbers (GTIN-13 prefixes 20–29, UPC-A number
+  systems 2 and 4, GTIN-8 prefix 2), which chains assign to weighed and
+  in-store items themselves
+
+Internal codes can't be trusted to mean the same product across chains,
+so they aren't folded together: their key is the code as published
+(whitespace stripped), and "001234" from one chain and "1234" from
+another stay two products, as they were before normalization.
+BarcodeIndex.is_internal() and its stats tell them apart.
+
+BarcodeIndex memoizes raw → key and keeps key → raw forms, so the parser,
+dedup and sync stages resolve each raw code once (a dict lookup per
+record afterwards). It can be saved and reloaded between runs
+(BARCODE_INDEX_FOLDER, IMPORT_BARCODE_INDEX_DIR). Saving drops raw codes
+no run has seen for MAX_IDLE_RUNS runs, and keeps at most MAX_SAVED_CODES
+(the most recently seen), so the saved index follows the live catalog
+instead of growing forever.
+"""
+
+import gzip
+import logging
+import os
+import pickle
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+BARCODE_INDEX_FOLDER = os.environ.get("IMPORT_BARCODE_INDEX_DIR", "/tmp/supermarket_barcode_index")
+INDEX_NAME = "barcodes.pkl.gz"
+
+GTIN_LENGTHS = (8, 12, 13, 14)
+MIN_GTIN_DIGITS = 8
+MAX_GTIN_DIGITS = 14
+
+# Saved raw codes unseen for this many runs are dropped
+MAX_IDLE_RUNS = 8
+# At most this many raw codes are saved (the most recently seen)
+MAX_SAVED_CODES = 2_000_000
+
+
+def gtin_check_digit(body):
+    """GS1 mod-10 check digit of `body` (a GTIN without its last digit)."""
+    total = 0
+    for i, digit in enumerate(reversed(body)):
+        total += int(digit) * (3 if i % 2 == 0 else 1)
+    return str((10 - total % 10) % 10)
+
+
+def is_valid_gtin(code):
+    """True if `code` is an 8/12/13/14-digit GTIN with a correct check digit."""
+    return code.isdigit() and len(code) in GTIN_LENGTHS and gtin_check_digit(code[:-1]) == code[-1]
+
+
+def _is_restricted(digits):
+    """Restricted-circulation (chain-assigned) number, by zero-stripped digits."""
+    if len(digits) == 13 or len(digits) == 8:
+        return digits[0] == "2"
+    if len(digits) == 12:
+        return digits[0] in "24"
+    return False
+
+
+def normalize_barcode(raw):
+    """
+    Canonical key and internal-code flag of a raw ItemCode.
+
+    Returns:
+        (key, internal) — key is the code without surrounding whitespace
+        and, for GTINs, without leading zeros; internal codes keep theirs
+    """
+    code = raw.strip()
+    key = code.lstrip("0") or "0"
+    if not key.isascii() or not key.isdigit():
+        return code, True
+    if not MIN_GTIN_DIGITS <= len(key) <= MAX_GTIN_DIGITS:
+        return code, True
+    # Left zero padding doesn't change the check digit, so the key is
+    # checked as its GTIN-14 form
+    if not is_valid_gtin(key.zfill(MAX_GTIN_DIGITS)) or _is_restricted(key):
+        return code, True
+    return key, False
+
+
+def to_gtin(key, length=13):
+    """
+    Zero-padded GTIN form of a canonical key (e.g. length=14 for GTIN-14).
+
+    Raises:
+        ValueError: for internal codes or keys longer than `length`
+    """
+    if length not in GTIN_LENGTHS:
+        raise ValueError(f"Not a GTIN length: {length}")
+    key, internal = normalize_barcode(key)
+    if internal or len(key) > length:
+        raise ValueError(f"{key!r} has no GTIN-{length} form")
+    return key.zfill(length)
+
+
+class BarcodeIndex:
+    """
+    Memoized raw ItemCode → canonical key, with key → raw forms.
+
+    Codes loaded from a previous run are kept apart (with the number of
+    runs since they were last seen) until this run sees them again, so
+    save() knows which codes are still in use without any bookkeeping on
+    the per-record path.
+    """
+
+    def __init__(self):
+        self._keys = {}  # raw → key, seen this run
+        self._previous = {}  # raw → (key, runs idle), loaded and not seen yet
+        self._raw = {}  # key → raw forms, first seen first
+        self._internal = set()  # internal keys
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._raw)
+
+    def __contains__(self, key):
+        return key in self._raw
+
+    def key(self, raw):
+        """Canonical key of `raw` (see normalize_barcode)."""
+        key = self._keys.get(raw)
+        if key is not None:
+            self.hits += 1
+            return key
+        previous = self._previous.pop(raw, None)
+        if previous is not None:
+            self.hits += 1
+            key = self._keys[raw] = previous[0]
+            return key
+        self.misses += 1
+        key, internal = normalize_barcode(raw)
+        self._keys[raw] = key
+        self._raw.setdefault(key, []).append(raw)
+        if internal:
+            self._internal.add(key)
+        return key
+
+    __call__ = key
+
+    def raw_forms(self, key):
+        """Raw codes seen for `key`, in first-seen order."""
+        return list(self._raw.get(key, ()))
+
+    def is_internal(self, key):
+        return key in self._internal
+
+    def normalize_records(self, records):
+        """Yield `records` with their barcode replaced by its canonical key (in place)."""
+        for record in records:
+            record["barcode"] = self.key(record["barcode"])
+            yield record
+
+    def fork(self):
+        """An empty index (e.g. for a worker process); fold it back with update()."""
+        return BarcodeIndex()
+
+    def update(self, other):
+        """Add the raw forms another index has resolved."""
+        for raw, key in other._keys.items():
+            if raw in self._keys:
+                continue
+            self._keys[raw] = key
+            if self._previous.pop(raw, None) is None:
+                self._raw.setdefault(key, []).append(raw)
+        self._internal |= other._internal
+        self.hits += other.hits
+        self.misses += other.misses
+
+    def stats(self):
+        return {
+            "keys": len(self._raw),
+            "rawForms": len(self._keys) + len(self._previous),
+            "merged": sum(1 for forms in self._raw.values() if len(forms) > 1),
+            "internal": len(self._internal),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def __getstate__(self):
+        return {"keys": self._keys, "previous": self._previous, "internal": self._internal}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self._keys = state["keys"]
+        self._previous = state.get("previous", {})
+        self._internal = state["internal"]
+        for raw, (key, _) in self._previous.items():
+            self._raw.setdefault(key, []).append(raw)
+        for raw, key in self._keys.items():
+            self._raw.setdefault(key, []).append(raw)
+
+    def for_next_run(self, max_idle_runs=MAX_IDLE_RUNS, max_codes=MAX_SAVED_CODES):
+        """
+        The index as the next run should load it: this run's codes plus the
+        older ones seen within max_idle_runs runs, at most max_codes of them
+        (most recently seen first).
+        """
+        carried = [(raw, key, 0) for raw, key in self._keys.items()]
+        carried += [
+            (raw, key, idle + 1) for raw, (key, idle) in self._previous.items() if idle + 1 < max_idle_runs
+        ]
+        if len(carried) > max_codes:
+            # Stable, so this run's codes keep their first-seen order
+            carried.sort(key=lambda item: item[2])
+            del carried[max_codes:]
+        saved = BarcodeIndex()
+        saved.__setstate__(
+            {
+                "keys": {},
+                "previous": {raw: (key, idle) for raw, key, idle in carried},
+                "internal": {key for _, key, _ in carried if key in self._internal},
+            }
+        )
+        return saved
+
+    @classmethod
+    def load(cls, folder=None):
+        """The index saved by a previous run, or an empty one."""
+        path = Path(folder or BARCODE_INDEX_FOLDER) / INDEX_NAME
+        try:
+            with gzip.open(path, "rb") as f:
+                index = pickle.load(f)
+        except FileNotFoundError:
+            return cls()
+        except Exception:
+            logger.warning("Unreadable barcode index at %s — starting a new one", path)
+            return cls()
+        logger.info("Loaded barcode index of %d raw codes from %s", index.stats()["rawForms"], path)
+        return index
+
+    def save(self, folder=None, max_idle_runs=MAX_IDLE_RUNS, max_codes=MAX_SAVED_CODES):
+        """Save the index for the next run, dropping codes unused for too long."""
+        saved = self.for_next_run(max_idle_runs, max_codes)
+        folder = Path(folder or BARCODE_INDEX_FOLDER)
+        folder.mkdir(parents=True, exist_ok=True)
+        path = folder / INDEX_NAME
+        tmp = path.with_name(INDEX_NAME + ".tmp")
+        with gzip.open(tmp, "wb", compresslevel=1) as f:
+            pickle.dump(saved, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        dropped = len(self._keys) + len(self._previous) - len(saved._previous)
+        logger.info("Saved barcode index of %d raw codes (%d dropped)", len(saved._previous), dropped)
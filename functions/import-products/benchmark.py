@@ -0,0 +1,350 @@
+"""
+Benchmark runner for the import pipeline stages.
+
+Generates seeded synthetic dumps (see synthetic_data.py) of each requested
+size and measures, per stage, wall time, records/sec and peak Python memory
+(tracemalloc):
+- read_csv:            parser.iter_parsed_output over converted CSVs
+- read_xml:            parser.iter_raw_xml over raw gzipped XMLs
+- read_csv_columns:    parser.read_parsed_columns (columnar storage)
+- clean_product_name:  one call per record
+- name_cleaner:        names.NameCleaner (compiled, memoized), one call per record
+- deduplicate_products
+- deduplicate_products_numpy: the vectorized engine over read_parsed_columns
+- sync_products:       against an in-memory Firestore stand-in
+
+Results are written as JSON so runs can be compared over time.
+
+Usage:
+    python benchmark.py --rows 10000 100000 1000000 --output bench.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from parser import (
+    DEDUP_NUMPY,
+    clean_product_name,
+    deduplicate_products,
+    iter_parsed_output,
+    iter_raw_xml,
+    read_parsed_columns,
+)
+from names import NameCleaner
+from synthetic_data import FORMAT_CSV, FORMAT_XML, chain_names, generate_dump
+
+logger = logging.getLogger("benchmark")
+
+DEFAULT_ROWS = [10_000, 100_000, 1_000_000]
+ALL_STAGES = [
+    "read_csv",
+    "read_xml",
+    "read_csv_columns",
+    "clean_product_name",
+    "name_cleaner",
+    "deduplicate_products",
+    "deduplicate_products_numpy",
+    "sync_products",
+]
+
+
+def measure(stage, fn, records_in, trace_memory=True):
+    """
+    Run fn() and return (result, stats) for one stage.
+
+    stats: {"seconds", "recordsIn", "recordsPerSec", "peakMemoryMb"}
+    """
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result = fn()
+    finally:
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else 0
+        if trace_memory:
+            tracemalloc.stop()
+
+    stats = {
+        "seconds": round(elapsed, 4),
+        "recordsIn": records_in,
+        "recordsPerSec": round(records_in / elapsed, 1) if elapsed > 0 else None,
+        "peakMemoryMb": round(peak / (1024 * 1024), 2) if trace_memory else None,
+    }
+    logger.info("%-22s %8d records  %8.3fs  %s", stage, records_in, elapsed, stats)
+    return result, stats
+
+
+def run_benchmark(rows, stages=None, seed=0, trace_memory=True, workdir=None):
+    """
+    Benchmark every stage for one dataset size.
+
+    Returns:
+        {"rows": int, "stages": {stage: stats}}
+    """
+    stages = stages or ALL_STAGES
+    names = chain_names()
+    results = {}
+
+    with tempfile.TemporaryDirectory(dir=workdir) as tmpdir:
+        csv_root = os.path.join(tmpdir, "csv")
+        xml_root = os.path.join(tmpdir, "xml")
+        generate_dump(csv_root, rows, fmt=FORMAT_CSV, seed=seed)
+
+        records, results["read_csv"] = measure(
+            "read_csv", lambda: list(iter_parsed_output(csv_root)), rows, trace_memory
+        )
+
+        if "read_xml" in stages:
+            generate_dump(xml_root, rows, fmt=FORMAT_XML, seed=seed)
+            _, results["read_xml"] = measure(
+                "read_xml", lambda: sum(1 for _ in iter_raw_xml(xml_root)), rows, trace_memory
+            )
+
+        if "read_csv_columns" in stages:
+            _, results["read_csv_columns"] = measure(
+                "read_csv_columns", lambda: read_parsed_columns(csv_root), rows, trace_memory
+            )
+
+        if "clean_product_name" in stages:
+            _, results["clean_product_name"] = measure(
+                "clean_product_name",
+                lambda: [clean_product_name(r["name"], names) for r in records],
+                len(records),
+                trace_memory,
+            )
+
+        if "name_cleaner" in stages:
+            cleaner = NameCleaner(names)
+            _, results["name_cleaner"] = measure(
+                "name_cleaner",
+                lambda: [cleaner(r["name"]) for r in records],
+                len(records),
+                trace_memory,
+            )
+            results["name_cleaner"]["cache"] = cleaner.stats()
+
+        products = {}
+        if "deduplicate_products" in stages or "sync_products" in stages:
+            products, stats = measure(
+                "deduplicate_products",
+                lambda: deduplicate_products(records, min_suppliers=2, chain_names=names),
+                len(records),
+                trace_memory,
+            )
+            if "deduplicate_products" in stages:
+                results["deduplicate_products"] = stats
+
+        if "deduplicate_products_numpy" in stages:
+            import numpy  # noqa: F401 — the engine imports it lazily; don't time the import
+
+            columns = read_parsed_columns(csv_root)
+            _, results["deduplicate_products_numpy"] = measure(
+                "deduplicate_products_numpy",
+                lambda: deduplicate_products(
+                    columns, min_suppliers=2, chain_names=names, engine=DEDUP_NUMPY
+                ),
+                len(columns),
+                trace_memory,
+            )
+
+        if "sync_products" in stages:
+            results["sync_products"] = _benchmark_sync(products, trace_memory)
+
+    return {"rows": rows, "stages": {k: v for k, v in results.items() if k in stages}}
+
+
+def _benchmark_sync(products, trace_memory):
+    try:
+        from firestore_sync import sync_products
+    except ImportError:
+        logger.warning("google-cloud-firestore is not installed; skipping sync_products")
+        return {"skipped": "google-cloud-firestore not installed"}
+
+    db = InMemoryDb()
+    # First run creates everything, second run measures the steady state
+    sync_products(db, products)
+    counts, stats = measure("sync_products", lambda: sync_products(db, products), len(products), trace_memory)
+    stats["writes"] = db.writes
+    stats["counts"] = {k: v for k, v in counts.items() if isinstance(v, int)}
+    return stats
+
+
+class InMemoryDb:
+    """
+    Minimal in-memory stand-in for the Firestore client, covering the calls
+    firestore_sync makes. Commits are instantaneous, so the sync benchmark
+    measures the client-side cost only.
+    """
+
+    def __init__(self):
+        self.collections = {}
+        self.config = {}
+        self.writes = 0
+        self._next_id = 0
+
+    def collection(self, name):
+        return _Collection(self, self.collections.setdefault(name, {}))
+
+    def document(self, path):
+        return _ConfigDoc(self.config, path)
+
+    def batch(self):
+        return _Batch(self)
+
+    def get_all(self, refs, field_paths=None):
+        for ref in refs:
+            yield _Snapshot(ref.id, ref.docs.get(ref.id))
+
+    def new_id(self):
+        self._next_id += 1
+        return f"{self._next_id:020d}"
+
+
+class _Snapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class _Ref:
+    def __init__(self, docs, doc_id):
+        self.docs = docs
+        self.id = doc_id
+
+
+class _Collection:
+    def __init__(self, db, docs, filters=()):
+        self._db = db
+        self._docs = docs
+        self._filters = filters
+
+    def document(self, doc_id=None):
+        return _Ref(self._docs, doc_id or self._db.new_id())
+
+    def where(self, field, op, value):
+        return _Collection(self._db, self._docs, self._filters + ((field, op, value),))
+
+    def select(self, fields):
+        return self
+
+    def stream(self):
+        for doc_id, data in list(self._docs.items()):
+            if all(self._matches(doc_id, data, *f) for f in self._filters):
+                yield _Snapshot(doc_id, data)
+
+    @staticmethod
+    def _matches(doc_id, data, field, op, value):
+        actual = doc_id if field == "__name__" else data.get(field)
+        if field == "__name__":
+            value = value.id
+        if op == "==":
+            return actual == value
+        if actual is None:
+            return False
+        if op == ">=":
+            return actual >= value
+        if op == "<":
+            return actual < value
+        raise ValueError(f"Unsupported operator {op}")
+
+
+class _Batch:
+    def __init__(self, db):
+        self._db = db
+        self._ops = []
+
+    def set(self, ref, data, merge=False):
+        self._ops.append((ref, data, merge or False))
+
+    def update(self, ref, data):
+        self._ops.append((ref, data, True))
+
+    def delete(self, ref):
+        self._ops.append((ref, None, False))
+
+    def commit(self):
+        from google.cloud.firestore import SERVER_TIMESTAMP
+
+        now = datetime.now(timezone.utc)
+        for ref, data, merge in self._ops:
+            if data is None:
+                ref.docs.pop(ref.id, None)
+                continue
+            data = {k: (now if v is SERVER_TIMESTAMP else v) for k, v in data.items()}
+            if merge and ref.id in ref.docs:
+                ref.docs[ref.id].update(data)
+            else:
+                ref.docs[ref.id] = dict(data)
+            self._db.writes += 1
+
+
+class _ConfigDoc:
+    def __init__(self, store, path):
+        self._store = store
+        self._path = path
+
+    def get(self):
+        return _Snapshot(self._path, self._store.get(self._path))
+
+    def set(self, data, merge=False):
+        if merge and self._path in self._store:
+            self._store[self._path].update(data)
+        else:
+            self._store[self._path] = dict(data)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS, help="dataset sizes")
+    arg_parser.add_argument("--stages", nargs="+", choices=ALL_STAGES, default=ALL_STAGES)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--output", default=None, help="JSON results path")
+    arg_parser.add_argument("--no-trace-memory", action="store_true", help="skip tracemalloc (faster)")
+    arg_parser.add_argument("--workdir", default=None, help="where synthetic dumps are written")
+    args = arg_parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+
+    started = datetime.now(timezone.utc)
+    report = {
+        "meta": {
+            "startedAt": started.isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "traceMemory": not args.no_trace_memory,
+        },
+        "runs": [
+            run_benchmark(
+                rows,
+                stages=args.stages,
+                seed=args.seed,
+                trace_memory=not args.no_trace_memory,
+                workdir=args.workdir,
+            )
+            for rows in args.rows
+        ],
+    }
+
+    output = args.output or f"benchmark-{started.strftime('%Y%m%dT%H%M%S')}.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    logger.info("Wrote benchmark results to %s", output)
+    return report
+
+
+if __name__ == "__main__":
+    main()
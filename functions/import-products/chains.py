@@ -5,6 +5,14 @@ Each entry maps a human-readable name to the scraper enum value
 used by il-supermarket-scraper. To add more chains, append to CHAINS
 and ensure the enum exists in ScraperFactory.
 
+"origin" is the host the chain publishes its price files on. Downloads are
+rate limited per origin, so chains sharing a host are spaced out while
+chains on different hosts download concurrently.
+
+"aliases" are other forms of the chain's name found in ItemName (the
+Hebrew name, brand names); they are stripped from product names along
+with "name".
+
 Top Israeli supermarket chains by market share:
 1. Shufersal (~30%)
 2. Rami Levy (discount)
@@ -13,8 +21,36 @@ Top Israeli supermarket chains by market share:
 """
 
 CHAINS = [
-    {"id": "SHUFERSAL", "name": "Shufersal"},
-    {"id": "RAMI_LEVY", "name": "Rami Levy"},
-    {"id": "VICTORY", "name": "Victory"},
-    {"id": "YAYNO_BITAN", "name": "Yeinot Bitan"},
+    {
+        "id": "SHUFERSAL",
+        "name": "Shufersal",
+        "origin": "prices.shufersal.co.il",
+        "aliases": ["שופרסל"],
+    },
+    {
+        "id": "RAMI_LEVY",
+        "name": "Rami Levy",
+        "origin": "url.publishedprices.co.il",
+        "aliases": ["רמי לוי"],
+    },
+    {
+        "id": "VICTORY",
+        "name": "Victory",
+        "origin": "laibcatalog.co.il",
+        "aliases": ["ויקטורי"],
+    },
+    {
+        "id": "YAYNO_BITAN",
+        "name": "Yeinot Bitan",
+        "origin": "prices.ybitan.co.il",
+        "aliases": ["יינות ביתן", "קרפור"],
+    },
 ]
+
+
+def chain_name_variants(chains=CHAINS):
+    """Every name of `chains` to strip from product names (names, then aliases)."""
+    variants = [c["name"] for c in chains]
+    for c in chains:
+        variants.extend(c.get("aliases", []))
+    return list(dict.fromkeys(variants))
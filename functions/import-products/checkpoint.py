@@ -0,0 +1,106 @@
+"""
+Stage checkpoints for resuming a failed import run.
+
+Each completed stage of main.main() saves its output under
+CHECKPOINT_FOLDER/<run id>/<stage>.pkl.gz (pickle, gzip-compressed):
+- download:  manifest of the downloaded files (see build_manifest)
+- aggregate: (per-barcode aggregates, record count)
+- products:  deduplicated products
+- sync:      progress cursor — number of products whose writes committed
+
+A retry with the same run ID (the Cloud Run execution name, which task
+retries share, or --resume on the CLI) skips every stage that has a
+checkpoint and resumes the sync after the last committed batch.
+Checkpoints are deleted once a run succeeds.
+
+Cloud Run instances don't share /tmp, so IMPORT_CHECKPOINT_DIR should
+point at a mounted volume for task retries to find the checkpoints (and,
+for the download manifest, the downloaded files).
+"""
+
+import gzip
+import logging
+import os
+import pickle
+import shutil
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FOLDER = os.environ.get("IMPORT_CHECKPOINT_DIR", "/tmp/supermarket_checkpoints")
+
+STAGE_DOWNLOAD = "download"
+STAGE_AGGREGATE = "aggregate"
+STAGE_PRODUCTS = "products"
+STAGE_SYNC = "sync"
+
+
+class RunCheckpoint:
+    """Checkpoints of one run. With run_id=None checkpointing is disabled."""
+
+    def __init__(self, run_id, root=CHECKPOINT_FOLDER):
+        self.run_id = run_id
+        self.folder = Path(root) / run_id if run_id else None
+
+    @property
+    def enabled(self):
+        return self.folder is not None
+
+    def _path(self, stage):
+        return self.folder / f"{stage}.pkl.gz"
+
+    def load(self, stage):
+        """Saved output of a stage, or None if missing, unreadable or disabled."""
+        if not self.enabled:
+            return None
+        path = self._path(stage)
+        if not path.exists():
+            return None
+        try:
+            with gzip.open(path, "rb") as f:
+                value = pickle.load(f)
+        except Exception as e:
+            logger.warning("Ignoring unreadable checkpoint %s: %s", path, e)
+            return None
+        logger.info("Resuming run %s from %s checkpoint", self.run_id, stage)
+        return value
+
+    def save(self, stage, value):
+        """Atomically write a stage's output."""
+        if not self.enabled:
+            return
+        self.folder.mkdir(parents=True, exist_ok=True)
+        path = self._path(stage)
+        tmp = path.with_name(path.name + ".tmp")
+        # Level 1: checkpoints are written on the critical path
+        with gzip.open(tmp, "wb", compresslevel=1) as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def clear(self):
+        """Remove all checkpoints of this run."""
+        if self.enabled:
+            shutil.rmtree(self.folder, ignore_errors=True)
+
+
+def build_manifest(data_folder):
+    """{"dataFolder": str, "files": {relative path: size}} of a download."""
+    root = Path(data_folder)
+    files = {
+        str(path.relative_to(root)): path.stat().st_size
+        for path in root.rglob("*")
+        if path.is_file()
+    }
+    return {"dataFolder": str(root), "files": files}
+
+
+def manifest_matches(manifest):
+    """True if every file in the manifest is still on disk with the same size."""
+    if not manifest or not manifest.get("files"):
+        return False
+    root = Path(manifest["dataFolder"])
+    for rel_path, size in manifest["files"].items():
+        path = root / rel_path
+        if not path.is_file() or path.stat().st_size != size:
+            return False
+    return True
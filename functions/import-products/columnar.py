@@ -0,0 +1,218 @@
+"""
+Compact columnar storage for parsed price rows.
+
+A record dict (barcode, name, price, category, supplier) costs several
+hundred bytes once its strings are counted. RecordColumns keeps the same
+rows in typed columns instead:
+- barcodes: fixed-width ASCII bytes (BARCODE_WIDTH per row, NUL-padded);
+  the rare barcode that doesn't fit is kept in a small overflow dict
+- prices: array('d')
+- names, categories, suppliers: small-int codes (array('I') / array('H'))
+  into interned StringTables
+
+which is about 30 bytes per row plus the distinct strings.
+
+Rows are added with append()/append_record()/extend() and read back as
+record dicts (iteration, indexing) or, without copying, through
+RecordColumns.view(start, stop), which exposes memoryviews over the
+columns. aggregate.aggregate_records() consumes RecordColumns directly.
+"""
+
+import sys
+from array import array
+
+BARCODE_WIDTH = 16
+_PAD = b"\0"
+
+
+class StringTable:
+    """Interned string ↔ code table (codes are dense, in first-seen order)."""
+
+    __slots__ = ("values", "_codes")
+
+    def __init__(self):
+        self.values = []
+        self._codes = {}
+
+    def code(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(sys.intern(value))
+        return code
+
+    def __getitem__(self, code):
+        return self.values[code]
+
+    def __len__(self):
+        return len(self.values)
+
+
+class RecordColumns:
+    """Append-only columnar container of product records."""
+
+    def __init__(self, barcode_width=BARCODE_WIDTH):
+        self.barcode_width = barcode_width
+        self.barcodes = bytearray()
+        self.prices = array("d")
+        self.name_codes = array("I")
+        self.category_codes = array("I")
+        self.supplier_codes = array("H")
+        self.names = StringTable()
+        self.categories = StringTable()
+        self.suppliers = StringTable()
+        self._overflow = {}  # row → barcode too long (or non-ASCII) for the fixed width
+
+    def __len__(self):
+        return len(self.prices)
+
+    def append(self, barcode, name, price, category="", supplier=""):
+        """Add one row. Raises BufferError while a view() is still held."""
+        width = self.barcode_width
+        try:
+            encoded = barcode.encode("ascii")
+        except UnicodeEncodeError:
+            encoded = None
+        if encoded is None or len(encoded) > width or _PAD in encoded:
+            self._overflow[len(self.prices)] = barcode
+            encoded = b""
+        self.barcodes += encoded.ljust(width, _PAD)
+        self.prices.append(price)
+        self.name_codes.append(self.names.code(name))
+        self.category_codes.append(self.categories.code(category or ""))
+        self.supplier_codes.append(self.suppliers.code(supplier or ""))
+
+    def append_record(self, record):
+        self.append(
+            record["barcode"],
+            record["name"],
+            record["price"],
+            record.get("category", ""),
+            record.get("supplier", ""),
+        )
+
+    def extend(self, records):
+        """Append an iterable of record dicts. Returns self."""
+        for record in records:
+            self.append_record(record)
+        return self
+
+    def barcode(self, row):
+        if row in self._overflow:
+            return self._overflow[row]
+        start = row * self.barcode_width
+        return self.barcodes[start : start + self.barcode_width].rstrip(_PAD).decode("ascii")
+
+    def record(self, row):
+        """Row `row` as a record dict (the shape parser readers produce)."""
+        return {
+            "barcode": self.barcode(row),
+            "name": self.names[self.name_codes[row]],
+            "price": self.prices[row],
+            "category": self.categories[self.category_codes[row]],
+            "supplier": self.suppliers[self.supplier_codes[row]],
+        }
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("RecordColumns slices must be contiguous")
+            return self.view(start, stop)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("row index out of range")
+        return self.record(index)
+
+    def __iter__(self):
+        return (self.record(row) for row in range(len(self)))
+
+    def view(self, start=0, stop=None):
+        """Zero-copy ColumnView over rows [start, stop)."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        return ColumnView(self, start, stop)
+
+    def iter_rows(self):
+        """Yield (barcode, name, price, category, supplier) tuples."""
+        return self.view().iter_rows()
+
+    def nbytes(self):
+        """Approximate memory held by the columns and string tables."""
+        columns = (
+            len(self.barcodes)
+            + self.prices.itemsize * len(self.prices)
+            + self.name_codes.itemsize * len(self.name_codes)
+            + self.category_codes.itemsize * len(self.category_codes)
+            + self.supplier_codes.itemsize * len(self.supplier_codes)
+        )
+        strings = sum(
+            sys.getsizeof(value)
+            for table in (self.names, self.categories, self.suppliers)
+            for value in table.values
+        )
+        return columns + strings + sum(sys.getsizeof(v) for v in self._overflow.values())
+
+
+class ColumnView:
+    """
+    Read-only window over rows [start, stop) of a RecordColumns.
+
+    Columns are exposed as memoryviews sharing the parent's buffers, so
+    creating a view copies nothing. The parent can't grow while a view is
+    alive; call release() (or use it as a context manager) when done.
+    """
+
+    def __init__(self, columns, start, stop):
+        self._columns = columns
+        self.start = start
+        self.stop = max(start, stop)
+        width = columns.barcode_width
+        self.barcodes = memoryview(columns.barcodes)[start * width : self.stop * width]
+        self.prices = memoryview(columns.prices)[start : self.stop]
+        self.name_codes = memoryview(columns.name_codes)[start : self.stop]
+        self.category_codes = memoryview(columns.category_codes)[start : self.stop]
+        self.supplier_codes = memoryview(columns.supplier_codes)[start : self.stop]
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+    def release(self):
+        for buf in (self.barcodes, self.prices, self.name_codes, self.category_codes, self.supplier_codes):
+            buf.release()
+
+    def iter_rows(self):
+        """Yield (barcode, name, price, category, supplier) tuples."""
+        columns = self._columns
+        width = columns.barcode_width
+        overflow = columns._overflow
+        names = columns.names.values
+        categories = columns.categories.values
+        suppliers = columns.suppliers.values
+        barcodes = self.barcodes
+        for i in range(len(self)):
+            row = self.start + i
+            if row in overflow:
+                barcode = overflow[row]
+            else:
+                barcode = bytes(barcodes[i * width : (i + 1) * width]).rstrip(_PAD).decode("ascii")
+            yield (
+                barcode,
+                names[self.name_codes[i]],
+                self.prices[i],
+                categories[self.category_codes[i]],
+                suppliers[self.supplier_codes[i]],
+            )
+
+    def __iter__(self):
+        return (
+            {"barcode": b, "name": n, "price": p, "category": c, "supplier": s}
+            for b, n, p, c, s in self.iter_rows()
+        )
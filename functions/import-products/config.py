@@ -4,27 +4,55 @@ Configuration for the product import job.
 Reads settings from environment variables and Firestore config document.
 """
 
+import json
 import os
 import logging
-
-from google.cloud import firestore
+from datetime import datetime, timezone
 
 logger = logging.getLogger(__name__)
 
 # Firestore config document path
 CONFIG_DOC = "config/importSettings"
 
+# Environment variable carrying the settings (JSON) to local map subprocesses,
+# which then run without a Firestore client
+SETTINGS_ENV = "IMPORT_SETTINGS"
+
+# Number of past runs kept in the config document's runHistory
+RUN_HISTORY_LENGTH = 12
+
 # Defaults (used when Firestore config doc doesn't exist yet)
 DEFAULTS = {
     "enabled": True,
     "minPrice": 3.0,
     "minSuppliers": 2,  # only include products on at least 2 chains
     "allowedCategories": [],  # empty = allow all
+    "allStores": False,  # download every store's PriceFull file, not one per chain
+    "priceRangePercentiles": [],  # e.g. [10, 90] for a p10–p90 priceRange (empty = min–max)
+    "downloadWorkers": 4,  # chains downloaded concurrently (1 = sequential)
+    "downloadCache": False,  # skip unchanged downloads/conversions (set IMPORT_CACHE_DIR to a mounted volume)
+    "parserEngine": "csv",  # "csv" (il-supermarket-parser) or "xml" (streaming)
+    "parseWorkers": 1,  # processes used to parse/pre-aggregate files (1 = in-process)
+    "skipUnchanged": True,  # don't rewrite products whose content is unchanged
+    "writeConcurrency": 8,  # Firestore batch commits in flight at once
+    "deterministicIds": False,  # barcode-derived doc IDs (run --migrate-ids first; archives server-side)
+    "serverSideArchive": False,  # query only stale candidates (deploy firestore.indexes.json first)
+    "checkpoints": False,  # save stage outputs so a retried run can resume (set IMPORT_CHECKPOINT_DIR to a mounted volume)
+    "streamChains": False,  # download → parse → aggregate → delete one chain at a time
+    "diskBudgetMb": 0,  # scratch space allowed at once when streaming (0 = unlimited)
+    "dedupMemoryMb": 0,  # aggregate table budget before spilling to disk (0 = unlimited)
+    "shardWaitTimeoutS": 3600,  # how long task 0 waits for the other tasks' partials
+    "deltaSnapshots": False,  # keep per-store prices for --delta refreshes (needs a persistent volume)
+    "pushDownFilters": False,  # apply minPrice/weight/allowedCategories per row while reading
+    "normalizeBarcodes": False,  # match ItemCodes by canonical GTIN (0-padded/stripped forms merge)
+    "priceHistory": False,  # record weekly min/max/median per product (needs a persistent volume)
 }
 
 
 def get_firestore_client():
     """Return a Firestore client using default credentials."""
+    from google.cloud import firestore
+
     project = os.environ.get("GOOGLE_CLOUD_PROJECT")
     return firestore.Client(project=project)
 
@@ -48,15 +76,57 @@ def load_import_settings(db):
     return dict(DEFAULTS)
 
 
-def update_run_status(db, status, product_count=0):
-    """Write run status back to the config document."""
+def settings_to_env(settings):
+    """JSON of the known settings (DEFAULTS keys) for SETTINGS_ENV."""
+    return json.dumps({key: value for key, value in settings.items() if key in DEFAULTS})
+
+
+def settings_from_env():
+    """Settings handed down through SETTINGS_ENV, or None if it isn't set."""
+    raw = os.environ.get(SETTINGS_ENV)
+    return json.loads(raw) if raw else None
+
+
+def update_run_status(db, status, product_count=0, metrics=None):
+    """
+    Write run status back to the config document.
+
+    When `metrics` (MetricsCollector.summary()) is given it is stored as
+    lastRunMetrics, and a compact entry is appended to runHistory, which
+    keeps the last RUN_HISTORY_LENGTH runs.
+    """
     from google.cloud.firestore import SERVER_TIMESTAMP
 
-    db.document(CONFIG_DOC).set(
-        {
-            "lastRunAt": SERVER_TIMESTAMP,
-            "lastRunStatus": status,
-            "lastRunProductCount": product_count,
-        },
-        merge=True,
-    )
+    doc_ref = db.document(CONFIG_DOC)
+    update = {
+        "lastRunAt": SERVER_TIMESTAMP,
+        "lastRunStatus": status,
+        "lastRunProductCount": product_count,
+    }
+
+    if metrics is not None:
+        update["lastRunMetrics"] = metrics
+
+        snapshot = doc_ref.get()
+        history = []
+        if snapshot.exists:
+            history = list((snapshot.to_dict() or {}).get("runHistory") or [])
+        history.append(_history_entry(status, product_count, metrics))
+        update["runHistory"] = history[-RUN_HISTORY_LENGTH:]
+
+    doc_ref.set(update, merge=True)
+
+
+def _history_entry(status, product_count, metrics):
+    """One runHistory item: totals plus wall time per stage."""
+    # SERVER_TIMESTAMP is not allowed inside arrays, so use the client clock
+    entry = {
+        "runAt": datetime.now(timezone.utc),
+        "status": status,
+        "productCount": product_count,
+        "totalWallS": metrics.get("totalWallS"),
+        "stageWallS": {name: stage.get("wallS") for name, stage in metrics.get("stages", {}).items()},
+    }
+    if "peakRssMb" in metrics:
+        entry["peakRssMb"] = metrics["peakRssMb"]
+    return entry
@@ -0,0 +1,270 @@
+"""
+Vectorized (NumPy) implementation of parser.deduplicate_products.
+
+Works on a columnar.RecordColumns instead of per-record dicts:
+- barcodes are encoded to dense group codes by sorting their fixed-width
+  slots as 64-bit words, and rows are sorted by group, so min/max price
+  are np.minimum/np.maximum.reduceat over the group boundaries
+- distinct suppliers per barcode are counted from the unique
+  (barcode, supplier) code pairs
+- the name and category votes count unique (barcode, value) pairs; ties go
+  to the value seen first, as Counter.most_common does in the Python path.
+  Names are voted by canonical key first, then by spelling within the
+  winning key (see names.vote_name)
+- names are cleaned once per distinct name, in one batch
+  (names.NameCleaner.normalize_many)
+- the price, weight and supplier-count filters are boolean masks
+- output fields are built as whole columns; the only per-product Python
+  work left is assembling each product dict
+- priceRange quantiles (price_quantiles) are read off rows sorted by
+  (barcode, price); they are exact, where the Python engine's price
+  sketch is exact up to 2 * aggregate.PRICE_SKETCH_SIZE distinct prices
+
+Unique pairs are found with a plain (quicksort) argsort and run
+boundaries rather than np.unique, whose stable and hash-based paths are
+several times slower on a million int64 keys.
+
+The result (contents, key order and filter counts) is the same as
+deduplicate_products. NumPy is only imported when this engine is used.
+"""
+
+import logging
+
+from columnar import RecordColumns
+from names import NameCleaner
+
+logger = logging.getLogger(__name__)
+
+WEIGHT_MARKER = "במשקל"
+
+
+def _barcode_groups(np, columns):
+    """
+    Dense group code per row, numbered in order of each barcode's first row.
+
+    Returns:
+        (codes, barcodes) where barcodes[g] is the barcode string of group g
+    """
+    width = columns.barcode_width
+    raw = np.frombuffer(bytes(columns.barcodes), dtype=f"S{width}")
+    if width % 8 == 0:
+        # Sorting the fixed-width slots as unsigned words is much faster
+        # than comparing them as byte strings
+        words = raw.view(">u8").reshape(len(raw), width // 8)
+        order = np.lexsort(words.T[::-1])
+        sorted_words = words[order]
+        new_group = np.r_[True, (sorted_words[1:] != sorted_words[:-1]).any(axis=1)]
+        starts = np.flatnonzero(new_group)
+        first_rows = np.minimum.reduceat(order, starts)
+        inverse = np.empty(len(raw), dtype=np.int64)
+        inverse[order] = np.cumsum(new_group) - 1
+    else:
+        _, first_rows, inverse = np.unique(raw, return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+
+    if columns._overflow:
+        # Overflow barcodes share the empty fixed-width slot; give each its own code
+        extra = {}
+        inverse = inverse.copy()
+        for row, barcode in sorted(columns._overflow.items()):
+            inverse[row] = extra.setdefault(barcode, len(first_rows) + len(extra))
+        # Re-densify (the empty slot may now be unused) and find first rows again
+        _, first_rows, inverse = np.unique(inverse, return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+
+    # Renumber groups by first occurrence so output order matches a dict fill
+    order = np.argsort(first_rows, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    codes = rank[inverse]
+    group_rows = first_rows[order]
+    barcodes = [b.decode("ascii") for b in raw[group_rows].tolist()]
+    for group, row in enumerate(group_rows.tolist()):
+        if row in columns._overflow:
+            barcodes[group] = columns._overflow[row]
+    return codes, barcodes
+
+
+def _sorted_runs(np, keys):
+    """
+    Sort `keys` and find its runs of equal values.
+
+    Returns:
+        (order, sorted_keys, starts): the sort order, the sorted keys and
+        the index in them where each run starts
+    """
+    order = np.argsort(keys)
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[len(keys) > 0, sorted_keys[1:] != sorted_keys[:-1]])
+    return order, sorted_keys, starts
+
+
+def _format_prices(np, prices):
+    """f"{price:.0f}" of each price, formatting each distinct price once."""
+    order, sorted_prices, starts = _sorted_runs(np, prices)
+    text = [f"{price:.0f}" for price in sorted_prices[starts].tolist()]
+    inverse = np.empty(len(prices), dtype=np.int64)
+    inverse[order] = np.cumsum(np.r_[len(prices) > 0, sorted_prices[1:] != sorted_prices[:-1]]) - 1
+    return [text[i] for i in inverse.tolist()]
+
+
+def _vote(np, group_codes, value_codes, group_count, valid=None):
+    """
+    Most common value per group, ties to the value whose first row is earliest.
+
+    Returns:
+        array of value codes per group (-1 where a group has no valid rows)
+    """
+    rows = np.arange(len(group_codes))
+    if valid is not None:
+        group_codes = group_codes[valid]
+        value_codes = value_codes[valid]
+        rows = rows[valid]
+
+    winners = np.full(group_count, -1, dtype=np.int64)
+    if len(group_codes) == 0:
+        return winners
+
+    width = int(value_codes.max()) + 1
+    order, sorted_pairs, starts = _sorted_runs(np, group_codes.astype(np.int64) * width + value_codes)
+    counts = np.diff(np.r_[starts, len(sorted_pairs)])
+    first_rows = np.minimum.reduceat(rows[order], starts)
+    pair_groups = sorted_pairs[starts] // width
+    pair_values = sorted_pairs[starts] % width
+
+    # Sort by group, then count descending, then first row ascending
+    order = np.lexsort((first_rows, -counts, pair_groups))
+    sorted_groups = pair_groups[order]
+    best = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    winners[sorted_groups[best]] = pair_values[order][best]
+    return winners
+
+
+def _group_quantiles(np, sorted_codes, sorted_prices, starts, q):
+    """
+    Nearest-rank quantile q of each group's prices (as
+    aggregate.price_quantile computes it), given rows sorted by
+    (group, price).
+    """
+    sizes = np.diff(np.r_[starts, len(sorted_codes)])
+    ranks = np.maximum(1, np.ceil(np.round(q * sizes, 9)).astype(np.int64))
+    return sorted_prices[starts + ranks - 1]
+
+
+def deduplicate_columns(columns, min_price=0.0, min_suppliers=2, chain_names=None, price_quantiles=None):
+    """
+    Vectorized deduplicate_products over a RecordColumns (or record iterable).
+
+    Args and return value are the same as parser.deduplicate_products.
+    """
+    import numpy as np
+
+    if not isinstance(columns, RecordColumns):
+        columns = RecordColumns().extend(columns)
+    name_cleaner = NameCleaner(chain_names or [])
+
+    record_count = len(columns)
+    products = {}
+    filtered_out = {"price": 0, "weight": 0, "suppliers": 0}
+
+    if record_count:
+        codes, barcodes = _barcode_groups(np, columns)
+        group_count = len(barcodes)
+
+        # Min/max price per group over rows sorted by group
+        order, sorted_codes, starts = _sorted_runs(np, codes)
+        prices = np.frombuffer(columns.prices, dtype=np.float64)[order]
+        min_p = np.minimum.reduceat(prices, starts)
+        max_p = np.maximum.reduceat(prices, starts)
+        low_p, high_p = min_p, max_p
+        if price_quantiles is not None:
+            # Exact per-group quantiles from rows sorted by (group, price)
+            by_price = np.lexsort((prices, sorted_codes))
+            low_p, high_p = (
+                _group_quantiles(np, sorted_codes, prices[by_price], starts, q) for q in price_quantiles
+            )
+
+        # Distinct non-empty suppliers per group
+        supplier_codes = np.frombuffer(columns.supplier_codes, dtype=np.uint16).astype(np.int64)
+        supplier_names = columns.suppliers.values
+        has_supplier = np.array([bool(s) for s in supplier_names])[supplier_codes]
+        _, pairs, pair_starts = _sorted_runs(
+            np, codes[has_supplier] * len(supplier_names) + supplier_codes[has_supplier]
+        )
+        pairs = pairs[pair_starts]
+        pair_groups = pairs // len(supplier_names)
+        supplier_counts = np.bincount(pair_groups, minlength=group_count)
+
+        # Name vote over canonical keys, then the most common cleaned
+        # spelling of the winning key (each distinct raw name normalized once)
+        cleaned_table = {}
+        key_table = {}
+        cleaned_of_name = []
+        key_of_name = []
+        for display, key in name_cleaner.normalize_many(columns.names.values):
+            cleaned_of_name.append(cleaned_table.setdefault(display, len(cleaned_table)))
+            key_of_name.append(key_table.setdefault(key, len(key_table)))
+        cleaned_names = list(cleaned_table)
+        name_codes = np.frombuffer(columns.name_codes, dtype=np.uint32).astype(np.int64)
+        row_keys = np.array(key_of_name, dtype=np.int64)[name_codes]
+        best_key = _vote(np, codes, row_keys, group_count)
+        row_names = np.array(cleaned_of_name, dtype=np.int64)[name_codes]
+        best_name = _vote(np, codes, row_names, group_count, valid=row_keys == best_key[codes])
+
+        # Filters, applied in the same order as the Python path
+        price_fail = max_p < min_price
+        is_weight = np.array([WEIGHT_MARKER in name for name in cleaned_names])[best_name]
+        weight_fail = ~price_fail & is_weight
+        supplier_fail = ~price_fail & ~weight_fail & (supplier_counts < min_suppliers)
+        keep = ~(price_fail | weight_fail | supplier_fail)
+        filtered_out["price"] = int(price_fail.sum())
+        filtered_out["weight"] = int(weight_fail.sum())
+        filtered_out["suppliers"] = int(supplier_fail.sum())
+
+        # Category vote over non-empty categories
+        category_codes = np.frombuffer(columns.category_codes, dtype=np.uint32).astype(np.int64)
+        category_names = columns.categories.values
+        has_category = np.array([bool(c) for c in category_names])[category_codes]
+        best_category = _vote(np, codes, category_codes, group_count, valid=has_category)
+
+        # Supplier names per group, for the kept groups only. Pairs are
+        # re-coded by supplier name order, so each group's slice is sorted
+        name_rank = np.argsort(np.array(supplier_names, dtype=object))
+        rank_of_code = np.empty_like(name_rank)
+        rank_of_code[name_rank] = np.arange(len(name_rank))
+        ranked = np.sort(pair_groups * len(supplier_names) + rank_of_code[pairs % len(supplier_names)])
+        ranked_names = [supplier_names[s] for s in name_rank.tolist()]
+        pair_names = [ranked_names[s] for s in (ranked % len(supplier_names)).tolist()]
+        bounds = np.searchsorted(pair_groups, np.arange(group_count + 1)).tolist()
+
+        kept = np.flatnonzero(keep)
+        low_text = _format_prices(np, low_p[kept])
+        high_text = _format_prices(np, high_p[kept])
+        price_ranges = [
+            f"₪{low}" if same else f"₪{low}–{high}"
+            for low, high, same in zip(low_text, high_text, (low_p[kept] == high_p[kept]).tolist())
+        ]
+        display_names = [cleaned_names[n] for n in best_name[kept].tolist()]
+        category_names = category_names + [""]  # code -1: no category
+        categories = [category_names[c] for c in best_category[kept].tolist()]
+        for group, name, price_range, category in zip(kept.tolist(), display_names, price_ranges, categories):
+            products[barcodes[group]] = {
+                "name": name,
+                "priceRange": price_range,
+                "category": category,
+                "suppliers": pair_names[bounds[group] : bounds[group + 1]],
+            }
+
+    logger.info(
+        "Deduplicated %s records into %d unique products "
+        "(min_price=%.1f, min_suppliers=%d, numpy engine). "
+        "Filtered out: %d by price, %d by weight, %d by supplier count",
+        record_count,
+        len(products),
+        min_price,
+        min_suppliers,
+        filtered_out["price"],
+        filtered_out["weight"],
+        filtered_out["suppliers"],
+    )
+    return products
@@ -0,0 +1,288 @@
+"""
+Incremental price refresh from delta Price files.
+
+Chains publish a PriceFull file per store about once a week and much
+smaller Price files with the items that changed since. PriceSnapshot keeps
+the latest known state of every store locally:
+
+    SNAPSHOT_FOLDER/<chain folder>/<chain code>-<store>.snap.gz
+    SNAPSHOT_FOLDER/manifest.json      store → timestamp of the newest file applied,
+                                       and whether the build covered every store
+
+Each store file holds its rows as a columnar.RecordColumns (gzip pickle).
+A full run rebuilds the snapshot from its PriceFull files (build());
+a delta run downloads only Price files and applies the ones newer than
+each store's timestamp on top (apply_deltas()), replacing the rows of
+the items they list. iter_records() then yields the updated rows of
+every store in the same record shape as parser.iter_raw_xml, so the
+usual aggregate → dedup → sync stages run unchanged.
+
+Price files only list changed items, so a delta for a store with no full
+snapshot is skipped rather than treated as that store's catalog. Chains
+publish Price files for every store, so deltas only pay off on top of a
+snapshot built from every store's PriceFull file (the allStores setting);
+covers_all_stores() tells whether it was, and apply_deltas() reports the
+bytes of the files it couldn't use.
+
+SNAPSHOT_FOLDER (IMPORT_SNAPSHOT_DIR) must survive between runs (a mounted
+volume on Cloud Run).
+"""
+
+import gzip
+import json
+import logging
+import os
+import pickle
+import shutil
+from pathlib import Path
+
+from columnar import RecordColumns
+from download_cache import parse_file_name
+from parser import rows_to_records, supplier_for
+from price_xml import is_price_file, iter_price_rows
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FOLDER = os.environ.get("IMPORT_SNAPSHOT_DIR", "/tmp/supermarket_snapshot")
+
+MANIFEST_NAME = "manifest.json"
+STORE_SUFFIX = ".snap.gz"
+
+
+def classify_price_file(path, root):
+    """
+    (store key, timestamp, is_full) of a raw price file under `root`, or
+    None if its name doesn't follow the PriceFull/Price convention.
+
+    The store key is "<chain folder>/<chain code>-<store>".
+    """
+    path = Path(path)
+    parsed = parse_file_name(path.name)
+    if parsed is None:
+        return None
+    chain_code, store_id, stamp = parsed
+    chain_folder = path.relative_to(root).parts[0]
+    is_full = path.name.lower().startswith("pricefull")
+    return f"{chain_folder}/{chain_code}-{store_id}", stamp, is_full
+
+
+def _price_files(data_folder):
+    """Classified price files under data_folder, oldest first."""
+    root = Path(data_folder)
+    files = []
+    for path in sorted(p for p in root.rglob("*") if p.is_file() and is_price_file(p)):
+        info = classify_price_file(path, root)
+        if info is None:
+            logger.warning("Unrecognized price file name %s — skipping", path.name)
+            continue
+        files.append((info[1], info[0], info[2], path))
+    files.sort(key=lambda entry: entry[0])
+    return files
+
+
+def _file_size(path):
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
+
+
+def _file_rows(path):
+    """barcode → (name, price, category) of a raw price file (valid rows only)."""
+    return {
+        record["barcode"]: (record["name"], record["price"], record["category"])
+        for record in rows_to_records(iter_price_rows(path), "")
+    }
+
+
+class PriceSnapshot:
+    """Per-store latest prices, kept on disk between runs."""
+
+    def __init__(self, folder=None):
+        self.folder = Path(folder or SNAPSHOT_FOLDER)
+        self.all_stores = False
+        self.stores = self._load_manifest()
+
+    @property
+    def manifest_path(self):
+        return self.folder / MANIFEST_NAME
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            self.all_stores = bool(manifest.get("allStores", False))
+            return manifest.get("stores", {})
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError):
+            logger.warning("Unreadable snapshot manifest at %s — ignoring it", self.manifest_path)
+            return {}
+
+    def _save_manifest(self):
+        self.folder.mkdir(parents=True, exist_ok=True)
+        tmp = self.manifest_path.with_name(MANIFEST_NAME + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"stores": self.stores, "allStores": self.all_stores}, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.manifest_path)
+
+    def exists(self):
+        return bool(self.stores)
+
+    def covers_all_stores(self):
+        """True if the last build() was from every store's PriceFull file."""
+        return self.all_stores
+
+    def _store_path(self, key):
+        return self.folder / (key + STORE_SUFFIX)
+
+    def _load_store(self, key):
+        with gzip.open(self._store_path(key), "rb") as f:
+            columns = pickle.load(f)
+        return {barcode: (name, price, category) for barcode, name, price, category, _ in columns.iter_rows()}
+
+    def _save_store(self, key, rows):
+        columns = RecordColumns()
+        for barcode, (name, price, category) in rows.items():
+            columns.append(barcode, name, price, category)
+        path = self._store_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with gzip.open(tmp, "wb", compresslevel=1) as f:
+            pickle.dump(columns, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def build(self, data_folder, all_stores=False):
+        """
+        Rebuild the snapshot from the PriceFull files under data_folder
+        (the newest one per store).
+
+        Stores of the chains found in data_folder are replaced; chains
+        missing from it (e.g. a failed download) keep their previous stores.
+
+        Args:
+            data_folder: folder with the downloaded PriceFull files
+            all_stores: whether every store's PriceFull file was downloaded
+                (rather than one per chain); recorded in the manifest
+
+        Returns:
+            dict with counts: {"stores": int, "rows": int}
+        """
+        latest = {}
+        for stamp, key, is_full, path in _price_files(data_folder):
+            if is_full:
+                latest[key] = (stamp, path)
+
+        chains = {key.split("/", 1)[0] for key in latest}
+        for chain in chains:
+            shutil.rmtree(self.folder / chain, ignore_errors=True)
+        self.stores = {key: stamp for key, stamp in self.stores.items() if key.split("/", 1)[0] not in chains}
+        built = rows = 0
+        for key, (stamp, path) in sorted(latest.items()):
+            try:
+                store_rows = _file_rows(path)
+            except Exception:
+                logger.exception("Failed to read %s — store left out of the snapshot", path)
+                continue
+            self._save_store(key, store_rows)
+            self.stores[key] = stamp
+            built += 1
+            rows += len(store_rows)
+        self.all_stores = all_stores
+        self._save_manifest()
+
+        logger.info("Built price snapshot of %d stores (%d rows)", built, rows)
+        return {"stores": built, "rows": rows}
+
+    def apply_deltas(self, data_folder):
+        """
+        Apply the Price files under data_folder that are newer than each
+        store's snapshot, oldest first. A newer PriceFull file replaces the
+        store's rows outright.
+
+        Returns:
+            dict with counts: {"files", "applied", "skipped", "unknownStores",
+            "rowsChanged", "wastedBytes"}; wastedBytes is the size of the
+            files downloaded for nothing (already applied or unknown stores)
+        """
+        stats = {"files": 0, "applied": 0, "skipped": 0, "unknownStores": 0, "rowsChanged": 0, "wastedBytes": 0}
+        by_store = {}
+        for stamp, key, is_full, path in _price_files(data_folder):
+            stats["files"] += 1
+            by_store.setdefault(key, []).append((stamp, is_full, path))
+
+        for key, files in sorted(by_store.items()):
+            if key not in self.stores and not any(is_full for _, is_full, _ in files):
+                stats["unknownStores"] += len(files)
+                stats["wastedBytes"] += sum(_file_size(path) for _, _, path in files)
+                continue
+
+            rows = self._load_store(key) if key in self.stores else {}
+            applied_stamp = self.stores.get(key, "")
+            changed = False
+            for stamp, is_full, path in files:
+                if stamp <= applied_stamp:
+                    stats["skipped"] += 1
+                    stats["wastedBytes"] += _file_size(path)
+                    continue
+                try:
+                    file_rows = _file_rows(path)
+                except Exception:
+                    logger.exception("Failed to read %s — skipping", path)
+                    continue
+                if is_full:
+                    rows = file_rows
+                else:
+                    rows.update(file_rows)
+                stats["rowsChanged"] += len(file_rows)
+                stats["applied"] += 1
+                applied_stamp = stamp
+                changed = True
+
+            if changed:
+                self._save_store(key, rows)
+                self.stores[key] = applied_stamp
+                # Keep the manifest in step with the store files
+                self._save_manifest()
+
+        logger.info(
+            "Applied %d/%d price files to the snapshot (%d already applied, %d for unknown stores, "
+            "%.1f MB unused), %d rows changed",
+            stats["applied"],
+            stats["files"],
+            stats["skipped"],
+            stats["unknownStores"],
+            stats["wastedBytes"] / (1024 * 1024),
+            stats["rowsChanged"],
+        )
+        return stats
+
+    def iter_records(self, chain_names_map=None, row_filter=None):
+        """
+        Yield the snapshot's rows as product records (barcode, name, price,
+        category, supplier), store by store.
+
+        Args:
+            chain_names_map: dict mapping chain folder to chain name (for tracking)
+            row_filter: optional filters.RowFilter
+        """
+        chain_names_map = chain_names_map or {}
+        for key in sorted(self.stores):
+            path = self._store_path(key)
+            supplier = supplier_for(path, self.folder, chain_names_map)
+            try:
+                with gzip.open(path, "rb") as f:
+                    columns = pickle.load(f)
+            except Exception:
+                logger.exception("Failed to read snapshot store %s — skipping", key)
+                continue
+            for barcode, name, price, category, _ in columns.iter_rows():
+                record = {
+                    "barcode": barcode,
+                    "name": name,
+                    "price": price,
+                    "category": category,
+                    "supplier": supplier,
+                }
+                if row_filter is None or row_filter.accept(record):
+                    yield record
@@ -0,0 +1,99 @@
+"""
+Disk budget for the per-chain streaming pipeline.
+
+On Cloud Run, /tmp is memory-backed, so every downloaded XML and converted
+CSV counts against the container's memory. DiskBudget tracks the bytes the
+pipeline's scratch folders hold, records the high-water mark and admits a
+chain only when its expected footprint fits in what is left of the budget.
+
+A chain's footprint is estimated as the largest one measured so far in the
+run; until the first chain has been measured, chains are admitted one at a
+time. A chain is always admitted when nothing else is in flight, so a
+single chain larger than the budget still runs (with a warning).
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+
+from metrics import folder_size
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+class DiskBudget:
+    """
+    Args:
+        budget_mb: bytes allowed on disk at once, in MB (0 = unlimited)
+        folders: scratch folders whose size is tracked
+    """
+
+    def __init__(self, budget_mb, folders):
+        self.budget_bytes = int(budget_mb * MB)
+        self.folders = list(folders)
+        self._cond = threading.Condition()
+        self._reserved = {}  # chain → bytes reserved while in flight
+        self._largest = None
+        self._warned = False
+        self.high_water_bytes = 0
+        self.chain_peaks = {}  # chain → largest measured footprint (bytes)
+        self.waits = 0
+
+    @contextmanager
+    def admit(self, chain):
+        """Hold a slot for `chain` until the block exits (and its files are gone)."""
+        with self._cond:
+            while not self._fits():
+                self.waits += 1
+                self._cond.wait()
+            self._reserved[chain] = self._largest or 0
+        try:
+            yield
+        finally:
+            with self._cond:
+                del self._reserved[chain]
+                self._cond.notify_all()
+
+    def _fits(self):
+        if not self._reserved or not self.budget_bytes:
+            return True
+        if self._largest is None:
+            return False
+        return sum(self._reserved.values()) + self._largest <= self.budget_bytes
+
+    def record(self, chain, *paths):
+        """
+        Measure `chain`'s files (its scratch paths) and the tracked folders,
+        updating the chain's estimate and the high-water mark.
+        """
+        footprint = sum(folder_size(path) for path in paths)
+        total = sum(folder_size(folder) for folder in self.folders)
+        with self._cond:
+            self.chain_peaks[chain] = max(self.chain_peaks.get(chain, 0), footprint)
+            if self._largest is None or footprint > self._largest:
+                self._largest = footprint
+            if chain in self._reserved:
+                self._reserved[chain] = max(self._reserved[chain], footprint)
+            self.high_water_bytes = max(self.high_water_bytes, total)
+            over = self.budget_bytes and total > self.budget_bytes and not self._warned
+            if over:
+                self._warned = True
+            self._cond.notify_all()
+        if over:
+            logger.warning(
+                "Scratch files use %.0f MB, above the %.0f MB disk budget (%s alone: %.0f MB)",
+                total / MB,
+                self.budget_bytes / MB,
+                chain,
+                footprint / MB,
+            )
+
+    def stats(self):
+        return {
+            "budgetMb": round(self.budget_bytes / MB, 1),
+            "highWaterMb": round(self.high_water_bytes / MB, 1),
+            "chainPeakMb": {chain: round(size / MB, 1) for chain, size in sorted(self.chain_peaks.items())},
+            "waits": self.waits,
+        }
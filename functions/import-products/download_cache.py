@@ -0,0 +1,323 @@
+"""
+Persistent, content-addressed cache for downloaded price files.
+
+Converted (CSV) output is stored per chain under a directory named after
+the SHA-256 of the chain's raw files. A JSON manifest maps every raw file,
+keyed by chain, store and file timestamp, to its content hash and to the
+cached output directory. When a chain publishes nothing new, the next run
+finds every file in the manifest and skips the ConvertingTask step for it.
+
+Raw downloads are kept too, per chain under dumps/<chain id>.
+il-supermarket-scraper doesn't fetch files already present in its dump
+folder, so a chain whose latest file was downloaded before is not
+downloaded again; finish_download() then drops superseded files.
+
+Entries are evicted by age (not used for MAX_AGE_DAYS) and then, once
+more than MAX_OUTPUT_DIRS output directories are referenced, whole output
+directories least-recently-used first: a chain's files are only a hit
+together, so evicting some of them (an allStores chain has hundreds)
+would make every lookup miss. Several tasks can share one cache folder:
+save() merges the manifest on disk under a file lock, and only the output
+of entries evicted from the merged manifest is deleted.
+
+The cache only pays off if CACHE_FOLDER (IMPORT_CACHE_DIR) survives
+between runs — a mounted volume on Cloud Run, not the default /tmp.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+CACHE_FOLDER = os.environ.get("IMPORT_CACHE_DIR", "/tmp/supermarket_cache")
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = ".lock"
+MANIFEST_VERSION = 1
+
+MAX_AGE_DAYS = 14
+# Converted outputs kept (each covers one chain's files, however many)
+MAX_OUTPUT_DIRS = 100
+
+# PriceFull7290027600007-001-202410200200.gz → chain code, store, timestamp
+_FILE_NAME_RE = re.compile(r"(?i)price(?:full)?(\d+)-(\d+)-(\d{12})")
+
+
+def parse_file_name(file_name):
+    """
+    Extract (chain_code, store_id, timestamp) from a price file name.
+
+    Returns None for names that don't follow the standard convention.
+    """
+    match = _FILE_NAME_RE.search(file_name)
+    if not match:
+        return None
+    return match.group(1), match.group(2), match.group(3)
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Hash a file in chunks without loading it into memory."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DownloadCache:
+    """
+    Manifest-backed cache of converted chain output.
+
+    Usage:
+        cache = DownloadCache(CACHE_FOLDER)
+        files = cache.describe(chain, raw_files)
+        output_dir = cache.lookup(chain, files)
+        if output_dir is None:
+            output_dir = cache.output_dir_for(chain, files)
+            ...convert raw_files into output_dir...
+            cache.store(chain, files, output_dir)
+        cache.save()
+    """
+
+    def __init__(self, root=CACHE_FOLDER, max_age_days=MAX_AGE_DAYS, max_output_dirs=MAX_OUTPUT_DIRS):
+        self.root = Path(root)
+        self.max_age_days = max_age_days
+        self.max_output_dirs = max_output_dirs
+        self.stats = {}  # chain → {"hits": int, "misses": int}
+        self.download_stats = {}  # chain id → {"downloaded": int, "skipped": int}
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.entries = self._load_manifest()
+
+    @property
+    def manifest_path(self):
+        return self.root / MANIFEST_NAME
+
+    def _load_manifest(self):
+        if not self.manifest_path.exists():
+            return {}
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            logger.exception("Unreadable cache manifest at %s — starting empty", self.manifest_path)
+            return {}
+        if manifest.get("version") != MANIFEST_VERSION:
+            logger.warning("Cache manifest version mismatch — starting empty")
+            return {}
+        return manifest.get("entries", {})
+
+    @contextmanager
+    def _locked(self):
+        """Hold an exclusive lock on the cache folder (no-op without fcntl)."""
+        try:
+            import fcntl
+        except ImportError:
+            yield
+            return
+        with open(self.root / LOCK_NAME, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def save(self):
+        """
+        Merge in entries other tasks saved meanwhile, evict expired entries
+        and atomically rewrite the manifest.
+        """
+        with self._locked():
+            for key, entry in self._load_manifest().items():
+                mine = self.entries.get(key)
+                if mine is None or mine["lastUsedAt"] < entry["lastUsedAt"]:
+                    self.entries[key] = entry
+            self.evict()
+            tmp_path = self.manifest_path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": MANIFEST_VERSION, "entries": self.entries}, f, indent=1)
+            os.replace(tmp_path, self.manifest_path)
+
+    def describe(self, chain, raw_files):
+        """
+        Build cache keys for a chain's raw files.
+
+        Returns a list of (key, sha256) tuples sorted by key. The key is
+        "chain/store/timestamp" when the file name follows the standard
+        convention, otherwise "chain/<file name>".
+        """
+        described = []
+        for path in raw_files:
+            path = Path(path)
+            parsed = parse_file_name(path.name)
+            if parsed:
+                _, store_id, timestamp = parsed
+                key = f"{chain}/{store_id}/{timestamp}"
+            else:
+                key = f"{chain}/{path.name}"
+            described.append((key, file_sha256(path)))
+        return sorted(described)
+
+    def output_dir_for(self, chain, files):
+        """Content-addressed output directory for a set of described files."""
+        digest = hashlib.sha256(
+            "\n".join(f"{key}:{sha}" for key, sha in files).encode("utf-8")
+        ).hexdigest()
+        return self.root / "parsed" / chain / digest[:16]
+
+    def lookup(self, chain, files):
+        """
+        Return the cached output directory when every file is a hit, else None.
+
+        Hits and misses are counted per file in self.stats[chain].
+        """
+        stats = self.stats.setdefault(chain, {"hits": 0, "misses": 0})
+        output_dirs = set()
+        hits = 0
+        for key, sha in files:
+            entry = self.entries.get(key)
+            if entry and entry["sha256"] == sha and Path(entry["outputDir"]).is_dir():
+                hits += 1
+                output_dirs.add(entry["outputDir"])
+
+        stats["hits"] += hits
+        stats["misses"] += len(files) - hits
+
+        if not files or hits < len(files) or len(output_dirs) != 1:
+            return None
+
+        now = time.time()
+        for key, _ in files:
+            self.entries[key]["lastUsedAt"] = now
+        return Path(output_dirs.pop())
+
+    def store(self, chain, files, output_dir):
+        """Record that `files` were converted into `output_dir`."""
+        now = time.time()
+        for key, sha in files:
+            self.entries[key] = {
+                "chain": chain,
+                "sha256": sha,
+                "outputDir": str(output_dir),
+                "createdAt": now,
+                "lastUsedAt": now,
+            }
+
+    def evict(self, now=None):
+        """
+        Drop entries unused for max_age_days, then the entries of the least
+        recently used output directories beyond max_output_dirs, and the
+        dumps of chains not downloaded for max_age_days.
+
+        Only the output directories of evicted entries are deleted, and
+        only when no kept entry still references them: directories this
+        manifest doesn't know about may be another task's live output.
+
+        Returns the number of evicted entries.
+        """
+        if now is None:
+            now = time.time()
+        cutoff = now - self.max_age_days * 86400
+
+        before = len(self.entries)
+        kept = {k: e for k, e in self.entries.items() if e["lastUsedAt"] >= cutoff}
+        last_used = {}
+        for entry in kept.values():
+            output_dir = entry["outputDir"]
+            last_used[output_dir] = max(last_used.get(output_dir, 0), entry["lastUsedAt"])
+        if len(last_used) > self.max_output_dirs:
+            newest = set(sorted(last_used, key=last_used.get, reverse=True)[: self.max_output_dirs])
+            kept = {k: e for k, e in kept.items() if e["outputDir"] in newest}
+        dropped = {e["outputDir"] for k, e in self.entries.items() if k not in kept}
+        self.entries = kept
+
+        referenced = {e["outputDir"] for e in self.entries.values()}
+        for output_dir in dropped - referenced:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+        dumps_root = self.root / "dumps"
+        if dumps_root.is_dir():
+            for dump in dumps_root.iterdir():
+                mtimes = [p.stat().st_mtime for p in dump.rglob("*") if p.is_file()]
+                if max(mtimes, default=0) < cutoff:
+                    shutil.rmtree(dump, ignore_errors=True)
+
+        evicted = before - len(self.entries)
+        if evicted:
+            logger.info("Evicted %d cache entries", evicted)
+        return evicted
+
+    def dump_folder(self, chain_id):
+        """Persistent download folder of a chain (a ScraperFactory name)."""
+        return self.root / "dumps" / chain_id
+
+    def dump_files(self, chain_id):
+        """Files currently in the chain's dump folder."""
+        folder = self.dump_folder(chain_id)
+        if not folder.is_dir():
+            return set()
+        return {p for p in folder.rglob("*") if p.is_file()}
+
+    def finish_download(self, chain_id, before, limit=1):
+        """
+        Drop superseded files from a chain's dump folder after a download.
+
+        Keeps the newest file per store (by the timestamp in its name), and
+        only the `limit` newest of those when the download was limited, so
+        the folder holds what the download asked for. Kept files that were
+        already there before the download count as skipped downloads.
+
+        Args:
+            chain_id: ScraperFactory name
+            before: dump_files(chain_id) taken before downloading
+            limit: files per chain the download asked for (None = every store's)
+
+        Returns:
+            {"downloaded": int, "skipped": int}
+        """
+        files = self.dump_files(chain_id)
+        newest = {}
+        for path in files:
+            parsed = parse_file_name(path.name)
+            if parsed is None:
+                continue
+            _, store_id, timestamp = parsed
+            store = (path.parent, store_id)
+            if store not in newest or newest[store][0] < timestamp:
+                newest[store] = (timestamp, path)
+
+        latest = sorted(newest.values(), reverse=True)
+        kept = {path for _, path in (latest if limit is None else latest[:limit])}
+        for path in files:
+            if path not in kept and parse_file_name(path.name) is not None:
+                path.unlink()
+        kept |= {path for path in files if parse_file_name(path.name) is None}
+
+        now = time.time()
+        skipped = 0
+        for path in kept:
+            if path in before:
+                skipped += 1
+                # Keep reused dumps from looking abandoned to evict()
+                os.utime(path, (now, now))
+        stats = {"downloaded": len(kept) - skipped, "skipped": skipped}
+        self.download_stats[chain_id] = stats
+        return stats
+
+    def log_stats(self):
+        for chain_id, stats in sorted(self.download_stats.items()):
+            logger.info(
+                "Download cache %s: %d files downloaded, %d already cached",
+                chain_id,
+                stats["downloaded"],
+                stats["skipped"],
+            )
+        for chain, stats in sorted(self.stats.items()):
+            logger.info(
+                "Download cache %s: %d hits, %d misses", chain, stats["hits"], stats["misses"]
+            )
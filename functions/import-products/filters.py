@@ -0,0 +1,97 @@
+"""
+Row-level push-down of the import's product filters.
+
+min_price, the 'במשקל' (by weight) exclusion and allowedCategories are
+normally applied after aggregation: deduplicate_products/finalize_products
+drop a barcode by its highest price and winning name, sync_products by its
+winning category. RowFilter applies the same settings to each parsed row
+instead, so rejected rows are never materialized or aggregated:
+- price: rows priced below min_price
+- weight: rows whose name contains 'במשקל'
+- category: rows whose category isn't in allowed_categories (if set)
+
+Per row, these are slightly stricter than the late filters for barcodes
+whose rows disagree (e.g. a product sold below min_price in one store
+keeps its other prices, so its priceRange starts at min_price). That's
+why push-down is opt-in (the pushDownFilters setting). The late filters
+still run, so a pushed-down run never keeps a product they would drop.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+WEIGHT_MARKER = "במשקל"
+
+FILTER_PRICE = "price"
+FILTER_WEIGHT = "weight"
+FILTER_CATEGORY = "category"
+
+
+class RowFilter:
+    """
+    Args:
+        min_price: rows priced below this are rejected (0 = no price filter)
+        exclude_weight: reject rows of by-weight items
+        allowed_categories: categories to keep, case-insensitive (empty = all)
+    """
+
+    def __init__(self, min_price=0.0, exclude_weight=True, allowed_categories=None):
+        self.min_price = min_price or 0.0
+        self.exclude_weight = exclude_weight
+        self.allowed_categories = list(allowed_categories or [])
+        self._categories = {c.lower() for c in self.allowed_categories}
+        self.accepted = 0
+        self.rejected = {FILTER_PRICE: 0, FILTER_WEIGHT: 0, FILTER_CATEGORY: 0}
+
+    @classmethod
+    def from_settings(cls, settings):
+        """RowFilter for the import settings (minPrice, allowedCategories)."""
+        return cls(
+            min_price=settings.get("minPrice", 0.0),
+            exclude_weight=True,
+            allowed_categories=settings.get("allowedCategories", []),
+        )
+
+    def __getstate__(self):
+        # Sent to worker processes without the parent's counts
+        return {
+            "min_price": self.min_price,
+            "exclude_weight": self.exclude_weight,
+            "allowed_categories": self.allowed_categories,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def fork(self):
+        """A filter with the same settings and zeroed counts (one per worker)."""
+        return RowFilter(self.min_price, self.exclude_weight, self.allowed_categories)
+
+    def accept(self, record):
+        """True if `record` passes every filter; counts the first one it fails."""
+        if record["price"] < self.min_price:
+            self.rejected[FILTER_PRICE] += 1
+            return False
+        if self.exclude_weight and WEIGHT_MARKER in record["name"]:
+            self.rejected[FILTER_WEIGHT] += 1
+            return False
+        if self._categories and (record.get("category") or "").lower() not in self._categories:
+            self.rejected[FILTER_CATEGORY] += 1
+            return False
+        self.accepted += 1
+        return True
+
+    def apply(self, records):
+        """Lazily yield the records that pass."""
+        accept = self.accept
+        return (record for record in records if accept(record))
+
+    def add_counts(self, stats):
+        """Fold the counts of a forked filter (its stats()) into this one."""
+        self.accepted += stats["accepted"]
+        for name, count in stats["rejected"].items():
+            self.rejected[name] += count
+
+    def stats(self):
+        return {"accepted": self.accepted, "rejected": dict(self.rejected)}
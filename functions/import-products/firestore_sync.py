@@ -4,26 +4,92 @@ Firestore sync logic for the product import job.
 Handles:
 - Creating new products (status="active", vote fields zeroed)
 - Updating existing products (refresh name, priceRange, lastImportedAt)
-- Archiving stale products (not seen in 4+ weeks, active, auto-imported)
+  only when their content changed; unchanged products just get their
+  lastImportedAt refreshed every REFRESH_INTERVAL_WEEKS
+- Archiving stale products (not seen in 4+ weeks, active, auto-imported),
+  either from the loaded catalog or, with server_side_archive, from a
+  query that returns only the stale candidates (needs the composite index
+  in firestore.indexes.json)
+
+Document IDs are random by default, which forces a full load of the
+imported catalog to find products by barcode. With deterministic_ids the
+ID is derived from the normalized barcode instead (see product_doc_id), so
+only the incoming products are looked up, and stale products are always
+archived through the server-side query (nothing reads the whole catalog).
+Incoming GTINs that share a document ID ("0729..." and "729...") are
+written once, for the first of them. New documents are created with an
+exists=False precondition, so a create can never overwrite the voting
+state of an existing product. migrate_to_barcode_ids() is the one-time
+migration for existing catalogs; until it has written ID_MAP_DOC, syncs
+asked for deterministic IDs load the catalog as before, because the
+existing products still have random IDs and would all be created again.
+
+With a barcode index, documents imported earlier under other raw forms
+of one canonical barcode are duplicates: only the most recently imported
+one is updated, and the other active ones are archived.
 
 Never touches voting state (currentWeekVotes, isPreviousBoycott, etc.)
 Never archives products with status="boycotted".
 """
 
+import functools
+import itertools
 import logging
 from datetime import datetime, timedelta, timezone
 
 from google.cloud.firestore import SERVER_TIMESTAMP
 
+from barcodes import normalize_barcode
+from product_index import INDEX_FIELDS, LOAD_PARTITIONS, ProductIndex, load_product_index
+from write_engine import BATCH_SIZE, MAX_IN_FLIGHT, BatchWriteEngine
+
 logger = logging.getLogger(__name__)
 
 PRODUCTS_COLLECTION = "products"
-BATCH_SIZE = 500
 STALE_THRESHOLD_WEEKS = 4
+# Unchanged products are re-stamped this often so they never look stale.
+# Must stay below STALE_THRESHOLD_WEEKS.
+REFRESH_INTERVAL_WEEKS = 2
+
 IMPORT_SOURCE = "government-price-data"
 
+# Stale candidates fetched per query page by the server-side archive
+ARCHIVE_PAGE_SIZE = 1000
+_ARCHIVE_FIELDS = ["barcode", "status", "lastImportedAt"]
+
+# Barcode → document ID of products that kept their random ID during
+# migrate_to_barcode_ids() because users already interacted with them
+ID_MAP_DOC = "config/productIdMap"
+DOC_ID_PREFIX = "bc_"
+
+# Fields that mean users interacted with a product (votes/likes reference its ID)
+_ENGAGEMENT_FIELDS = ("currentWeekVotes", "totalHistoricalVotes", "weeklyLikes")
+
 
-def sync_products(db, products, allowed_categories=None):
+def product_doc_id(barcode):
+    """
+    Deterministic document ID for a barcode, derived from its canonical
+    key (barcodes.normalize_barcode): GTINs drop their leading zeros so
+    "0729..." and "729..." map to the same product, while internal codes
+    keep them ("001234" and "1234" stay two products). "/" is not allowed
+    in IDs.
+    """
+    key, _ = normalize_barcode(barcode)
+    return DOC_ID_PREFIX + key.replace("/", "_")
+
+
+def sync_products(
+    db,
+    products,
+    allowed_categories=None,
+    skip_unchanged=True,
+    max_in_flight=MAX_IN_FLIGHT,
+    deterministic_ids=False,
+    resume_from=0,
+    on_progress=None,
+    server_side_archive=False,
+    barcode_index=None,
+):
     """
     Upsert products into Firestore.
 
@@ -31,11 +97,40 @@ def sync_products(db, products, allowed_categories=None):
         db: Firestore client
         products: dict keyed by barcode, from parser.deduplicate_products()
         allowed_categories: list of category strings to filter by (empty = all)
+        skip_unchanged: when True, existing products whose name, priceRange
+            and category match the stored document are not rewritten; their
+            lastImportedAt is only refreshed once it is older than
+            REFRESH_INTERVAL_WEEKS, which keeps stale archiving correct
+        max_in_flight: maximum number of concurrent batch commits
+        deterministic_ids: derive document IDs from barcodes and look up
+            only the incoming products instead of loading the whole
+            imported catalog up front; implies server_side_archive.
+            Ignored (with a warning) until migrate_to_barcode_ids() has run
+        resume_from: number of leading products (in `products` order) whose
+            writes already committed in a previous attempt; they are not
+            written again, but still count as seen for stale archiving
+        on_progress: called with the number of leading products whose
+            writes have committed, after each chunk of BATCH_SIZE products
+        server_side_archive: query Firestore for the stale candidates only
+            (imported, active, lastImportedAt before the cutoff) instead of
+            scanning the imported catalog; needs the composite index on
+            importSource, status and lastImportedAt
+        barcode_index: barcodes.BarcodeIndex the products were keyed with
+            (parser barcode_index); existing documents are matched by the
+            canonical key of their barcode
 
     Returns:
-        dict with counts: {"created": int, "updated": int, "archived": int}
+        dict with counts: {"created": int, "changed": int, "unchanged": int,
+        "refreshed": int, "archived": int, "updated": int, "sharedIds": int}.
+        "refreshed" is the subset of unchanged products whose lastImportedAt
+        was touched; "sharedIds" counts incoming barcodes skipped because an
+        earlier barcode already maps to their document ID;
+        "updated" is kept for compatibility and equals "changed".
+        Products skipped through resume_from are not counted. Commit
+        statistics of the upsert and archive phases are returned under
+        "writeStats".
     """
-    counts = {"created": 0, "updated": 0, "archived": 0}
+    counts = {"created": 0, "changed": 0, "unchanged": 0, "refreshed": 0, "archived": 0, "sharedIds": 0}
 
     # Filter by allowed categories if configured
     if allowed_categories:
@@ -49,132 +144,467 @@ def sync_products(db, products, allowed_categories=None):
             "Filtered to %d products matching allowed categories", len(products)
         )
 
-    # Load existing products indexed by barcode
-    existing = _load_existing_products(db)
-
-    # Upsert in batches
+    collection = db.collection(PRODUCTS_COLLECTION)
+    id_map = _load_id_map(db) if deterministic_ids else None
+    if deterministic_ids and id_map is None:
+        logger.warning(
+            "%s is missing: run --migrate-ids before enabling deterministicIds. "
+            "Loading the catalog instead of point-reading barcode IDs",
+            ID_MAP_DOC,
+        )
+        deterministic_ids = False
+
+    if deterministic_ids:
+        # Existing products are point-read per chunk of incoming barcodes
+        if barcode_index is not None:
+            id_map = {barcode_index.key(barcode): doc_id for barcode, doc_id in id_map.items()}
+        existing = None
+        # Loading the catalog just to archive would undo the point reads
+        server_side_archive = True
+    else:
+        # Load existing products indexed by barcode
+        id_map = {}
+        existing = _load_existing_products(db, barcode_index=barcode_index)
+    refresh_cutoff = datetime.now(timezone.utc) - timedelta(weeks=REFRESH_INTERVAL_WEEKS)
+
+    # Upsert in pipelined batches
     seen_barcodes = set()
-    batch = db.batch()
-    batch_count = 0
-
-    for barcode, product_data in products.items():
-        seen_barcodes.add(barcode)
-
-        if barcode in existing:
-            # UPDATE existing product — only refresh metadata
-            doc_ref = existing[barcode]["ref"]
-            batch.update(
-                doc_ref,
-                {
-                    "name": product_data["name"],
-                    "priceRange": product_data["priceRange"],
-                    "category": product_data.get("category", ""),
-                    "lastImportedAt": SERVER_TIMESTAMP,
-                },
+    writer = BatchWriteEngine(db, max_in_flight=max_in_flight)
+
+    # Document IDs already written this run (deterministic_ids only)
+    claimed_ids = set()
+
+    def doc_id_for(barcode):
+        return id_map.get(barcode) or product_doc_id(barcode)
+
+    items = iter(products.items())
+    position = 0
+    if resume_from:
+        for barcode, _ in itertools.islice(items, resume_from):
+            seen_barcodes.add(barcode)
+            if deterministic_ids:
+                claimed_ids.add(doc_id_for(barcode))
+            position += 1
+        logger.info("Resuming sync after %d already committed products", position)
+
+    while True:
+        chunk = list(itertools.islice(items, BATCH_SIZE))
+        if not chunk:
+            break
+        position += len(chunk)
+        lookup = existing
+        if lookup is None:
+            # One write per document: later barcodes sharing an ID are skipped
+            writes = []
+            for barcode, product_data in chunk:
+                seen_barcodes.add(barcode)
+                doc_id = doc_id_for(barcode)
+                if doc_id in claimed_ids:
+                    counts["sharedIds"] += 1
+                    continue
+                claimed_ids.add(doc_id)
+                writes.append((barcode, product_data))
+            chunk = writes
+            lookup = _lookup_by_barcode_ids(db, [barcode for barcode, _ in chunk], id_map)
+
+        for barcode, product_data in chunk:
+            _upsert_product(
+                writer,
+                collection,
+                lookup,
+                barcode,
+                product_data,
+                counts,
+                skip_unchanged,
+                refresh_cutoff,
+                deterministic_ids,
             )
-            counts["updated"] += 1
-        else:
-            # CREATE new product
-            doc_ref = db.collection(PRODUCTS_COLLECTION).document()
-            batch.set(
-                doc_ref,
-                {
-                    "productId": doc_ref.id,
-                    "barcode": barcode,
-                    "name": product_data["name"],
-                    "priceRange": product_data["priceRange"],
-                    "category": product_data.get("category", ""),
-                    "currentWeekVotes": 0,
-                    "totalHistoricalVotes": 0,
-                    "isPreviousBoycott": False,
-                    "previousBoycottWeeks": [],
-                    "status": "active",
-                    "importSource": IMPORT_SOURCE,
-                    "lastImportedAt": SERVER_TIMESTAMP,
-                    "createdAt": SERVER_TIMESTAMP,
-                },
-            )
-            counts["created"] += 1
+            seen_barcodes.add(barcode)
 
-        batch_count += 1
-        if batch_count >= BATCH_SIZE:
-            batch.commit()
-            batch = db.batch()
-            batch_count = 0
+        if on_progress is not None:
+            writer.mark(functools.partial(on_progress, position))
 
-    # Commit remaining
-    if batch_count > 0:
-        batch.commit()
+    upsert_stats = writer.close()
 
+    counts["updated"] = counts["changed"]
     logger.info(
-        "Upserted products: %d created, %d updated", counts["created"], counts["updated"]
+        "Upserted products: %d created, %d changed, %d unchanged (%d refreshed)",
+        counts["created"],
+        counts["changed"],
+        counts["unchanged"],
+        counts["refreshed"],
     )
+    if counts["sharedIds"]:
+        logger.warning(
+            "%d incoming barcodes share a document ID with an earlier barcode (e.g. zero-padded "
+            "forms) and were skipped",
+            counts["sharedIds"],
+        )
 
     # Archive stale products
-    counts["archived"] = _archive_stale_products(db, existing, seen_barcodes)
+    if server_side_archive:
+        counts["archived"], archive_stats = _archive_stale_products_indexed(
+            db,
+            seen_barcodes,
+            max_in_flight=max_in_flight,
+            barcode_index=barcode_index,
+            written_ids=claimed_ids if deterministic_ids else None,
+            duplicates=existing.duplicates if existing is not None else (),
+        )
+    else:
+        if existing is None:
+            existing = _load_existing_products(db, active_only=True, barcode_index=barcode_index)
+        counts["archived"], archive_stats = _archive_stale_products(
+            db, existing, seen_barcodes, max_in_flight=max_in_flight
+        )
+    counts["writeStats"] = {"upsert": upsert_stats, "archive": archive_stats}
 
     return counts
 
 
-def _load_existing_products(db):
+def _upsert_product(
+    writer,
+    collection,
+    existing,
+    barcode,
+    product_data,
+    counts,
+    skip_unchanged,
+    refresh_cutoff,
+    deterministic_ids,
+):
+    """Queue the write (if any) for one incoming product and update counts."""
+    if barcode in existing:
+        doc_ref = existing.ref(barcode)
+        fields = {
+            "name": product_data["name"],
+            "priceRange": product_data["priceRange"],
+            "category": product_data.get("category", ""),
+        }
+
+        if skip_unchanged and existing.is_unchanged(
+            barcode, fields["name"], fields["priceRange"], fields["category"]
+        ):
+            counts["unchanged"] += 1
+            if not existing.needs_refresh(barcode, refresh_cutoff):
+                return
+            # Low-frequency "last seen" refresh for unchanged products
+            writer.update(doc_ref, {"lastImportedAt": SERVER_TIMESTAMP})
+            counts["refreshed"] += 1
+        else:
+            # UPDATE existing product — only refresh metadata
+            writer.update(doc_ref, {**fields, "lastImportedAt": SERVER_TIMESTAMP})
+            counts["changed"] += 1
+        return
+
+    # CREATE new product; with deterministic IDs the document may exist
+    # after all (created concurrently), so create() refuses to overwrite it
+    if deterministic_ids:
+        doc_ref = collection.document(product_doc_id(barcode))
+        write = writer.create
+    else:
+        doc_ref = collection.document()
+        write = writer.set
+    write(
+        doc_ref,
+        {
+            "productId": doc_ref.id,
+            "barcode": barcode,
+            "name": product_data["name"],
+            "priceRange": product_data["priceRange"],
+            "category": product_data.get("category", ""),
+            "currentWeekVotes": 0,
+            "totalHistoricalVotes": 0,
+            "isPreviousBoycott": False,
+            "previousBoycottWeeks": [],
+            "status": "active",
+            "importSource": IMPORT_SOURCE,
+            "lastImportedAt": SERVER_TIMESTAMP,
+            "createdAt": SERVER_TIMESTAMP,
+        },
+    )
+    counts["created"] += 1
+
+
+def _load_id_map_doc(db):
+    """Contents of ID_MAP_DOC, or None if the migration has never run."""
+    doc = db.document(ID_MAP_DOC).get()
+    if not doc.exists:
+        return None
+    return doc.to_dict() or {}
+
+
+def _load_id_map(db):
     """
-    Load all products with importSource="government-price-data",
-    indexed by barcode for O(1) lookup.
+    Barcode → legacy document ID map written by migrate_to_barcode_ids(),
+    or None if the migration has never run.
     """
-    existing = {}
-    query = (
-        db.collection(PRODUCTS_COLLECTION)
-        .where("importSource", "==", IMPORT_SOURCE)
+    data = _load_id_map_doc(db)
+    return None if data is None else data.get("ids", {})
+
+
+def _lookup_by_barcode_ids(db, barcodes, id_map):
+    """
+    Point-read the documents of a chunk of incoming barcodes (projected to
+    INDEX_FIELDS) and index the ones that exist by incoming barcode.
+
+    A Firestore batch can't express "create if absent" without failing as
+    a whole, so existence is checked with one get_all() per chunk; the cost
+    depends only on the number of incoming products.
+    """
+    collection = db.collection(PRODUCTS_COLLECTION)
+    barcodes_by_id = {}
+    for barcode in barcodes:
+        doc_id = id_map.get(barcode) or product_doc_id(barcode)
+        barcodes_by_id.setdefault(doc_id, []).append(barcode)
+    refs = [collection.document(doc_id) for doc_id in barcodes_by_id]
+
+    lookup = ProductIndex(collection)
+    for snapshot in db.get_all(refs, field_paths=INDEX_FIELDS):
+        if snapshot.exists:
+            data = snapshot.to_dict() or {}
+            # Every barcode mapping to the document sees it as existing
+            for barcode in barcodes_by_id.get(snapshot.id, ()):
+                lookup.add(snapshot.id, {**data, "barcode": barcode})
+    return lookup
+
+
+def migrate_to_barcode_ids(db, max_in_flight=MAX_IN_FLIGHT):
+    """
+    One-time migration of imported products to deterministic document IDs.
+
+    Products nobody interacted with are copied to product_doc_id(barcode)
+    and their old document is deleted. Products with votes, likes or a
+    boycott history keep their ID, because votes/likes reference it; they
+    are recorded in ID_MAP_DOC so deterministic-ID syncs still find them.
+
+    A target document that already exists (e.g. created by a deterministic
+    sync, and possibly voted on since) is never overwritten: the legacy
+    copy is archived instead and recorded under "redirects" in ID_MAP_DOC
+    (legacy document ID → target ID). Existence is checked with one
+    get_all() per chunk of BATCH_SIZE documents, and copies are written
+    with create(), so a document appearing in between fails the batch
+    rather than being overwritten.
+
+    Returns:
+        dict with counts: {"moved": int, "mapped": int, "redirected": int,
+        "unchanged": int}
+    """
+    collection = db.collection(PRODUCTS_COLLECTION)
+    query = collection.where("importSource", "==", IMPORT_SOURCE)
+    counts = {"moved": 0, "mapped": 0, "redirected": 0, "unchanged": 0}
+    id_map_data = _load_id_map_doc(db) or {}
+    id_map = id_map_data.get("ids", {})
+    redirects = id_map_data.get("redirects", {})
+    claimed = set()
+
+    with BatchWriteEngine(db, max_in_flight=max_in_flight) as writer:
+        docs = query.stream()
+        while True:
+            chunk = list(itertools.islice(docs, BATCH_SIZE))
+            if not chunk:
+                break
+
+            moves = []
+            for doc in chunk:
+                data = doc.to_dict()
+                barcode = data.get("barcode")
+                if not barcode:
+                    continue
+
+                target_id = product_doc_id(barcode)
+                if doc.id == target_id or id_map.get(barcode) == doc.id:
+                    counts["unchanged"] += 1
+                    claimed.add(target_id)
+                    continue
+
+                if _is_engaged(data) or target_id in claimed:
+                    id_map[barcode] = doc.id
+                    counts["mapped"] += 1
+                    continue
+
+                claimed.add(target_id)
+                moves.append((doc, data, target_id))
+
+            refs = [collection.document(target_id) for _, _, target_id in moves]
+            taken = {snapshot.id for snapshot in db.get_all(refs, field_paths=["barcode"]) if snapshot.exists}
+            for doc, data, target_id in moves:
+                if target_id in taken:
+                    # Idle legacy copy: the existing document stands in for it
+                    redirects[doc.id] = target_id
+                    writer.update(doc.reference, {"status": "archived"})
+                    counts["redirected"] += 1
+                    continue
+                writer.create(collection.document(target_id), {**data, "productId": target_id})
+                writer.delete(doc.reference)
+                counts["moved"] += 1
+
+    db.document(ID_MAP_DOC).set({"ids": id_map, "redirects": redirects, "updatedAt": SERVER_TIMESTAMP})
+    logger.info(
+        "Migrated product IDs: %d moved, %d mapped, %d redirected to an existing document, "
+        "%d already deterministic",
+        counts["moved"],
+        counts["mapped"],
+        counts["redirected"],
+        counts["unchanged"],
     )
+    return counts
 
-    for doc in query.stream():
-        data = doc.to_dict()
-        barcode = data.get("barcode")
-        if barcode:
-            existing[barcode] = {"ref": doc.reference, "data": data}
 
-    logger.info("Loaded %d existing imported products from Firestore", len(existing))
-    return existing
+def _is_engaged(data):
+    """True if users voted on, liked or boycotted the product."""
+    if any(data.get(field) for field in _ENGAGEMENT_FIELDS):
+        return True
+    if data.get("isPreviousBoycott") or data.get("previousBoycottWeeks"):
+        return True
+    return data.get("status", "active") != "active"
+
+
+def _load_existing_products(db, partitions=LOAD_PARTITIONS, active_only=False, barcode_index=None):
+    """
+    Load all products with importSource="government-price-data" into a
+    compact ProductIndex keyed by barcode for O(1) lookup. Only the fields
+    the sync needs are read, across concurrent document-ID partitions.
+
+    With active_only, only status="active" products are loaded (enough for
+    stale archiving).
+    """
+    collection = db.collection(PRODUCTS_COLLECTION)
+    query = collection.where("importSource", "==", IMPORT_SOURCE)
+    if active_only:
+        query = query.where("status", "==", "active")
+    return load_product_index(collection, query, partitions=partitions, barcode_index=barcode_index)
 
 
-def _archive_stale_products(db, existing, seen_barcodes):
+def _archive_stale_products(db, existing, seen_barcodes, max_in_flight=MAX_IN_FLIGHT):
     """
     Archive products that:
     - Were imported by us (importSource = government-price-data)
     - Were NOT seen in the current import
     - Have status = "active" (never archive "boycotted")
     - Have lastImportedAt older than STALE_THRESHOLD_WEEKS
+
+    Active duplicates (existing.duplicates: documents sharing a canonical
+    barcode with the indexed one) are archived too.
+
+    Returns:
+        (archived_count, commit_stats)
     """
     cutoff = datetime.now(timezone.utc) - timedelta(weeks=STALE_THRESHOLD_WEEKS)
     archived = 0
-    batch = db.batch()
-    batch_count = 0
-
-    for barcode, entry in existing.items():
-        if barcode in seen_barcodes:
-            continue
 
-        data = entry["data"]
-        if data.get("status") != "active":
-            continue
+    with BatchWriteEngine(db, max_in_flight=max_in_flight) as writer:
+        archived += _archive_duplicates(writer, db.collection(PRODUCTS_COLLECTION), existing.duplicates)
+        for barcode, entry in existing.items():
+            if barcode in seen_barcodes:
+                continue
 
-        last_imported = data.get("lastImportedAt")
-        if last_imported and last_imported.replace(tzinfo=timezone.utc) > cutoff:
-            continue
+            if entry.status != "active":
+                continue
 
-        batch.update(entry["ref"], {"status": "archived"})
-        archived += 1
-        batch_count += 1
+            last_imported = entry.last_imported_at
+            if last_imported and last_imported.replace(tzinfo=timezone.utc) > cutoff:
+                continue
 
-        if batch_count >= BATCH_SIZE:
-            batch.commit()
-            batch = db.batch()
-            batch_count = 0
-
-    if batch_count > 0:
-        batch.commit()
+            writer.update(existing.ref(barcode), {"status": "archived"})
+            archived += 1
 
     if archived > 0:
         logger.info("Archived %d stale products", archived)
 
+    return archived, writer.stats
+
+
+def _archive_duplicates(writer, collection, duplicates):
+    """
+    Queue the archiving of active duplicate documents (see
+    ProductIndex.duplicates) and return how many. The indexed document of
+    the same canonical barcode stands in for them.
+    """
+    archived = 0
+    for _, entry in duplicates:
+        if entry.status == "active":
+            writer.update(collection.document(entry.doc_id), {"status": "archived"})
+            archived += 1
+    if archived:
+        logger.info("Archived %d duplicate products (another raw form of the same barcode)", archived)
     return archived
+
+
+def _archive_stale_products_indexed(
+    db,
+    seen_barcodes,
+    max_in_flight=MAX_IN_FLIGHT,
+    page_size=ARCHIVE_PAGE_SIZE,
+    barcode_index=None,
+    written_ids=None,
+    duplicates=(),
+):
+    """
+    Archive stale products found by a server-side query.
+
+    Firestore returns only imported, active products whose lastImportedAt
+    is older than STALE_THRESHOLD_WEEKS (composite index on importSource,
+    status, lastImportedAt), in pages of page_size ordered by
+    lastImportedAt, so the cost follows the number of stale products
+    rather than the catalog size. Each candidate is re-checked client-side
+    (still active, not seen in this import) before it is archived.
+
+    Unlike the full scan, products without a lastImportedAt are not
+    candidates (every imported product is created with one).
+
+    Args:
+        written_ids: document IDs this run wrote or matched (deterministic
+            IDs). A candidate whose barcode was seen under another document
+            ID is a duplicate of it (another raw form of the barcode) and
+            is archived too.
+        duplicates: ProductIndex.duplicates of a loaded catalog, archived
+            up front
+
+    Returns:
+        (archived_count, commit_stats)
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(weeks=STALE_THRESHOLD_WEEKS)
+    query = (
+        db.collection(PRODUCTS_COLLECTION)
+        .where("importSource", "==", IMPORT_SOURCE)
+        .where("status", "==", "active")
+        .where("lastImportedAt", "<", cutoff)
+        .order_by("lastImportedAt")
+        .select(_ARCHIVE_FIELDS)
+    )
+    archived = 0
+    candidates = 0
+    last_doc = None
+
+    with BatchWriteEngine(db, max_in_flight=max_in_flight) as writer:
+        archived += _archive_duplicates(writer, db.collection(PRODUCTS_COLLECTION), duplicates)
+        duplicate_ids = {entry.doc_id for _, entry in duplicates}
+        while True:
+            page = query.limit(page_size)
+            if last_doc is not None:
+                page = page.start_after(last_doc)
+            docs = list(page.stream())
+            candidates += len(docs)
+
+            for doc in docs:
+                data = doc.to_dict() or {}
+                barcode = data.get("barcode")
+                if barcode and barcode_index is not None:
+                    barcode = barcode_index.key(barcode)
+                if doc.id in duplicate_ids or data.get("status") != "active":
+                    continue
+                if barcode in seen_barcodes and (written_ids is None or doc.id in written_ids):
+                    continue
+                last_imported = data.get("lastImportedAt")
+                if last_imported is None or last_imported.replace(tzinfo=timezone.utc) >= cutoff:
+                    continue
+                writer.update(doc.reference, {"status": "archived"})
+                archived += 1
+
+            if len(docs) < page_size:
+                break
+            last_doc = docs[-1]
+
+    logger.info("Archived %d stale products (%d candidates from the index)", archived, candidates)
+    return archived, writer.stats
@@ -11,15 +11,74 @@ Orchestrates:
 
 Designed to run as a Google Cloud Run Job, triggered by Cloud Scheduler
 every Sunday at 22:00 UTC (before Monday 00:00 weekly reset).
+
+With checkpoints, each stage is checkpointed (see checkpoint.py), so a
+retried task or `--resume RUN_ID` continues from the last completed stage.
+
+With several Cloud Run Job tasks (or `--local-shards N`), download and
+aggregation are split across tasks by chain and task 0 reduces the
+partials before syncing (see sharding.py).
+
+With deltaSnapshots, full runs also keep a local per-store price snapshot;
+`--delta` runs (e.g. daily) download only the chains' incremental Price
+files, apply them to the snapshot and sync the result (see delta.py).
+
+With normalizeBarcodes, ItemCodes are keyed by canonical GTIN (see
+barcodes.py), so the same product matches across chains however they
+pad its barcode.
+
+With priceHistory, each run also records its products' weekly min, max
+and median price in a local history store (see price_history.py).
 """
 
+import argparse
 import logging
+import os
 import sys
+from datetime import datetime, timezone
 
-from chains import CHAINS
-from config import get_firestore_client, load_import_settings, update_run_status
-from parser import download_chain_data, parse_downloaded_data, deduplicate_products
-from firestore_sync import sync_products
+from aggregate import aggregate_records
+from barcodes import BarcodeIndex
+from chains import CHAINS, chain_name_variants
+from checkpoint import (
+    STAGE_AGGREGATE,
+    STAGE_DOWNLOAD,
+    STAGE_PRODUCTS,
+    STAGE_SYNC,
+    RunCheckpoint,
+    build_manifest,
+    manifest_matches,
+)
+from config import get_firestore_client, load_import_settings, settings_from_env, update_run_status
+from delta import PriceSnapshot
+from download_cache import DownloadCache
+from parser import (
+    DOWNLOAD_WORKERS,
+    ENGINE_CSV,
+    FILE_PRICE,
+    aggregate_downloaded_data,
+    download_chain_data,
+    finalize_products,
+    stream_chain_data,
+)
+from filters import RowFilter
+from metrics import MetricsCollector, folder_size, write_stats_metrics
+from names import NameCleaner
+from price_history import PriceHistory
+from sharding import (
+    SHARD_FOLDER,
+    WAIT_TIMEOUT_S,
+    chains_for_task,
+    clear_partials,
+    partial_path,
+    reduce_partials,
+    run_local_shards,
+    task_from_env,
+    wait_for_partials,
+    write_partial,
+)
+from spill import SpilledAggregates
+from write_engine import MAX_IN_FLIGHT
 
 logging.basicConfig(
     level=logging.INFO,
@@ -28,58 +87,422 @@ logging.basicConfig(
 logger = logging.getLogger("import-products")
 
 
-def main():
+def parse_args(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Weekly product import job")
+    arg_parser.add_argument(
+        "--migrate-ids",
+        action="store_true",
+        help="one-time migration of imported products to barcode-derived document IDs",
+    )
+    arg_parser.add_argument(
+        "--resume",
+        metavar="RUN_ID",
+        help="resume a failed run from its last checkpoint",
+    )
+    arg_parser.add_argument(
+        "--local-shards",
+        type=int,
+        default=0,
+        metavar="N",
+        help="run the map step as N local subprocesses, then reduce and sync here",
+    )
+    arg_parser.add_argument(
+        "--delta",
+        action="store_true",
+        help="refresh prices from incremental Price files on top of the last full snapshot",
+    )
+    arg_parser.add_argument(
+        "--map-only",
+        action="store_true",
+        help="only write this task's partial aggregates (used by --local-shards)",
+    )
+    return arg_parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
     logger.info("Starting product import job")
 
-    # 1. Connect to Firestore and load settings
-    db = get_firestore_client()
-    settings = load_import_settings(db)
+    # 1. Connect to Firestore and load settings (local map tasks get them
+    # from the parent instead and never touch Firestore)
+    settings = settings_from_env() if args.map_only else None
+    db = None
+    if settings is None:
+        db = get_firestore_client()
+
+        if args.migrate_ids:
+            from firestore_sync import migrate_to_barcode_ids
+
+            migrate_to_barcode_ids(db)
+            return
+
+        settings = load_import_settings(db)
 
     if not settings.get("enabled", True):
         logger.info("Import is disabled in config. Exiting.")
-        update_run_status(db, "skipped")
+        if db is not None:
+            update_run_status(db, "skipped")
         return
 
     min_price = settings.get("minPrice", 3.0)
     min_suppliers = settings.get("minSuppliers", 2)
     allowed_categories = settings.get("allowedCategories", [])
+    range_quantiles = price_quantiles(settings)
+
+    # Task retries of a Cloud Run Job execution share its name, so they pick
+    # up the checkpoints of the failed attempt
+    run_id = args.resume or os.environ.get("CLOUD_RUN_EXECUTION")
+    if not run_id:
+        run_id = "local-" + datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    # Off by default: on Cloud Run /tmp is memory and isn't shared between
+    # instances, so checkpoints only pay off on a mounted IMPORT_CHECKPOINT_DIR
+    checkpoint = RunCheckpoint(run_id if settings.get("checkpoints", False) or args.resume else None)
+    if checkpoint.enabled:
+        logger.info("Run ID %s (resume with --resume %s)", run_id, run_id)
+
+    # Per-stage timings and counters, logged as JSON and saved with the run status
+    metrics = MetricsCollector(run_id=run_id)
 
-    # 2. Download data from configured chains
-    chain_ids = [c["id"] for c in CHAINS]
     chain_names = [c["name"] for c in CHAINS]
-    logger.info("Downloading data from chains: %s", ", ".join(chain_names))
+    # Strips every form of the chain names (incl. Hebrew) from product names
+    name_cleaner = NameCleaner(chain_name_variants(CHAINS))
+    # Canonical GTIN keys, so zero-padded and stripped ItemCodes match across chains
+    barcode_index = BarcodeIndex.load() if settings.get("normalizeBarcodes", False) else None
 
-    data_folder = download_chain_data(chain_ids)
+    # Map/reduce across Cloud Run Job tasks (or local subprocesses)
+    task_index, task_count = task_from_env()
+    if args.local_shards > 1:
+        task_index, task_count = 0, args.local_shards
+    sharded = task_count > 1
+    reducer = not args.map_only and task_index == 0
 
-    # 3. Parse downloaded XMLs
-    logger.info("Parsing downloaded data...")
-    records = parse_downloaded_data(data_folder)
+    # Resume from the latest stage checkpoint; earlier stages are skipped
+    products = checkpoint.load(STAGE_PRODUCTS) if reducer else None
+    parsed = checkpoint.load(STAGE_AGGREGATE) if reducer and products is None else None
 
-    if not records:
-        logger.warning("No product records parsed. Check chain downloads.")
-        update_run_status(db, "failed", 0)
-        sys.exit(1)
+    if products is None and parsed is None:
+        if args.delta:
+            if task_index != 0:
+                logger.info("Delta refreshes run on task 0 only")
+                return
+            # None without a usable snapshot: fall back to a full import
+            parsed = _refresh_from_deltas(CHAINS, settings, metrics, barcode_index=barcode_index)
+        if parsed is None and not sharded:
+            parsed = _download_and_aggregate(
+                CHAINS,
+                settings,
+                metrics,
+                checkpoint,
+                snapshot=settings.get("deltaSnapshots", False),
+                barcode_index=barcode_index,
+            )
+        elif parsed is None:
+            parsed = _map_reduce(
+                args, settings, metrics, run_id, task_index, task_count, reducer, barcode_index=barcode_index
+            )
+            if parsed is None:
+                logger.info("Map task %d/%d done", task_index + 1, task_count)
+                return
+        # Spilled aggregates live in run files and aren't checkpointed
+        if parsed[1] and isinstance(parsed[0], dict):
+            checkpoint.save(STAGE_AGGREGATE, parsed)
 
-    # 4. Deduplicate by barcode (only products on 2+ suppliers, exclude weight-based items)
-    chain_names = [c["name"] for c in CHAINS]
-    products = deduplicate_products(records, min_price=min_price, min_suppliers=min_suppliers, chain_names=chain_names)
+    if products is None:
+        aggregates, record_count = parsed
+
+        if record_count == 0:
+            logger.warning("No product records parsed. Check chain downloads.")
+            update_run_status(db, "failed", 0, metrics=metrics.summary())
+            sys.exit(1)
+
+        # 4. Deduplicate by barcode (only products on 2+ suppliers, exclude weight-based items)
+        with metrics.stage("dedup", records_in=record_count) as stage:
+            products = finalize_products(
+                aggregates,
+                min_price=min_price,
+                min_suppliers=min_suppliers,
+                record_count=record_count,
+                name_cleaner=name_cleaner,
+                price_quantiles=range_quantiles,
+            )
+            stage.records_out = len(products)
+            stage.extra["nameCache"] = name_cleaner.stats()
+        if settings.get("priceHistory", False):
+            # Best-effort: a full or unwritable history volume mustn't stop the sync
+            history = PriceHistory()
+            try:
+                with metrics.stage("history", records_in=len(products)) as stage:
+                    stage.records_out = history.record_run(aggregates, barcodes=products)
+            except Exception:
+                logger.exception("Couldn't record the price history; syncing anyway")
+            finally:
+                history.close()
+        checkpoint.save(STAGE_PRODUCTS, products)
+        if isinstance(aggregates, SpilledAggregates):
+            aggregates.close()
+        del aggregates, parsed
     logger.info("Deduplicated to %d unique products", len(products))
 
-    # 5. Sync to Firestore
-    counts = sync_products(db, products, allowed_categories=allowed_categories)
+    # 5. Sync to Firestore, recording how far the committed writes got
+    cursor = checkpoint.load(STAGE_SYNC) or {}
+    resume_from = cursor.get("position", 0)
+
+    def save_sync_cursor(position):
+        checkpoint.save(STAGE_SYNC, {"position": position})
+
+    # Imported here: local map tasks run without google-cloud-firestore
+    from firestore_sync import sync_products
+
+    with metrics.stage("sync", records_in=len(products)) as stage:
+        counts = sync_products(
+            db,
+            products,
+            allowed_categories=allowed_categories,
+            skip_unchanged=settings.get("skipUnchanged", True),
+            max_in_flight=settings.get("writeConcurrency", MAX_IN_FLIGHT),
+            deterministic_ids=settings.get("deterministicIds", False),
+            server_side_archive=settings.get("serverSideArchive", False),
+            barcode_index=barcode_index,
+            resume_from=resume_from,
+            on_progress=save_sync_cursor if checkpoint.enabled else None,
+        )
+        stage.records_out = counts["created"] + counts["changed"] + counts["refreshed"]
+        stage.extra["archived"] = counts["archived"]
+        stage.extra.update(write_stats_metrics(counts.get("writeStats", {})))
+        if resume_from:
+            stage.extra["resumedFrom"] = resume_from
+    if barcode_index is not None:
+        barcode_index.save()
 
     # 6. Update run status
-    total = counts["created"] + counts["updated"]
-    update_run_status(db, "success", total)
+    total = counts["created"] + counts["changed"] + counts["unchanged"] + resume_from
+    update_run_status(db, "success", total, metrics=metrics.summary())
 
     logger.info(
-        "Import complete. Created=%d, Updated=%d, Archived=%d. "
+        "Import complete. Created=%d, Changed=%d, Unchanged=%d, Archived=%d. "
         "Chains processed: %s",
         counts["created"],
-        counts["updated"],
+        counts["changed"],
+        counts["unchanged"],
         counts["archived"],
         ", ".join(chain_names),
     )
+    checkpoint.clear()
+    if sharded:
+        clear_partials(SHARD_FOLDER, run_id)
+
+
+def price_quantiles(settings):
+    """
+    (low, high) quantiles for priceRange from the priceRangePercentiles
+    setting, e.g. [10, 90] → (0.1, 0.9); None (min–max) when unset.
+
+    Raises:
+        ValueError: unless the setting is two percentiles 0 ≤ low ≤ high ≤ 100
+    """
+    percentiles = settings.get("priceRangePercentiles") or []
+    if not percentiles:
+        return None
+    if len(percentiles) != 2 or not 0 <= percentiles[0] <= percentiles[1] <= 100:
+        raise ValueError(f"priceRangePercentiles must be [low, high] within 0–100, got {percentiles!r}")
+    return percentiles[0] / 100, percentiles[1] / 100
+
+
+def tracks_prices(settings):
+    """
+    True if the run reads price quantiles (priceRangePercentiles, or the
+    priceHistory median), so aggregates need their price sketch.
+    """
+    return price_quantiles(settings) is not None or settings.get("priceHistory", False)
+
+
+def _download_and_aggregate(chains, settings, metrics, checkpoint, snapshot=False, barcode_index=None):
+    """
+    Download `chains` and fold their records into per-barcode aggregates,
+    reusing a still-valid download checkpoint. With streamChains, each
+    chain is downloaded, aggregated and deleted in turn instead (raw dumps
+    don't outlive the run, so there is no download checkpoint).
+
+    With `snapshot`, the downloaded PriceFull files also refresh the local
+    price snapshot that --delta runs build on (see delta.py).
+
+    With a barcodes.BarcodeIndex, records are aggregated by canonical barcode.
+
+    Returns:
+        (aggregates, record_count)
+    """
+    chain_ids = [c["id"] for c in chains]
+    origins = {c["id"]: c.get("origin", c["id"]) for c in chains}
+    parser_engine = settings.get("parserEngine", ENGINE_CSV)
+    # Drop rows the price/weight/category filters reject while reading
+    row_filter = RowFilter.from_settings(settings) if settings.get("pushDownFilters", False) else None
+    # One PriceFull file per chain, or every store's
+    limit = None if settings.get("allStores", False) else 1
+
+    if settings.get("streamChains", False):
+        if snapshot:
+            logger.warning("Price snapshots aren't built in streamChains mode (raw dumps are deleted)")
+        if settings.get("downloadCache", False):
+            logger.info("The download cache isn't used in streamChains mode (it would outlive the disk budget)")
+        logger.info("Streaming data from chains: %s", ", ".join(c["name"] for c in chains))
+        return stream_chain_data(
+            chain_ids,
+            engine=parser_engine,
+            max_workers=settings.get("downloadWorkers", DOWNLOAD_WORKERS),
+            origins=origins,
+            disk_budget_mb=settings.get("diskBudgetMb", 0),
+            memory_limit_mb=settings.get("dedupMemoryMb", 0),
+            metrics=metrics,
+            row_filter=row_filter,
+            limit=limit,
+            barcode_index=barcode_index,
+            track_prices=tracks_prices(settings),
+        )
+
+    cache = DownloadCache() if settings.get("downloadCache", False) else None
+
+    # 2. Download data from configured chains
+    manifest = checkpoint.load(STAGE_DOWNLOAD)
+    if manifest is not None and not manifest_matches(manifest):
+        logger.warning("Downloaded files changed since the checkpoint; downloading again")
+        manifest = None
+
+    if manifest is None:
+        logger.info("Downloading data from chains: %s", ", ".join(c["name"] for c in chains))
+        with metrics.stage("download") as stage:
+            data_folder = download_chain_data(
+                chain_ids,
+                max_workers=settings.get("downloadWorkers", DOWNLOAD_WORKERS),
+                origins=origins,
+                limit=limit,
+                cache=cache,
+            )
+            stage.bytes_read = folder_size(data_folder)
+        checkpoint.save(STAGE_DOWNLOAD, build_manifest(data_folder))
+    else:
+        data_folder = manifest["dataFolder"]
+
+    if snapshot:
+        with metrics.stage("snapshot") as stage:
+            stage.extra.update(PriceSnapshot().build(data_folder, all_stores=limit is None))
+
+    # 3. Parse downloaded XMLs and aggregate per barcode
+    logger.info("Parsing downloaded data (%s engine)...", parser_engine)
+    return aggregate_downloaded_data(
+        data_folder,
+        cache=cache,
+        engine=parser_engine,
+        workers=settings.get("parseWorkers", 1),
+        metrics=metrics,
+        memory_limit_mb=settings.get("dedupMemoryMb", 0),
+        row_filter=row_filter,
+        barcode_index=barcode_index,
+        track_prices=tracks_prices(settings),
+    )
+
+
+def _refresh_from_deltas(chains, settings, metrics, barcode_index=None):
+    """
+    Download the chains' delta Price files, apply them to the local price
+    snapshot and aggregate the snapshot's rows.
+
+    Chains publish Price files for every store, so this refuses (returns
+    None) unless the snapshot was built with allStores; on top of a
+    one-store-per-chain snapshot nearly every delta would be downloaded
+    for nothing, more than the full run costs.
+
+    Returns:
+        (aggregates, record_count), or None if there is no usable snapshot
+    """
+    snapshot = PriceSnapshot()
+    if not snapshot.exists():
+        logger.warning("No price snapshot at %s yet; running a full import instead", snapshot.folder)
+        return None
+    if not snapshot.covers_all_stores():
+        logger.warning(
+            "The price snapshot at %s has one store per chain (built without allStores), but deltas "
+            "are published for every store; running a full import instead",
+            snapshot.folder,
+        )
+        return None
+
+    chain_ids = [c["id"] for c in chains]
+    origins = {c["id"]: c.get("origin", c["id"]) for c in chains}
+    row_filter = RowFilter.from_settings(settings) if settings.get("pushDownFilters", False) else None
+
+    logger.info("Downloading price deltas from chains: %s", ", ".join(c["name"] for c in chains))
+    with metrics.stage("download") as stage:
+        data_folder = download_chain_data(
+            chain_ids,
+            max_workers=settings.get("downloadWorkers", DOWNLOAD_WORKERS),
+            origins=origins,
+            file_type=FILE_PRICE,
+            limit=None,
+        )
+        stage.bytes_read = folder_size(data_folder)
+
+    with metrics.stage("delta") as stage:
+        stage.extra.update(snapshot.apply_deltas(data_folder))
+
+    with metrics.stage("read") as stage:
+        records = snapshot.iter_records(row_filter=row_filter)
+        if barcode_index is not None:
+            records = barcode_index.normalize_records(records)
+        aggregates, record_count = aggregate_records(records, track_prices=tracks_prices(settings))
+        stage.records_out = record_count
+        stage.extra["barcodes"] = len(aggregates)
+        if row_filter is not None:
+            stage.extra["rowFilter"] = row_filter.stats()
+        if barcode_index is not None:
+            stage.extra["barcodeIndex"] = barcode_index.stats()
+    return aggregates, record_count
+
+
+def _map_reduce(args, settings, metrics, run_id, task_index, task_count, reducer, barcode_index=None):
+    """
+    Run this task's share of a sharded import.
+
+    Map: aggregate this task's slice of CHAINS into a partial (skipped if a
+    previous attempt already wrote it; with --local-shards all map tasks
+    run as subprocesses instead). Reduce (task 0 only): wait for every
+    partial and merge them.
+
+    Returns:
+        (aggregates, record_count) on the reducer, None on other tasks
+    """
+    if args.local_shards > 1:
+        with metrics.stage("map"):
+            run_local_shards(task_count, run_id, settings=settings)
+    else:
+        path = partial_path(SHARD_FOLDER, run_id, task_index, task_count)
+        if path.exists():
+            logger.info("Partial %s already written; skipping map", path)
+        else:
+            chains = chains_for_task(CHAINS, task_index, task_count)
+            # Each task downloads into its own (or private) scratch folders,
+            # so the single-run download checkpoint doesn't apply
+            parsed = _download_and_aggregate(
+                chains, settings, metrics, RunCheckpoint(None), barcode_index=barcode_index
+            )
+            write_partial(path, *parsed)
+            if isinstance(parsed[0], SpilledAggregates):
+                parsed[0].close()
+
+    if not reducer:
+        return None
+
+    with metrics.stage("reduce") as stage:
+        paths = wait_for_partials(
+            SHARD_FOLDER,
+            run_id,
+            task_count,
+            timeout=settings.get("shardWaitTimeoutS", WAIT_TIMEOUT_S),
+        )
+        parsed = reduce_partials(paths, memory_limit_mb=settings.get("dedupMemoryMb", 0))
+        stage.records_in = len(paths)
+        stage.records_out = parsed[1]
+        stage.extra["barcodes"] = len(parsed[0])
+    return parsed
 
 
 if __name__ == "__main__":
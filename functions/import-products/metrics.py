@@ -0,0 +1,228 @@
+"""
+Per-stage instrumentation for the product import job.
+
+A MetricsCollector times each pipeline stage (wall time, CPU time,
+resident memory) and records stage-specific counters: records in/out,
+bytes read, Firestore ops and commit latency. Every finished stage is
+emitted as one structured JSON log line, and summary() returns a compact
+map that config.update_run_status() persists as lastRunMetrics.
+
+Memory is measured per stage: RSS at its start and end, and its peak,
+sampled every RSS_SAMPLE_S on a background thread (and exact whenever the
+stage raised the process's high-water mark). ru_maxrss only ever grows
+over the process lifetime, so it's reported once, as summary()'s
+peakRssMb — the peak of the whole run so far, parse workers included.
+
+Usage:
+    metrics = MetricsCollector()
+    with metrics.stage("dedup", records_in=len(aggregates)) as stage:
+        products = finalize_products(aggregates)
+        stage.records_out = len(products)
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+
+# Seconds between RSS samples while a stage runs (0 = start/end only)
+RSS_SAMPLE_S = 0.05
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):  # no sysconf on Windows
+    _PAGE_SIZE = 4096
+
+
+def _max_rss_mb(who):
+    """ru_maxrss of `who` (resource.RUSAGE_SELF/RUSAGE_CHILDREN) in MB."""
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(peak / divisor, 1)
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size so far, in MB: the largest of this process and
+    of its (waited-for) children over their lifetime.
+    """
+    if resource is None:
+        return None
+    return max(_max_rss_mb(resource.RUSAGE_SELF), _max_rss_mb(resource.RUSAGE_CHILDREN))
+
+
+def current_rss_mb():
+    """Current resident set size of this process in MB (None without /proc)."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(pages * _PAGE_SIZE / (1024 * 1024), 1)
+
+
+class _RssSampler:
+    """Samples current_rss_mb() on a daemon thread until stop()."""
+
+    def __init__(self, interval):
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="rss-sampler", daemon=True)
+        self._thread.start()
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            rss = current_rss_mb()
+            if rss is not None and (self.peak is None or rss > self.peak):
+                self.peak = rss
+
+    def stop(self):
+        """Stop sampling; returns the highest sample (None if none was taken)."""
+        self._stop.set()
+        self._thread.join()
+        return self.peak
+
+
+def folder_size(path):
+    """Total size in bytes of all files under path (0 if missing)."""
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+class StageMetrics:
+    """Measurements of a single pipeline stage. Counters are set by the caller."""
+
+    def __init__(self, name, records_in=None):
+        self.name = name
+        self.records_in = records_in
+        self.records_out = None
+        self.bytes_read = None
+        self.extra = {}
+        self.wall_s = None
+        self.cpu_s = None
+        self.rss_start_mb = None
+        self.rss_end_mb = None
+        self.peak_rss_mb = None
+        self.status = "success"
+
+    def to_dict(self):
+        data = {
+            "wallS": self.wall_s,
+            "cpuS": self.cpu_s,
+            "rssStartMb": self.rss_start_mb,
+            "rssEndMb": self.rss_end_mb,
+            "peakRssMb": self.peak_rss_mb,
+            "recordsIn": self.records_in,
+            "recordsOut": self.records_out,
+            "bytesRead": self.bytes_read,
+            "status": self.status,
+        }
+        data.update(self.extra)
+        return {k: v for k, v in data.items() if v is not None}
+
+
+class MetricsCollector:
+    """Collects StageMetrics for one import run."""
+
+    def __init__(self, run_id=None, emit=True, rss_sample_s=RSS_SAMPLE_S):
+        self.run_id = run_id
+        self.emit = emit
+        self.rss_sample_s = rss_sample_s
+        self.stages = []
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name, records_in=None):
+        """Time a stage; the yielded StageMetrics can be filled in by the caller."""
+        stage = StageMetrics(name, records_in=records_in)
+        stage.rss_start_mb = current_rss_mb()
+        own_peak_start = _max_rss_mb(resource.RUSAGE_SELF) if resource is not None else None
+        sampler = None
+        if self.rss_sample_s and stage.rss_start_mb is not None:
+            sampler = _RssSampler(self.rss_sample_s)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield stage
+        except BaseException:
+            stage.status = "failed"
+            raise
+        finally:
+            stage.wall_s = round(time.perf_counter() - wall_start, 3)
+            stage.cpu_s = round(time.process_time() - cpu_start, 3)
+            stage.rss_end_mb = current_rss_mb()
+            samples = [stage.rss_start_mb, stage.rss_end_mb]
+            if sampler is not None:
+                samples.append(sampler.stop())
+            if own_peak_start is not None:
+                # A new high-water mark set during the stage is its exact peak
+                own_peak_end = _max_rss_mb(resource.RUSAGE_SELF)
+                if own_peak_end > own_peak_start:
+                    samples.append(own_peak_end)
+            samples = [rss for rss in samples if rss is not None]
+            stage.peak_rss_mb = max(samples) if samples else None
+            self.stages.append(stage)
+            if self.emit:
+                self._log(stage)
+
+    def _log(self, stage):
+        payload = {"event": "import_stage", "stage": stage.name, **stage.to_dict()}
+        if self.run_id:
+            payload["runId"] = self.run_id
+        logger.info(json.dumps(payload, ensure_ascii=False, default=str))
+
+    def summary(self):
+        """Compact map of all stages, suitable for a Firestore document field."""
+        summary = {
+            "totalWallS": round(time.perf_counter() - self._started, 3),
+            "peakRssMb": peak_rss_mb(),
+            "stages": {stage.name: stage.to_dict() for stage in self.stages},
+        }
+        if self.run_id:
+            summary["runId"] = self.run_id
+        return {k: v for k, v in summary.items() if v is not None}
+
+
+def write_stats_metrics(write_stats):
+    """
+    Flatten BatchWriteEngine stats (one dict per phase) into stage counters:
+    total ops, commits, retries, average/max commit latency and histogram.
+    """
+    ops = commits = retries = 0
+    latency_total = latency_max = 0.0
+    histogram = {}
+    for stats in write_stats.values():
+        ops += stats.get("ops", 0)
+        commits += stats.get("commits", 0)
+        retries += stats.get("retries", 0)
+        latency_total += stats.get("latencyMsTotal", 0.0)
+        latency_max = max(latency_max, stats.get("latencyMsMax", 0.0))
+        for bucket, count in stats.get("latencyHistogram", {}).items():
+            histogram[bucket] = histogram.get(bucket, 0) + count
+
+    return {
+        "firestoreOps": ops,
+        "firestoreCommits": commits,
+        "firestoreRetries": retries,
+        "commitLatencyMsAvg": round(latency_total / commits, 1) if commits else None,
+        "commitLatencyMsMax": round(latency_max, 1) if commits else None,
+        "commitLatencyHistogram": histogram or None,
+    }
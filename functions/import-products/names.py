@@ -0,0 +1,174 @@
+"""
+Product-name normalization shared by the dedup engines.
+
+NameCleaner strips chain names from ItemName the way
+parser.clean_product_name does, but is built once per run:
+- all chain names (English and the Hebrew forms that actually appear in
+  ItemName, see chains.chain_name_variants) are compiled into a single
+  alternation regex, longest names first, instead of two str.replace
+  passes per chain
+- results are memoized in a bounded LRU cache keyed on the raw name,
+  since the same names repeat across every store of every chain
+
+Each raw name also gets a canonical key (canonical_name): niqqud and
+cantillation marks dropped, gershayim/geresh and typographic quotes folded
+to ASCII, whitespace collapsed and unit spellings unified (גר׳/גר/ג׳ →
+גרם, קג → ק"ג, ...). Name votes count canonical keys, so spelling variants
+of one name no longer split the vote; the winner is shown in its most
+common cleaned spelling. Keys are computed once per distinct raw name,
+inside the same LRU cache. normalize_many() does a whole list of distinct
+names in one regex pass per rule (the NumPy dedup engine uses it).
+
+stats() reports the cache hit rate for the stage metrics.
+"""
+
+import re
+from functools import lru_cache
+
+# Distinct raw names kept in the LRU cache
+NAME_CACHE_SIZE = 65_536
+
+# Niqqud and cantillation marks (U+0591–U+05C7, except the punctuation
+# maqaf, paseq, sof pasuq and nun hafukha) are dropped; quote, dash and
+# space variants are folded to ASCII
+_CANONICAL_TABLE = {
+    code: None for code in range(0x0591, 0x05C8) if code not in (0x05BE, 0x05C0, 0x05C3, 0x05C6)
+}
+_CANONICAL_TABLE.update(
+    str.maketrans(
+        {
+            "\u05f4": '"',  # gershayim
+            "\u05f3": "'",  # geresh
+            "\u201c": '"',
+            "\u201d": '"',
+            "\u201e": '"',
+            "\u2018": "'",
+            "\u2019": "'",
+            "`": "'",
+            "\u00b4": "'",
+            "\u05be": "-",  # maqaf
+            "\u2013": "-",
+            "\u2014": "-",
+            "\u00a0": " ",
+        }
+    )
+)
+
+# Unit spellings after a quantity, unified to one form (applied after the
+# translate table, so quotes are already ASCII)
+_UNIT_RULES = [
+    (re.compile(pattern + r"(?=\W|$)"), replacement)
+    for pattern, replacement in [
+        (r"(\d)\s*(?:גרם|גר'|גר|ג')", r"\1 גרם"),
+        (r'(\d)\s*(?:ק"ג|קג|קילוגרם|קילו)', r'\1 ק"ג'),
+        (r'(\d)\s*(?:מ"ל|מל|מיליליטר)', r'\1 מ"ל'),
+        (r"(\d)\s*(?:ליטר|ל'|ל)", r"\1 ליטר"),
+        (r"(\d)\s*(?:יחידות|יח'|יח)", r"\1 יח'"),
+    ]
+]
+_WHITESPACE = re.compile(r"\s+")
+# Joins names for normalize_many(): not whitespace, matched by \W, and
+# never part of an XML or CSV product name
+_SEPARATOR = "\0"
+
+
+def canonical_name(name):
+    """
+    Canonical key of a (cleaned) product name; names that differ only in
+    niqqud, quote style, whitespace or unit spelling share a key.
+    """
+    key = name.translate(_CANONICAL_TABLE)
+    for pattern, replacement in _UNIT_RULES:
+        key = pattern.sub(replacement, key)
+    return _WHITESPACE.sub(" ", key).strip().casefold()
+
+
+def vote_name(name_counts, normalize):
+    """
+    Winning display name among raw names and their counts.
+
+    Counts are summed per canonical key; the key with the most votes wins
+    (ties: first seen) and is shown in its most common cleaned spelling
+    (ties: first seen).
+
+    Args:
+        name_counts: iterable of (raw name, count), in first-seen order
+        normalize: raw name → (cleaned name, canonical key), e.g.
+            NameCleaner.normalize
+    """
+    votes = {}
+    spellings = {}
+    for raw_name, count in name_counts:
+        display, key = normalize(raw_name)
+        votes[key] = votes.get(key, 0) + count
+        forms = spellings.setdefault(key, {})
+        forms[display] = forms.get(display, 0) + count
+    key = max(votes, key=votes.__getitem__)
+    forms = spellings[key]
+    return max(forms, key=forms.__getitem__)
+
+
+class NameCleaner:
+    """
+    Args:
+        chain_names: chain names to remove from product names
+        cache_size: LRU cache bound (distinct raw names)
+    """
+
+    def __init__(self, chain_names=(), cache_size=NAME_CACHE_SIZE):
+        self.chain_names = [name for name in dict.fromkeys(chain_names) if name]
+        self._pattern = None
+        if self.chain_names:
+            alternation = "|".join(
+                re.escape(name) for name in sorted(self.chain_names, key=len, reverse=True)
+            )
+            # " ChainName" or "ChainName ", the two forms clean_product_name removes
+            self._pattern = re.compile(f" (?:{alternation})|(?:{alternation}) ")
+        self._cached = lru_cache(maxsize=cache_size)(self._normalize)
+
+    def _normalize(self, name):
+        if self._pattern is not None:
+            name = self._pattern.sub("", name)
+        name = name.strip()
+        return name, canonical_name(name)
+
+    def normalize(self, name):
+        """(cleaned name, canonical key) of a raw product name."""
+        return self._cached(name)
+
+    def normalize_many(self, names):
+        """
+        normalize() of every name in a list, in order.
+
+        The chain-name and canonical-key regexes run once over all the
+        names joined together rather than once per name, which is several
+        times cheaper for a large list of distinct names. The results
+        aren't cached.
+        """
+        if not names or any(_SEPARATOR in name for name in names):
+            return [self.normalize(name) for name in names]
+        joined = _SEPARATOR.join(names)
+        if self._pattern is not None:
+            joined = self._pattern.sub("", joined)
+        cleaned = [name.strip() for name in joined.split(_SEPARATOR)]
+        keys = _SEPARATOR.join(cleaned).translate(_CANONICAL_TABLE)
+        for pattern, replacement in _UNIT_RULES:
+            keys = pattern.sub(replacement, keys)
+        keys = _WHITESPACE.sub(" ", keys).split(_SEPARATOR)
+        return [(name, key.strip().casefold()) for name, key in zip(cleaned, keys)]
+
+    def clean(self, name):
+        """Cleaned product name (see parser.clean_product_name)."""
+        return self._cached(name)[0]
+
+    __call__ = clean
+
+    def stats(self):
+        info = self._cached.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            "hits": info.hits,
+            "misses": info.misses,
+            "hitRate": round(info.hits / lookups, 4) if lookups else None,
+            "cached": info.currsize,
+        }
@@ -2,12 +2,18 @@
 Downloads and parses PriceFull XML files from Israeli supermarket chains
 using il-supermarket-scraper and il-supermarket-parser.
 
-Outputs a deduplicated dict keyed by barcode:
+Raw rows become one product record per item and store:
+{"barcode": str, "name": str, "price": float, "category": str, "supplier": str}
+
+Records are folded into per-barcode aggregates (see aggregate.py) and
+reduced by deduplicate_products / finalize_products into a dict keyed
+by barcode:
 {
     barcode: {
         "name": str,
-        "prices": [float, ...],
+        "priceRange": "₪X–Y",
         "category": str,
+        "suppliers": [str, ...],
     }
 }
 """
@@ -15,9 +21,19 @@ Outputs a deduplicated dict keyed by barcode:
 import logging
 import os
 import shutil
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 
+from aggregate import aggregate_records, merge_aggregates
+from columnar import RecordColumns
+from disk_budget import DiskBudget
+from metrics import MetricsCollector, folder_size
+from names import NameCleaner, vote_name
+from rate_limit import RateLimiterRegistry
+from spill import SpillingAggregator
+
 logger = logging.getLogger(__name__)
 
 
@@ -34,6 +50,9 @@ def clean_product_name(name, chain_names):
 
     Returns:
         Cleaned product name
+
+    The dedup engines use names.NameCleaner, the compiled and memoized
+    equivalent, built once per run.
     """
     cleaned = name
     for chain in chain_names:
@@ -41,23 +60,60 @@ def clean_product_name(name, chain_names):
         cleaned = cleaned.replace(f" {chain}", "").replace(f"{chain} ", "")
     return cleaned.strip()
 
-DATA_FOLDER = "/tmp/supermarket_dumps"
-OUTPUT_FOLDER = "/tmp/supermarket_output"
+DATA_FOLDER = os.environ.get("IMPORT_DATA_DIR", "/tmp/supermarket_dumps")
+OUTPUT_FOLDER = os.environ.get("IMPORT_OUTPUT_DIR", "/tmp/supermarket_output")
 
-# Delay between chain downloads to avoid rate limiting (seconds)
+# Minimum delay between two downloads from the same origin (seconds)
 CHAIN_DELAY_S = 2
 
+# Maximum number of chains downloaded concurrently
+DOWNLOAD_WORKERS = 4
+
+# Parser engines (see parse_downloaded_data)
+ENGINE_CSV = "csv"
+ENGINE_XML = "xml"
+
+# Price file types published by the chains (see delta.py for PRICE_FILE)
+FILE_PRICE_FULL = "PRICE_FULL_FILE"
+FILE_PRICE = "PRICE_FILE"
+
+# deduplicate_products engines
+DEDUP_PYTHON = "python"
+DEDUP_NUMPY = "numpy"
 
-def download_chain_data(chain_ids):
+
+def download_chain_data(
+    chain_ids, max_workers=DOWNLOAD_WORKERS, origins=None, file_type=FILE_PRICE_FULL, limit=1, cache=None
+):
     """
-    Download PriceFull files for the given chain IDs.
+    Download PriceFull (or, with file_type=FILE_PRICE, delta Price) files
+    for the given chain IDs.
     Uses il-supermarket-scraper to fetch XML data from each chain.
 
+    Chains are downloaded concurrently on a bounded thread pool. Each origin
+    gets its own token-bucket rate limiter (one download per CHAIN_DELAY_S),
+    so chains hosted on the same site are still spaced out while chains on
+    different sites run in parallel. A failing chain never affects the others.
+
+    Args:
+        chain_ids: List of ScraperFactory enum names
+        max_workers: Maximum number of concurrent chain downloads (1 = sequential)
+        origins: dict mapping chain_id to the host it downloads from
+            (default: every chain is its own origin)
+        file_type: FILE_PRICE_FULL or FILE_PRICE
+        limit: files per chain (None = every file the chain lists)
+        cache: optional download_cache.DownloadCache. Chains are downloaded
+            into its persistent dump folders, where files already fetched
+            by a previous run aren't downloaded again, and then hard-linked
+            into the data folder
+
     Returns the path to the data folder.
     """
-    from il_supermarket_scarper import ScarpingTask
     from il_supermarket_scarper.scrappers_factory import ScraperFactory
 
+    if origins is None:
+        origins = {}
+
     # Clean previous run data
     for folder in (DATA_FOLDER, OUTPUT_FOLDER):
         if os.path.exists(folder):
@@ -77,53 +133,375 @@ def download_chain_data(chain_ids):
         logger.error("No valid scrapers found. Aborting download.")
         return DATA_FOLDER
 
-    for i, scraper_enum in enumerate(enabled_scrapers):
-        try:
-            logger.info("Downloading data for %s...", scraper_enum.name)
-            task = ScarpingTask(
-                dump_folder_name=DATA_FOLDER,
-                files_types=["PRICE_FULL_FILE"],
-                enabled_scrapers=[scraper_enum],
-                limit=1,
+    limiters = RateLimiterRegistry(rate=1.0 / CHAIN_DELAY_S)
+    workers = max(1, min(max_workers, len(enabled_scrapers)))
+    started = time.monotonic()
+
+    cached = {}
+    if cache is not None:
+        cached = {scraper_enum.name: cache.dump_files(scraper_enum.name) for scraper_enum in enabled_scrapers}
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="download") as pool:
+        futures = [
+            pool.submit(
+                _download_chain,
+                scraper_enum,
+                limiters.get(origins.get(scraper_enum.name, scraper_enum.name)),
+                dump_folder=cache.dump_folder(scraper_enum.name) if cache is not None else None,
+                file_type=file_type,
+                limit=limit,
             )
-            task.start()
-            logger.info("Completed download for %s", scraper_enum.name)
-        except Exception:
-            logger.exception("Failed to download %s — continuing with others", scraper_enum.name)
-
-        if i < len(enabled_scrapers) - 1:
-            time.sleep(CHAIN_DELAY_S)
+            for scraper_enum in enabled_scrapers
+        ]
+        results = [future.result() for future in futures]
+    succeeded = sum(results)
+
+    if cache is not None:
+        # Only chains downloaded this run: a failed chain's dumps are from an earlier one
+        for scraper_enum, ok in zip(enabled_scrapers, results):
+            if ok:
+                cache.finish_download(scraper_enum.name, cached[scraper_enum.name], limit=limit)
+                _link_tree(cache.dump_folder(scraper_enum.name), DATA_FOLDER)
 
+    logger.info(
+        "Downloaded %d/%d chains in %.1fs (%d workers)",
+        succeeded,
+        len(enabled_scrapers),
+        time.monotonic() - started,
+        workers,
+    )
     return DATA_FOLDER
 
 
-def parse_downloaded_data(data_folder):
+def _download_chain(scraper_enum, limiter, dump_folder=None, file_type=FILE_PRICE_FULL, limit=1):
+    """
+    Download the PriceFull file (or `file_type` files, up to `limit`) of a
+    single chain (into dump_folder, default DATA_FOLDER).
+
+    Waits on the chain origin's rate limiter first. Never raises: failures
+    are logged and reported as False so one chain can't abort the others.
+    """
+    from il_supermarket_scarper import ScarpingTask
+
+    try:
+        waited = limiter.acquire()
+        if waited:
+            logger.info("Rate limited %s for %.1fs", scraper_enum.name, waited)
+
+        logger.info("Downloading data for %s...", scraper_enum.name)
+        task = ScarpingTask(
+            dump_folder_name=str(dump_folder or DATA_FOLDER),
+            files_types=[file_type],
+            enabled_scrapers=[scraper_enum],
+            limit=limit,
+        )
+        task.start()
+        logger.info("Completed download for %s", scraper_enum.name)
+        return True
+    except Exception:
+        logger.exception("Failed to download %s — continuing with others", scraper_enum.name)
+        return False
+
+
+def stream_chain_data(
+    chain_ids,
+    engine=ENGINE_CSV,
+    max_workers=DOWNLOAD_WORKERS,
+    origins=None,
+    disk_budget_mb=0,
+    memory_limit_mb=0,
+    metrics=None,
+    row_filter=None,
+    limit=1,
+    barcode_index=None,
+    track_prices=False,
+):
+    """
+    Download, parse and aggregate chains one at a time, deleting each
+    chain's raw dumps and converted output as soon as its records are
+    aggregated.
+
+    Each chain gets private scratch folders under DATA_FOLDER and
+    OUTPUT_FOLDER, so chains can run concurrently (up to max_workers,
+    further limited by the disk budget, see disk_budget.DiskBudget).
+    Per-chain partial aggregates are merged in chain_ids order, so the
+    result matches download_chain_data + aggregate_downloaded_data.
+
+    The download cache isn't used: its converted output would outlive each
+    chain's scratch folders (they'd only hold hard links to it), so
+    deleting them would free nothing and the disk budget would miss it.
+
+    Args:
+        chain_ids: List of ScraperFactory enum names
+        engine: ENGINE_CSV or ENGINE_XML
+        max_workers: Maximum number of chains in flight
+        origins: dict mapping chain_id to the host it downloads from
+        disk_budget_mb: scratch-space budget in MB (0 = unlimited)
+        memory_limit_mb: aggregate table budget (see spill.SpillingAggregator)
+        metrics: optional metrics.MetricsCollector ("stream" stage)
+        row_filter: optional filters.RowFilter applied as rows are read
+        limit: PriceFull files per chain (None = every store's file)
+        barcode_index: optional barcodes.BarcodeIndex; records are keyed
+            by canonical barcode
+        track_prices: keep a price sketch per barcode (for price quantiles)
+
+    Returns:
+        (aggregates, record_count)
+    """
+    from il_supermarket_scarper.scrappers_factory import ScraperFactory
+
+    if engine not in (ENGINE_CSV, ENGINE_XML):
+        raise ValueError(f"Unknown parser engine: {engine!r}")
+    origins = origins or {}
+    metrics = metrics or MetricsCollector(emit=False)
+
+    for folder in (DATA_FOLDER, OUTPUT_FOLDER):
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+        os.makedirs(folder, exist_ok=True)
+
+    scrapers = []
+    for chain_id in chain_ids:
+        try:
+            scrapers.append(ScraperFactory[chain_id])
+        except KeyError:
+            logger.error("Unknown chain ID: %s — skipping", chain_id)
+
+    budget = DiskBudget(disk_budget_mb, [DATA_FOLDER, OUTPUT_FOLDER])
+    limiters = RateLimiterRegistry(rate=1.0 / CHAIN_DELAY_S)
+    # Conversions run one at a time (ConvertingTask isn't known to be thread-safe)
+    convert_lock = threading.Lock()
+    spiller = SpillingAggregator(memory_limit_mb, track_prices=track_prices) if memory_limit_mb else None
+    aggregates = {}
+    record_count = 0
+
+    # One filter per chain thread; counts are folded in as chains finish
+    chain_filters = [row_filter.fork() if row_filter is not None else None for _ in scrapers]
+    chain_indexes = [barcode_index.fork() if barcode_index is not None else None for _ in scrapers]
+
+    with metrics.stage("stream") as stage:
+        workers = max(1, min(max_workers, len(scrapers)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chain") as pool:
+            futures = [
+                pool.submit(
+                    _stream_chain,
+                    scraper_enum,
+                    limiters.get(origins.get(scraper_enum.name, scraper_enum.name)),
+                    budget,
+                    engine,
+                    convert_lock,
+                    chain_filter,
+                    limit,
+                    chain_index,
+                    track_prices,
+                )
+                for scraper_enum, chain_filter, chain_index in zip(scrapers, chain_filters, chain_indexes)
+            ]
+            # Merge in chain order; later chains wait in their futures
+            for future, chain_filter, chain_index in zip(futures, chain_filters, chain_indexes):
+                partial, count = future.result()
+                if chain_filter is not None:
+                    row_filter.add_counts(chain_filter.stats())
+                if chain_index is not None:
+                    barcode_index.update(chain_index)
+                if spiller is None:
+                    merge_aggregates(aggregates, partial)
+                else:
+                    spiller.merge(partial.items())
+                record_count += count
+
+        if spiller is not None:
+            aggregates = spiller.finish()
+            stage.extra["spill"] = spiller.stats
+        stage.records_out = record_count
+        stage.extra["barcodes"] = len(aggregates)
+        stage.extra["disk"] = budget.stats()
+        if row_filter is not None:
+            stage.extra["rowFilter"] = row_filter.stats()
+        if barcode_index is not None:
+            stage.extra["barcodeIndex"] = barcode_index.stats()
+
+    logger.info(
+        "Streamed %d chains: %d records, disk high-water %.0f MB",
+        len(scrapers),
+        record_count,
+        budget.high_water_bytes / (1024 * 1024),
+    )
+    return aggregates, record_count
+
+
+def _stream_chain(
+    scraper_enum,
+    limiter,
+    budget,
+    engine,
+    convert_lock,
+    row_filter=None,
+    limit=1,
+    barcode_index=None,
+    track_prices=False,
+):
+    """Download → parse → aggregate one chain in private scratch folders, then delete them."""
+    chain = scraper_enum.name
+    data_root = Path(DATA_FOLDER) / chain
+    output_root = Path(OUTPUT_FOLDER) / chain
+
+    with budget.admit(chain):
+        try:
+            if not _download_chain(scraper_enum, limiter, dump_folder=data_root, limit=limit):
+                return {}, 0
+            budget.record(chain, data_root)
+
+            if engine == ENGINE_XML:
+                records = iter_raw_xml(data_root, row_filter=row_filter, barcode_index=barcode_index)
+            else:
+                with convert_lock:
+                    converted = _convert_downloaded_data(data_root, output_folder=output_root)
+                if not converted:
+                    return {}, 0
+                budget.record(chain, data_root, output_root)
+                # Raw dumps aren't needed once converted
+                shutil.rmtree(data_root, ignore_errors=True)
+                records = iter_parsed_output(output_root, row_filter=row_filter, barcode_index=barcode_index)
+
+            return aggregate_records(records, track_prices=track_prices)
+        except Exception:
+            logger.exception("Failed to process %s — continuing with others", chain)
+            return {}, 0
+        finally:
+            shutil.rmtree(data_root, ignore_errors=True)
+            shutil.rmtree(output_root, ignore_errors=True)
+
+
+def parse_downloaded_data(data_folder, cache=None, engine=ENGINE_CSV):
     """
     Parse the downloaded XML files into structured product data.
-    Uses il-supermarket-parser to convert XMLs into a unified format.
 
-    Returns a list of dicts with keys: ItemCode, ItemName, ItemPrice,
-    ManufacturerName, etc.
+    Two engines are available:
+    - "csv": il-supermarket-parser converts XMLs into CSVs on disk, which
+      are then read back (the original path).
+    - "xml": the raw (optionally gzipped) XMLs are streamed directly with
+      an incremental parser; no intermediate files are written.
+
+    With the "csv" engine and a DownloadCache, every chain folder is looked
+    up in the cache first. Chains whose raw files are unchanged reuse their
+    cached CSV output and skip ConvertingTask entirely; only new or changed
+    chains are converted.
+
+    Returns an iterator of product records (see _row_to_record), so records
+    can be streamed into deduplicate_products without ever being held in
+    memory all at once.
     """
+    if engine == ENGINE_XML:
+        return iter_raw_xml(data_folder)
+    if engine != ENGINE_CSV:
+        raise ValueError(f"Unknown parser engine: {engine!r}")
+
+    if not _convert_downloaded_data(data_folder, cache):
+        return iter(())
+
+    # Read all parsed CSV/JSON output files
+    return iter_parsed_output(OUTPUT_FOLDER)
+
+
+def _convert_downloaded_data(data_folder, cache=None, output_folder=None):
+    """
+    Run ConvertingTask over data_folder into output_folder (default
+    OUTPUT_FOLDER), through the download cache when given. Returns False
+    if conversion failed.
+    """
+    output_folder = str(output_folder or OUTPUT_FOLDER)
+    if cache is not None:
+        _convert_with_cache(data_folder, cache, output_folder)
+        return True
+
     from il_supermarket_parsers import ConvertingTask
 
     try:
         task = ConvertingTask(
-            data_folder=data_folder,
-            output_folder=OUTPUT_FOLDER,
+            data_folder=str(data_folder),
+            output_folder=output_folder,
         )
         task.run()
     except Exception:
         logger.exception("Failed to parse downloaded data")
-        return []
+        return False
+    return True
 
-    # Read all parsed CSV/JSON output files
-    return _read_parsed_output(OUTPUT_FOLDER)
 
+def _convert_with_cache(data_folder, cache, output_folder=None):
+    """
+    Convert each chain folder under data_folder into <output_folder>/<chain>
+    (default OUTPUT_FOLDER), reusing cached output for chains whose raw
+    files are unchanged.
+    """
+    data_path = Path(data_folder)
+    if not data_path.is_dir():
+        return
+
+    for chain_dir in sorted(p for p in data_path.iterdir() if p.is_dir()):
+        chain = chain_dir.name
+        raw_files = sorted(p for p in chain_dir.rglob("*") if p.is_file())
+        if not raw_files:
+            continue
 
-def _read_parsed_output(output_folder, chain_names_map=None):
+        files = cache.describe(chain, raw_files)
+        output_dir = cache.lookup(chain, files)
+        if output_dir is None:
+            output_dir = cache.output_dir_for(chain, files)
+            try:
+                _convert_chain(chain_dir, output_dir)
+            except Exception:
+                logger.exception("Failed to parse %s — skipping", chain)
+                shutil.rmtree(output_dir, ignore_errors=True)
+                continue
+            cache.store(chain, files, output_dir)
+        else:
+            logger.info("Reusing cached output for %s", chain)
+
+        _link_tree(output_dir, Path(output_folder or OUTPUT_FOLDER) / chain)
+
+    cache.log_stats()
+    cache.save()
+
+
+def _convert_chain(chain_dir, output_dir):
+    """Run ConvertingTask on a single chain folder."""
+    import tempfile
+
+    from il_supermarket_parsers import ConvertingTask
+
+    staging = Path(tempfile.mkdtemp(prefix="convert_", dir=Path(DATA_FOLDER).parent))
+    try:
+        # ConvertingTask expects a root folder holding one folder per chain
+        _link_tree(chain_dir, staging / chain_dir.name)
+        os.makedirs(output_dir, exist_ok=True)
+        task = ConvertingTask(data_folder=str(staging), output_folder=str(output_dir))
+        task.run()
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def _link_tree(src, dst):
+    """Mirror the files of src into dst using hard links (copies as fallback)."""
+    src = Path(src)
+    dst = Path(dst)
+    for path in src.rglob("*"):
+        if not path.is_file():
+            continue
+        target = dst / path.relative_to(src)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if target.exists():
+            target.unlink()
+        try:
+            os.link(path, target)
+        except OSError:
+            shutil.copy2(path, target)
+
+
+def iter_parsed_output(output_folder, chain_names_map=None, row_filter=None, barcode_index=None):
     """
-    Read parsed output files and return a flat list of product records.
+    Lazily yield product records from parsed output files, one at a time.
     The parser outputs CSV files with columns like:
     ItemCode, ItemName, ItemPrice, ManufacturerName, etc.
 
@@ -133,77 +511,165 @@ def _read_parsed_output(output_folder, chain_names_map=None):
     Args:
         output_folder: path to parsed output
         chain_names_map: dict mapping chain_id to chain_name (for tracking)
+        row_filter: optional filters.RowFilter applied to each row as it is read
+        barcode_index: optional barcodes.BarcodeIndex; each record's barcode
+            is replaced by its canonical key
     """
     import csv
 
     if chain_names_map is None:
         chain_names_map = {}
 
-    records = []
+    count = 0
     output_path = Path(output_folder)
 
     for csv_file in output_path.rglob("*.csv"):
         try:
-            # Infer chain/supplier from file path (usually chain/store/prices.csv)
-            # Use folder structure to identify which chain this came from
-            rel_path = csv_file.relative_to(output_path)
-            chain_folder = rel_path.parts[0] if rel_path.parts else "unknown"
-
-            # Try to map folder name to a friendly chain name
-            supplier_name = chain_names_map.get(chain_folder, chain_folder.replace("_", " ").title())
+            supplier_name = supplier_for(csv_file, output_path, chain_names_map)
 
             with open(csv_file, "r", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    # Skip rows without essential fields
-                    item_code = row.get("ItemCode", "").strip()
-                    item_name = row.get("ItemName", "").strip()
-                    item_price = row.get("ItemPrice", "").strip()
-
-                    if not item_code or not item_name or not item_price:
-                        continue
-
-                    try:
-                        price = float(item_price)
-                    except (ValueError, TypeError):
-                        continue
-
-                    if price <= 0:
-                        continue
-
-                    records.append(
-                        {
-                            "barcode": item_code,
-                            "name": item_name,
-                            "price": price,
-                            "category": row.get("ManufacturerName", "").strip(),
-                            "supplier": supplier_name,
-                        }
-                    )
+                for record in rows_to_records(
+                    csv.DictReader(f), supplier_name, row_filter, barcode_index
+                ):
+                    count += 1
+                    yield record
         except Exception:
             logger.exception("Failed to read %s — skipping", csv_file)
 
-    logger.info("Parsed %d product records from output files", len(records))
-    return records
+    logger.info("Parsed %d product records from output files", count)
 
 
-def deduplicate_products(records, min_price=0.0, min_suppliers=2, chain_names=None):
+def _read_parsed_output(output_folder, chain_names_map=None):
+    """
+    Read parsed output files and return a flat list of product records.
+    List form of iter_parsed_output().
+    """
+    return list(iter_parsed_output(output_folder, chain_names_map))
+
+
+def read_parsed_columns(output_folder, chain_names_map=None):
+    """
+    Read parsed output files into a columnar.RecordColumns, a compact
+    alternative to _read_parsed_output's list of dicts.
+    """
+    return RecordColumns().extend(iter_parsed_output(output_folder, chain_names_map))
+
+
+def iter_raw_xml(data_folder, chain_names_map=None, row_filter=None, barcode_index=None):
+    """
+    Lazily yield product records straight out of the raw downloaded XML
+    files, bypassing the XML → CSV → DictReader round trip.
+
+    Same record shape, supplier inference, row_filter and barcode_index as
+    iter_parsed_output.
+    """
+    from price_xml import is_price_file, iter_price_rows
+
+    if chain_names_map is None:
+        chain_names_map = {}
+
+    count = 0
+    data_path = Path(data_folder)
+
+    for xml_file in sorted(p for p in data_path.rglob("*") if p.is_file() and is_price_file(p)):
+        try:
+            supplier_name = supplier_for(xml_file, data_path, chain_names_map)
+            for record in rows_to_records(
+                iter_price_rows(xml_file), supplier_name, row_filter, barcode_index
+            ):
+                count += 1
+                yield record
+        except Exception:
+            logger.exception("Failed to read %s — skipping", xml_file)
+
+    logger.info("Parsed %d product records from raw XML files", count)
+
+
+def _read_raw_xml(data_folder, chain_names_map=None):
+    """List form of iter_raw_xml()."""
+    return list(iter_raw_xml(data_folder, chain_names_map))
+
+
+def supplier_for(file_path, root, chain_names_map):
+    """
+    Infer the chain/supplier a file came from by its folder structure
+    (usually chain/store/prices.csv).
+    """
+    rel_path = file_path.relative_to(root)
+    chain_folder = rel_path.parts[0] if rel_path.parts else "unknown"
+
+    # Try to map folder name to a friendly chain name
+    return chain_names_map.get(chain_folder, chain_folder.replace("_", " ").title())
+
+
+def _row_to_record(row, supplier_name):
+    """
+    Convert a raw ItemCode/ItemName/ItemPrice/ManufacturerName row into a
+    product record. Returns None for rows missing essential fields or with
+    a non-positive / unparsable price.
+    """
+    item_code = row.get("ItemCode", "").strip()
+    item_name = row.get("ItemName", "").strip()
+    item_price = row.get("ItemPrice", "").strip()
+
+    if not item_code or not item_name or not item_price:
+        return None
+
+    try:
+        price = float(item_price)
+    except (ValueError, TypeError):
+        return None
+
+    if price <= 0:
+        return None
+
+    return {
+        "barcode": item_code,
+        "name": item_name,
+        "price": price,
+        "category": row.get("ManufacturerName", "").strip(),
+        "supplier": supplier_name,
+    }
+
+
+def deduplicate_products(
+    records,
+    min_price=0.0,
+    min_suppliers=2,
+    chain_names=None,
+    memory_limit_mb=0,
+    engine=DEDUP_PYTHON,
+    price_quantiles=None,
+    barcode_index=None,
+):
     """
     Deduplicate product records by barcode with multi-supplier filtering.
 
     For each barcode:
-    - Collect all observed prices → compute min/max for priceRange
-    - Use the most common name across records (after cleaning chain names)
+    - Track the running min/max price for priceRange
+    - Use the most common name across records (after cleaning chain names;
+      spelling variants are counted together, see names.canonical_name)
     - Use the most common category
     - Track which suppliers (chains) have this product
     - Filter to products appearing in at least min_suppliers chains
     - Remove products with 'במשקל' (by weight) in name
 
     Args:
-        records: List of product records from parser
+        records: Iterable of product records from parser (consumed once),
+            or a columnar.RecordColumns (see read_parsed_columns)
         min_price: Minimum price threshold (default: 0.0)
         min_suppliers: Minimum number of chains a product must appear in (default: 2)
         chain_names: List of chain names to remove from product names (default: None)
+        memory_limit_mb: Budget for the per-barcode table; above it, aggregates
+            are spilled to disk and merged back (0 = unlimited, in memory)
+        engine: DEDUP_PYTHON, or DEDUP_NUMPY for the vectorized engine in
+            dedup_numpy (needs numpy; holds all records as columns, so
+            memory_limit_mb doesn't apply)
+        price_quantiles: (low, high) quantiles for priceRange (default:
+            min–max, see finalize_products)
+        barcode_index: optional barcodes.BarcodeIndex; records are grouped
+            (and the result keyed) by canonical barcode, so "0729…" and
+            "729…" count as one product
 
     Returns dict keyed by barcode:
     {
@@ -215,41 +681,91 @@ def deduplicate_products(records, min_price=0.0, min_suppliers=2, chain_names=No
         }
     }
     """
-    from collections import Counter
-
-    if chain_names is None:
-        chain_names = []
-
-    buckets = {}
-
-    for rec in records:
-        barcode = rec["barcode"]
-        if barcode not in buckets:
-            buckets[barcode] = {"names": [], "prices": [], "categories": [], "suppliers": set()}
+    if barcode_index is not None:
+        records = barcode_index.normalize_records(records)
+
+    if engine == DEDUP_NUMPY:
+        from dedup_numpy import deduplicate_columns
+
+        return deduplicate_columns(
+            records,
+            min_price=min_price,
+            min_suppliers=min_suppliers,
+            chain_names=chain_names,
+            price_quantiles=price_quantiles,
+        )
+    if engine != DEDUP_PYTHON:
+        raise ValueError(f"Unknown dedup engine: {engine!r}")
+
+    # The price sketch is only needed for quantile ranges
+    track_prices = price_quantiles is not None
+    if memory_limit_mb:
+        spiller = SpillingAggregator(memory_limit_mb, track_prices=track_prices)
+        record_count = spiller.add_records(records)
+        aggregates = spiller.finish()
+    else:
+        aggregates, record_count = aggregate_records(records, track_prices=track_prices)
+    try:
+        return finalize_products(
+            aggregates,
+            min_price=min_price,
+            min_suppliers=min_suppliers,
+            chain_names=chain_names,
+            record_count=record_count,
+            price_quantiles=price_quantiles,
+        )
+    finally:
+        if hasattr(aggregates, "close"):
+            aggregates.close()
+
+
+def finalize_products(
+    aggregates,
+    min_price=0.0,
+    min_suppliers=2,
+    chain_names=None,
+    record_count=None,
+    name_cleaner=None,
+    price_quantiles=None,
+):
+    """
+    Reduce per-barcode aggregates into the final product dict and apply
+    the price, weight and supplier-count filters.
 
-        buckets[barcode]["names"].append(rec["name"])
-        buckets[barcode]["prices"].append(rec["price"])
-        if rec.get("category"):
-            buckets[barcode]["categories"].append(rec["category"])
-        if rec.get("supplier"):
-            buckets[barcode]["suppliers"].add(rec["supplier"])
+    Args:
+        aggregates: dict of barcode → aggregate.BarcodeAggregate
+        min_price: Minimum price threshold (default: 0.0)
+        min_suppliers: Minimum number of chains a product must appear in (default: 2)
+        chain_names: List of chain names to remove from product names (default: None)
+        record_count: Number of input records, for logging only
+        name_cleaner: names.NameCleaner to reuse (default: one built from
+            chain_names); pass one in to read its cache stats afterwards
+        price_quantiles: (low, high) quantiles in [0, 1] for priceRange,
+            e.g. (0.1, 0.9) so one outlier store doesn't stretch it
+            (default: min–max); the aggregates must track prices
+
+    Returns the same dict shape as deduplicate_products().
+    """
+    if name_cleaner is None:
+        name_cleaner = NameCleaner(chain_names or [])
 
     products = {}
     filtered_out = {"price": 0, "weight": 0, "suppliers": 0}
 
-    for barcode, data in buckets.items():
-        prices = data["prices"]
-        min_p = min(prices)
-        max_p = max(prices)
+    for barcode, data in aggregates.items():
+        min_p = data.min_price
+        max_p = data.max_price
 
         # Skip products below minimum price threshold
         if max_p < min_price:
             filtered_out["price"] += 1
             continue
 
-        # Most common name (after cleaning chain names from source data)
-        cleaned_names = [clean_product_name(n, chain_names) for n in data["names"]]
-        name = Counter(cleaned_names).most_common(1)[0][0]
+        # Most common name (after cleaning chain names from source data),
+        # voted over canonical keys so spelling variants count together.
+        # Tallies keep first-seen order so ties resolve exactly as a
+        # per-record Counter would.
+        name = vote_name(data.names.items(), name_cleaner.normalize)
 
         # Skip products marked 'במשקל' (by weight, requires scale)
         if "במשקל" in name:
@@ -257,33 +773,37 @@ def deduplicate_products(records, min_price=0.0, min_suppliers=2, chain_names=No
             continue
 
         # Skip products not in enough suppliers
-        if len(data["suppliers"]) < min_suppliers:
+        if len(data.suppliers) < min_suppliers:
             filtered_out["suppliers"] += 1
             continue
 
         # Most common category (or empty string)
         category = ""
-        if data["categories"]:
-            category = Counter(data["categories"]).most_common(1)[0][0]
+        if data.categories:
+            category = data.categories.most_common(1)[0][0]
 
-        # Format price range
-        if min_p == max_p:
-            price_range = f"₪{min_p:.0f}"
+        # Format price range (min–max, or the configured quantiles)
+        if price_quantiles is None:
+            low, high = min_p, max_p
+        else:
+            low, high = (data.price_quantile(q) for q in price_quantiles)
+        if low == high:
+            price_range = f"₪{low:.0f}"
         else:
-            price_range = f"₪{min_p:.0f}–{max_p:.0f}"
+            price_range = f"₪{low:.0f}–{high:.0f}"
 
         products[barcode] = {
             "name": name,
             "priceRange": price_range,
             "category": category,
-            "suppliers": sorted(list(data["suppliers"])),
+            "suppliers": sorted(list(data.suppliers)),
         }
 
     logger.info(
-        "Deduplicated %d records into %d unique products "
+        "Deduplicated %s records into %d unique products "
         "(min_price=%.1f, min_suppliers=%d). "
         "Filtered out: %d by price, %d by weight, %d by supplier count",
-        len(records),
+        record_count if record_count is not None else "?",
         len(products),
         min_price,
         min_suppliers,
@@ -292,3 +812,172 @@ def deduplicate_products(records, min_price=0.0, min_suppliers=2, chain_names=No
         filtered_out["suppliers"],
     )
     return products
+
+
+def aggregate_downloaded_data(
+    data_folder,
+    cache=None,
+    engine=ENGINE_CSV,
+    workers=1,
+    metrics=None,
+    memory_limit_mb=0,
+    row_filter=None,
+    barcode_index=None,
+    track_prices=False,
+):
+    """
+    Parse downloaded data and fold it into per-barcode aggregates.
+
+    With workers > 1, each parsed file is read and pre-aggregated in its
+    own process (ProcessPoolExecutor) and the partials are merged in the
+    parent in file order, so the result is identical to the single-process
+    path.
+
+    Conversion (csv engine only) and reading are timed as the "convert"
+    and "read" stages of `metrics` (a metrics.MetricsCollector).
+
+    With memory_limit_mb > 0 the aggregate table is kept under that budget
+    by spilling to disk (see spill.SpillingAggregator); aggregates is then
+    a spill.SpilledAggregates once anything was spilled.
+
+    With a filters.RowFilter, rows it rejects are dropped as they are read
+    and its per-filter counts are reported in the "read" stage.
+
+    With a barcodes.BarcodeIndex, records are keyed by canonical barcode
+    (see barcodes.normalize_barcode) and the index stats are reported too.
+
+    With track_prices, each aggregate keeps a price sketch for quantiles
+    (see aggregate.BarcodeAggregate).
+
+    Returns:
+        (aggregates, record_count) — record_count counts the rows kept
+    """
+    metrics = metrics or MetricsCollector(emit=False)
+
+    if engine == ENGINE_XML:
+        root = Path(data_folder)
+    elif engine == ENGINE_CSV:
+        with metrics.stage("convert") as stage:
+            stage.bytes_read = folder_size(data_folder)
+            converted = _convert_downloaded_data(data_folder, cache)
+            if cache is not None:
+                stage.extra["cache"] = {
+                    "hits": sum(s["hits"] for s in cache.stats.values()),
+                    "misses": sum(s["misses"] for s in cache.stats.values()),
+                }
+        if not converted:
+            return {}, 0
+        root = Path(OUTPUT_FOLDER)
+    else:
+        raise ValueError(f"Unknown parser engine: {engine!r}")
+
+    with metrics.stage("read") as stage:
+        stage.bytes_read = folder_size(root)
+        spiller = SpillingAggregator(memory_limit_mb, track_prices=track_prices) if memory_limit_mb else None
+        if workers <= 1:
+            if engine == ENGINE_XML:
+                records = iter_raw_xml(root, row_filter=row_filter, barcode_index=barcode_index)
+            else:
+                records = iter_parsed_output(root, row_filter=row_filter, barcode_index=barcode_index)
+            if spiller is None:
+                aggregates, record_count = aggregate_records(records, track_prices=track_prices)
+            else:
+                record_count = spiller.add_records(records)
+        else:
+            aggregates, record_count = _aggregate_in_processes(
+                root, engine, workers, spiller, row_filter, barcode_index, track_prices
+            )
+        if spiller is not None:
+            aggregates = spiller.finish()
+            stage.extra["spill"] = spiller.stats
+        stage.records_out = record_count
+        stage.extra["barcodes"] = len(aggregates)
+        if row_filter is not None:
+            stage.extra["rowFilter"] = row_filter.stats()
+        if barcode_index is not None:
+            stage.extra["barcodeIndex"] = barcode_index.stats()
+
+    return aggregates, record_count
+
+
+def _aggregate_in_processes(
+    root, engine, workers, spiller=None, row_filter=None, barcode_index=None, track_prices=False
+):
+    if engine == ENGINE_XML:
+        from price_xml import is_price_file
+
+        files = sorted(p for p in root.rglob("*") if p.is_file() and is_price_file(p))
+    else:
+        files = list(root.rglob("*.csv"))
+
+    aggregates = {}
+    record_count = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Workers resolve barcodes in empty forks, folded back in file order
+        worker_index = barcode_index.fork() if barcode_index is not None else None
+        tasks = [(str(path), str(root), engine, row_filter, worker_index, track_prices) for path in files]
+        for partial, count, filter_stats, file_index in pool.map(_aggregate_file, tasks):
+            if spiller is None:
+                merge_aggregates(aggregates, partial)
+            else:
+                spiller.merge(partial.items())
+            record_count += count
+            if row_filter is not None:
+                row_filter.add_counts(filter_stats)
+            if barcode_index is not None and file_index is not None:
+                barcode_index.update(file_index)
+
+    logger.info(
+        "Aggregated %d records from %d files with %d worker processes",
+        record_count,
+        len(files),
+        workers,
+    )
+    return aggregates, record_count
+
+
+def _aggregate_file(task):
+    """
+    Process-pool worker: read and pre-aggregate a single parsed file.
+
+    Returns:
+        (aggregates, record_count, row filter stats or None, barcode index or None)
+    """
+    path, root, engine, row_filter, barcode_index, track_prices = task
+    path = Path(path)
+    root = Path(root)
+    supplier_name = supplier_for(path, root, {})
+
+    def result(aggregated):
+        return (*aggregated, row_filter.stats() if row_filter is not None else None, barcode_index)
+
+    try:
+        if engine == ENGINE_XML:
+            from price_xml import iter_price_rows
+
+            rows = iter_price_rows(path)
+            records = rows_to_records(rows, supplier_name, row_filter, barcode_index)
+            return result(aggregate_records(records, track_prices=track_prices))
+
+        import csv
+
+        with open(path, "r", encoding="utf-8") as f:
+            records = rows_to_records(csv.DictReader(f), supplier_name, row_filter, barcode_index)
+            return result(aggregate_records(records, track_prices=track_prices))
+    except Exception:
+        logger.exception("Failed to read %s — skipping", path)
+        return {}, 0, None, None
+
+
+def rows_to_records(rows, supplier_name, row_filter=None, barcode_index=None):
+    """
+    Lazily convert raw rows into product records, dropping invalid ones
+    and, with a filters.RowFilter, the ones it rejects. With a
+    barcodes.BarcodeIndex, barcodes are replaced by their canonical key.
+    """
+    for row in rows:
+        record = _row_to_record(row, supplier_name)
+        if record is not None and (row_filter is None or row_filter.accept(record)):
+            if barcode_index is not None:
+                record["barcode"] = barcode_index.key(record["barcode"])
+            yield record
@@ -0,0 +1,276 @@
+"""
+Compact weekly price history per barcode.
+
+Each import run records, for every synced product, its min, max and
+median price and supplier count in the chunk file of the run's week:
+
+    HISTORY_FOLDER/<monday YYYY-MM-DD>.phc
+
+Chunks are append-only across weeks: a run only ever (re)writes the chunk
+of the current week (the latest run of a week wins), older weeks are never
+touched. A chunk is laid out for random access without loading it:
+
+    header   magic "PHC1", week start (days since 1970-01-01), entry count,
+             offsets of the key and value blocks
+    keys     barcodes sorted by their UTF-8 bytes, plus a u32 offset table
+    values   per entry, varints: min price in agorot, then max − min,
+             median − min and the supplier count, plus a u32 offset table
+
+Prices within an entry are delta-encoded against the minimum, so most
+entries take 5–8 bytes. Values are stored row-wise (one varint record per
+barcode), and weeks aren't delta-encoded against each other: a columnar
+layout or cross-week deltas would mean decoding other entries or older
+chunks to read one barcode's week. HistoryChunk memory-maps a chunk and
+binary-searches the key offsets, so PriceHistory.query() for a handful of
+barcodes over the last N weeks reads a few pages per chunk and returns in
+milliseconds.
+
+HISTORY_FOLDER (IMPORT_HISTORY_DIR) must survive between runs (a mounted
+volume on Cloud Run).
+"""
+
+import logging
+import mmap
+import os
+import struct
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+HISTORY_FOLDER = os.environ.get("IMPORT_HISTORY_DIR", "/tmp/supermarket_history")
+
+CHUNK_SUFFIX = ".phc"
+MAGIC = b"PHC1"
+# magic, week start (days), entry count, keys offset, values offset
+_HEADER = struct.Struct("<4sIIQQ")
+_OFFSET = struct.Struct("<I")
+_EPOCH = date(1970, 1, 1)
+
+
+def week_start(day=None):
+    """Monday of the week containing `day` (default: today, UTC)."""
+    day = day or datetime.now(timezone.utc).date()
+    return day - timedelta(days=day.weekday())
+
+
+def encode_varint(value, out):
+    """Append unsigned LEB128 `value` to bytearray `out`."""
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(buf, pos):
+    """(value, next position) of the unsigned LEB128 varint at buf[pos]."""
+    value = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _agorot(price):
+    return max(0, int(round(price * 100)))
+
+
+def encode_entry(min_price, max_price, median_price, suppliers):
+    """Varint-encoded (min, max − min, median − min, suppliers); prices in agorot."""
+    low = _agorot(min_price)
+    out = bytearray()
+    encode_varint(low, out)
+    encode_varint(max(0, _agorot(max_price) - low), out)
+    encode_varint(max(0, _agorot(median_price) - low), out)
+    encode_varint(suppliers, out)
+    return out
+
+
+def decode_entry(buf, pos=0):
+    """(min, max, median, suppliers) of the entry at buf[pos]; prices in shekels."""
+    low, pos = decode_varint(buf, pos)
+    spread, pos = decode_varint(buf, pos)
+    median, pos = decode_varint(buf, pos)
+    suppliers, pos = decode_varint(buf, pos)
+    return low / 100, (low + spread) / 100, (low + median) / 100, suppliers
+
+
+def write_chunk(path, week, entries):
+    """
+    Atomically write a week's chunk.
+
+    Args:
+        path: chunk file path
+        week: week start date
+        entries: iterable of (barcode, (min, max, median, suppliers))
+
+    Returns:
+        number of entries written
+    """
+    encoded = sorted((barcode.encode("utf-8"), encode_entry(*stats)) for barcode, stats in entries)
+
+    keys = bytearray()
+    key_offsets = bytearray()
+    values = bytearray()
+    value_offsets = bytearray()
+    for key, value in encoded:
+        key_offsets += _OFFSET.pack(len(keys))
+        keys += key
+        value_offsets += _OFFSET.pack(len(values))
+        values += value
+    key_offsets += _OFFSET.pack(len(keys))
+    value_offsets += _OFFSET.pack(len(values))
+
+    keys_at = _HEADER.size
+    values_at = keys_at + len(key_offsets) + len(keys)
+    header = _HEADER.pack(MAGIC, (week - _EPOCH).days, len(encoded), keys_at, values_at)
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(header)
+        f.write(key_offsets)
+        f.write(keys)
+        f.write(value_offsets)
+        f.write(values)
+    os.replace(tmp, path)
+    return len(encoded)
+
+
+class HistoryChunk:
+    """Read-only, memory-mapped view of one week's chunk."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, days, self.count, keys_at, values_at = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"{self.path} is not a price history chunk")
+        self.week = _EPOCH + timedelta(days=days)
+        self._key_offsets = keys_at
+        self._keys = keys_at + (self.count + 1) * _OFFSET.size
+        self._value_offsets = values_at
+        self._values = values_at + (self.count + 1) * _OFFSET.size
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _offset(self, table, i):
+        return _OFFSET.unpack_from(self._map, table + i * _OFFSET.size)[0]
+
+    def _key(self, i):
+        start = self._offset(self._key_offsets, i)
+        end = self._offset(self._key_offsets, i + 1)
+        return self._map[self._keys + start : self._keys + end]
+
+    def _find(self, key):
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            if self._key(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self.count and self._key(low) == key:
+            return low
+        return None
+
+    def get(self, barcode):
+        """(min, max, median, suppliers) of `barcode` this week, or None."""
+        i = self._find(barcode.encode("utf-8"))
+        if i is None:
+            return None
+        return decode_entry(self._map, self._values + self._offset(self._value_offsets, i))
+
+    def items(self):
+        """Yield (barcode, (min, max, median, suppliers)) in key order."""
+        for i in range(self.count):
+            stats = decode_entry(self._map, self._values + self._offset(self._value_offsets, i))
+            yield self._key(i).decode("utf-8"), stats
+
+
+class PriceHistory:
+    """Weekly chunks under a folder; open chunks are memory-mapped and kept."""
+
+    def __init__(self, folder=None):
+        self.folder = Path(folder or HISTORY_FOLDER)
+        self._chunks = {}
+
+    def _path(self, week):
+        return self.folder / f"{week.isoformat()}{CHUNK_SUFFIX}"
+
+    def weeks(self):
+        """Week start dates that have a chunk, oldest first."""
+        if not self.folder.is_dir():
+            return []
+        return sorted(date.fromisoformat(p.name[: -len(CHUNK_SUFFIX)]) for p in self.folder.glob("*" + CHUNK_SUFFIX))
+
+    def record_run(self, aggregates, barcodes=None, day=None):
+        """
+        Write this week's chunk from per-barcode aggregates.
+
+        Args:
+            aggregates: barcode → aggregate.BarcodeAggregate (dict or
+                spill.SpilledAggregates)
+            barcodes: only record these barcodes (e.g. the synced products)
+            day: date of the run (default: today, UTC)
+
+        Returns:
+            number of barcodes recorded
+        """
+        week = week_start(day)
+        entries = (
+            (barcode, (agg.min_price, agg.max_price, agg.price_quantile(0.5), len(agg.suppliers)))
+            for barcode, agg in aggregates.items()
+            if barcodes is None or barcode in barcodes
+        )
+        stale = self._chunks.pop(week, None)
+        if stale is not None:
+            stale.close()
+        count = write_chunk(self._path(week), week, entries)
+        logger.info("Recorded price history of %d barcodes for the week of %s", count, week)
+        return count
+
+    def chunk(self, week):
+        chunk = self._chunks.get(week)
+        if chunk is None:
+            chunk = self._chunks[week] = HistoryChunk(self._path(week))
+        return chunk
+
+    def query(self, barcodes, weeks=12):
+        """
+        Last `weeks` weeks of history for `barcodes`.
+
+        Returns:
+            {barcode: [(week start, min, max, median, suppliers), ...]},
+            oldest week first; weeks a barcode wasn't recorded are left out
+        """
+        result = {barcode: [] for barcode in barcodes}
+        for week in self.weeks()[-weeks:] if weeks > 0 else []:
+            chunk = self.chunk(week)
+            for barcode in result:
+                stats = chunk.get(barcode)
+                if stats is not None:
+                    result[barcode].append((week, *stats))
+        return result
+
+    def close(self):
+        for chunk in self._chunks.values():
+            chunk.close()
+        self._chunks = {}
@@ -0,0 +1,132 @@
+"""
+Streaming reader for raw PriceFull / Price XML files.
+
+Alternative to il-supermarket-parser's ConvertingTask: instead of writing
+CSVs to disk and reading them back, the (optionally gzipped or zipped)
+XML is read incrementally with ElementTree.iterparse. Every item is
+emitted as a row dict with the same column names the CSV converter uses
+(ItemCode, ItemName, ItemPrice, ManufacturerName), then cleared from the
+tree, so memory stays flat regardless of file size.
+
+Chains differ in casing and wrapper tags (<Items><Item> vs
+<Products><Product>), so tags are matched case-insensitively.
+"""
+
+import gzip
+import io
+import logging
+import zipfile
+import xml.etree.ElementTree as ET
+
+logger = logging.getLogger(__name__)
+
+# Element names (lowercase, namespace stripped) that hold a single price row
+ITEM_TAGS = {"item", "product"}
+
+# Lowercase XML child tag → output column name
+FIELD_TAGS = {
+    "itemcode": "ItemCode",
+    "itemname": "ItemName",
+    "itemprice": "ItemPrice",
+    "manufacturername": "ManufacturerName",
+}
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZIP_MAGIC = b"PK"
+
+
+def _local_name(tag):
+    """Strip an XML namespace and lowercase the tag."""
+    if "}" in tag:
+        tag = tag.rsplit("}", 1)[1]
+    return tag.lower()
+
+
+class _ZipMember(io.BufferedIOBase):
+    """The first member of a zip archive; closing it also closes the archive."""
+
+    def __init__(self, archive, name):
+        self._archive = archive
+        self._stream = archive.open(name)
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        return self._stream.read(size)
+
+    def read1(self, size=-1):
+        return self._stream.read1(size)
+
+    def readinto(self, buffer):
+        return self._stream.readinto(buffer)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self._stream.close()
+        finally:
+            self._archive.close()
+            super().close()
+
+
+def open_price_file(path):
+    """
+    Open a raw price file as a binary stream, transparently handling
+    gzip and zip compression (detected from magic bytes, not extension).
+    """
+    with open(path, "rb") as f:
+        magic = f.read(2)
+
+    if magic == _GZIP_MAGIC:
+        return gzip.open(path, "rb")
+    if magic == _ZIP_MAGIC:
+        archive = zipfile.ZipFile(path)
+        members = [n for n in archive.namelist() if not n.endswith("/")]
+        if not members:
+            archive.close()
+            return io.BytesIO(b"")
+        try:
+            return _ZipMember(archive, members[0])
+        except BaseException:
+            archive.close()
+            raise
+    return open(path, "rb")
+
+
+def iter_price_rows(path):
+    """
+    Yield one row dict per item element in a price XML file.
+
+    Rows contain the FIELD_TAGS column names; missing fields are "".
+    Processed elements are cleared and detached from their parent as
+    soon as they are consumed.
+    """
+    with open_price_file(path) as stream:
+        stack = []
+        for event, elem in ET.iterparse(stream, events=("start", "end")):
+            if event == "start":
+                stack.append(elem)
+                continue
+
+            stack.pop()
+            if _local_name(elem.tag) not in ITEM_TAGS:
+                continue
+
+            row = dict.fromkeys(FIELD_TAGS.values(), "")
+            for child in elem:
+                column = FIELD_TAGS.get(_local_name(child.tag))
+                if column:
+                    row[column] = (child.text or "").strip()
+
+            elem.clear()
+            if stack:
+                stack[-1].remove(elem)
+
+            yield row
+
+
+def is_price_file(path):
+    """True for raw price dumps (.xml, .gz, .zip) as written by the scraper."""
+    return path.suffix.lower() in {".xml", ".gz", ".zip"}
@@ -0,0 +1,201 @@
+"""
+Compact in-memory index of the products already imported into Firestore.
+
+Only what the sync stage needs is kept per barcode: the document ID, a
+short fingerprint of the synced fields (name, priceRange, category), the
+status and lastImportedAt. Documents are loaded with a field projection
+and read concurrently across document-ID partitions.
+"""
+
+import hashlib
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timezone
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+# Fields requested from Firestore (everything else stays server-side)
+INDEX_FIELDS = ["barcode", "name", "priceRange", "category", "status", "lastImportedAt"]
+
+LOAD_PARTITIONS = 8
+
+# Auto-generated document IDs are drawn uniformly from this alphabet
+# (shown here in Firestore's byte order), so splitting it evenly yields
+# evenly sized partitions.
+_AUTO_ID_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+
+def fingerprint(name, price_range, category):
+    """8-byte digest of the synced fields, used for change detection."""
+    payload = "\x1f".join((name or "", price_range or "", category or ""))
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=8).digest()
+
+
+class IndexedProduct(NamedTuple):
+    doc_id: str
+    fingerprint: bytes
+    status: str
+    last_imported_at: object  # datetime or None
+
+
+class ProductIndex:
+    """
+    barcode → IndexedProduct, with helpers used by firestore_sync.
+
+    With a barcodes.BarcodeIndex, documents are indexed by the canonical
+    key of their barcode field, so they match canonically keyed products.
+    Documents imported before that under another raw form of the same
+    barcode (e.g. "0729…" and "729…") then share a key: the most recently
+    imported one is indexed and the others are listed in `duplicates`, as
+    (barcode, IndexedProduct), for the sync to archive.
+    """
+
+    def __init__(self, collection, barcode_index=None):
+        self._collection = collection
+        self._entries = {}
+        self.barcode_index = barcode_index
+        self._duplicates = {}  # doc ID → (barcode, IndexedProduct)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, barcode):
+        return barcode in self._entries
+
+    def __getitem__(self, barcode):
+        return self._entries[barcode]
+
+    @property
+    def duplicates(self):
+        return list(self._duplicates.values())
+
+    def get(self, barcode, default=None):
+        return self._entries.get(barcode, default)
+
+    def items(self):
+        return self._entries.items()
+
+    def update(self, entries):
+        """Add pre-built (barcode, IndexedProduct) pairs."""
+        for barcode, entry in entries:
+            self._put(barcode, entry)
+
+    def add(self, doc_id, data):
+        """Index a (projected) product document. Ignores docs without a barcode."""
+        entry = _index_entry(doc_id, data, self.barcode_index)
+        if entry is not None:
+            self._put(*entry)
+
+    def _put(self, barcode, entry):
+        current = self._entries.get(barcode)
+        if current is None or current.doc_id == entry.doc_id:
+            self._entries[barcode] = entry
+            return
+        if _imported_later(entry, current):
+            current, entry = entry, current
+        self._entries[barcode] = current
+        self._duplicates[entry.doc_id] = (barcode, entry)
+
+    def ref(self, barcode):
+        """DocumentReference of an indexed product."""
+        return self._collection.document(self._entries[barcode].doc_id)
+
+    def document(self, doc_id):
+        """DocumentReference of any product document (e.g. a duplicate)."""
+        return self._collection.document(doc_id)
+
+    def is_unchanged(self, barcode, name, price_range, category):
+        return self._entries[barcode].fingerprint == fingerprint(name, price_range, category)
+
+    def needs_refresh(self, barcode, refresh_cutoff):
+        """True when lastImportedAt is missing or not newer than the cutoff."""
+        last_imported = self._entries[barcode].last_imported_at
+        if not last_imported:
+            return True
+        return last_imported.replace(tzinfo=timezone.utc) <= refresh_cutoff
+
+
+def _imported_later(a, b):
+    """True if IndexedProduct a was imported after b (ties: lower doc ID)."""
+    if a.last_imported_at is None or b.last_imported_at is None:
+        if (a.last_imported_at is None) != (b.last_imported_at is None):
+            return b.last_imported_at is None
+    elif a.last_imported_at != b.last_imported_at:
+        return a.last_imported_at > b.last_imported_at
+    return a.doc_id < b.doc_id
+
+
+def _index_entry(doc_id, data, barcode_index=None):
+    """Compact (barcode, IndexedProduct) for a document, or None without a barcode."""
+    barcode = data.get("barcode")
+    if not barcode:
+        return None
+    if barcode_index is not None:
+        barcode = barcode_index.key(barcode)
+    return barcode, IndexedProduct(
+        doc_id=doc_id,
+        fingerprint=fingerprint(data.get("name"), data.get("priceRange"), data.get("category")),
+        status=sys.intern(data.get("status") or ""),
+        last_imported_at=data.get("lastImportedAt"),
+    )
+
+
+def partition_bounds(partitions):
+    """
+    Split the document-ID space into `partitions` contiguous ranges.
+
+    Returns a list of (start, end) ID strings; None means unbounded.
+    """
+    partitions = max(1, min(partitions, len(_AUTO_ID_ALPHABET)))
+    cuts = [_AUTO_ID_ALPHABET[i * len(_AUTO_ID_ALPHABET) // partitions] for i in range(1, partitions)]
+    starts = [None] + cuts
+    ends = cuts + [None]
+    return list(zip(starts, ends))
+
+
+def load_product_index(collection, base_query, partitions=LOAD_PARTITIONS, barcode_index=None):
+    """
+    Build a ProductIndex from `base_query`, reading only INDEX_FIELDS and
+    scanning the document-ID partitions concurrently.
+
+    Args:
+        collection: CollectionReference the query runs against
+        base_query: Query selecting the imported products
+        partitions: number of concurrent document-ID range scans
+        barcode_index: optional barcodes.BarcodeIndex to key documents by
+            canonical barcode
+    """
+    bounds = partition_bounds(partitions)
+
+    def scan(bound):
+        start, end = bound
+        query = base_query.select(INDEX_FIELDS)
+        if start is not None:
+            query = query.where("__name__", ">=", collection.document(start))
+        if end is not None:
+            query = query.where("__name__", "<", collection.document(end))
+        entries = (_index_entry(doc.id, doc.to_dict()) for doc in query.stream())
+        return [entry for entry in entries if entry is not None]
+
+    index = ProductIndex(collection, barcode_index)
+    with ThreadPoolExecutor(max_workers=len(bounds), thread_name_prefix="load") as pool:
+        for entries in pool.map(scan, bounds):
+            # Keys are resolved here, not in the scan threads (the index isn't thread-safe)
+            if barcode_index is not None:
+                entries = [(barcode_index.key(barcode), entry) for barcode, entry in entries]
+            index.update(entries)
+
+    logger.info(
+        "Loaded %d existing imported products from Firestore (%d partitions)",
+        len(index),
+        len(bounds),
+    )
+    if index.duplicates:
+        logger.warning(
+            "%d documents share a canonical barcode with a more recently imported one "
+            "(e.g. zero-padded forms); the sync archives them",
+            len(index.duplicates),
+        )
+    return index
@@ -0,0 +1,209 @@
+"""
+Map/reduce execution of the import across Cloud Run Job tasks.
+
+With CLOUD_RUN_TASK_COUNT > 1 every task downloads and pre-aggregates a
+disjoint, contiguous slice of chains.CHAINS (map) and writes its partial
+per-barcode aggregates to SHARD_FOLDER/<run id>/. Task 0 then waits for
+all partials, merges them in task order (reduce) and carries on with the
+filters and the Firestore sync, so the result matches a single-task run.
+
+SHARD_FOLDER must be storage shared by all tasks (e.g. a mounted Cloud
+Storage volume). Locally, run_local_shards() runs the map tasks as
+subprocesses against a directory, with the same environment variables
+Cloud Run sets.
+"""
+
+import gzip
+import itertools
+import logging
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from aggregate import merge_aggregates
+from config import SETTINGS_ENV, settings_to_env
+from download_cache import CACHE_FOLDER
+from spill import SpillingAggregator
+
+logger = logging.getLogger(__name__)
+
+SHARD_FOLDER = os.environ.get("IMPORT_SHARD_DIR", "/tmp/supermarket_shards")
+
+# How long the reduce task waits for the other tasks' partials
+WAIT_TIMEOUT_S = 3600
+WAIT_POLL_S = 10
+
+# Aggregates per pickle frame in partial files
+PARTIAL_FRAME_SIZE = 1000
+
+
+def task_from_env():
+    """(task index, task count) of this Cloud Run Job task; (0, 1) outside Cloud Run."""
+    index = int(os.environ.get("CLOUD_RUN_TASK_INDEX", 0))
+    count = int(os.environ.get("CLOUD_RUN_TASK_COUNT", 1))
+    return index, max(1, count)
+
+
+def chains_for_task(chains, index, count):
+    """
+    Contiguous slice of `chains` handled by task `index` of `count`.
+
+    Slices are balanced (sizes differ by at most one), disjoint and, taken
+    in task order, cover `chains` in their original order.
+    """
+    if not 0 <= index < count:
+        raise ValueError(f"Task index {index} out of range for {count} tasks")
+    base, extra = divmod(len(chains), count)
+    start = index * base + min(index, extra)
+    end = start + base + (1 if index < extra else 0)
+    return chains[start:end]
+
+
+def partial_path(shard_dir, run_id, index, count):
+    return Path(shard_dir) / run_id / f"partial-{index:04d}-of-{count:04d}.pkl.gz"
+
+
+def write_partial(path, aggregates, record_count):
+    """
+    Atomically write one task's (aggregates, record_count).
+
+    Aggregates are streamed in frames, so spilled aggregates
+    (spill.SpilledAggregates) are never loaded into memory at once.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    items = iter(aggregates.items())
+    with gzip.open(tmp, "wb", compresslevel=1) as f:
+        pickle.dump(record_count, f, protocol=pickle.HIGHEST_PROTOCOL)
+        for frame in iter(lambda: list(itertools.islice(items, PARTIAL_FRAME_SIZE)), []):
+            pickle.dump(frame, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    logger.info("Wrote partial aggregates for %d barcodes to %s", len(aggregates), path)
+
+
+def iter_partial(path):
+    """(record_count, iterator of (barcode, aggregate)) of a partial."""
+    f = gzip.open(path, "rb")
+    record_count = pickle.load(f)
+
+    def items():
+        with f:
+            while True:
+                try:
+                    frame = pickle.load(f)
+                except EOFError:
+                    return
+                yield from frame
+
+    return record_count, items()
+
+
+def read_partial(path):
+    """(aggregates dict, record_count) of a partial."""
+    record_count, items = iter_partial(path)
+    return dict(items), record_count
+
+
+def wait_for_partials(shard_dir, run_id, count, timeout=WAIT_TIMEOUT_S, poll=WAIT_POLL_S, sleep=time.sleep):
+    """
+    Block until all `count` partials of the run exist.
+
+    Returns:
+        partial paths in task order
+
+    Raises:
+        TimeoutError: if some partials are still missing after `timeout` seconds
+    """
+    paths = [partial_path(shard_dir, run_id, i, count) for i in range(count)]
+    deadline = time.monotonic() + timeout
+    while True:
+        missing = [i for i, path in enumerate(paths) if not path.exists()]
+        if not missing:
+            return paths
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"Partials of tasks {missing} did not arrive within {timeout}s")
+        logger.info("Waiting for %d/%d partials (tasks %s)", len(missing), count, missing)
+        sleep(poll)
+
+
+def reduce_partials(paths, memory_limit_mb=0):
+    """
+    Merge partials in the given (task) order, spilling to disk above
+    memory_limit_mb (see spill.SpillingAggregator; 0 = in memory).
+
+    Returns:
+        (aggregates, record_count)
+    """
+    spiller = SpillingAggregator(memory_limit_mb) if memory_limit_mb else None
+    aggregates = {}
+    record_count = 0
+    for path in paths:
+        count, items = iter_partial(path)
+        if spiller is None:
+            merge_aggregates(aggregates, dict(items))
+        else:
+            spiller.merge(items)
+        record_count += count
+    if spiller is not None:
+        aggregates = spiller.finish()
+    logger.info(
+        "Reduced %d partials: %d records, %d barcodes", len(paths), record_count, len(aggregates)
+    )
+    return aggregates, record_count
+
+
+def clear_partials(shard_dir, run_id):
+    shutil.rmtree(Path(shard_dir) / run_id, ignore_errors=True)
+
+
+def run_local_shards(count, run_id, shard_dir=SHARD_FOLDER, command=None, settings=None):
+    """
+    Run `count` map tasks as local subprocesses and wait for all of them.
+
+    Each subprocess gets the Cloud Run task variables plus its own data,
+    output and download-cache folders, so tasks don't share scratch space.
+    With `settings`, they are handed down as JSON (config.SETTINGS_ENV), so
+    the map tasks run without a Firestore client (or GCP credentials).
+
+    Args:
+        count: number of map tasks
+        run_id: run ID shared by the tasks (passed as CLOUD_RUN_EXECUTION)
+        shard_dir: shared directory the partials are written to
+        command: argv of a map task (default: this job's main.py --map-only)
+        settings: import settings for the map tasks (default: they load
+            them from Firestore themselves)
+
+    Raises:
+        RuntimeError: if any subprocess exits with a non-zero status
+    """
+    if command is None:
+        command = [sys.executable, str(Path(__file__).with_name("main.py")), "--map-only"]
+
+    work_root = Path(shard_dir) / run_id / "work"
+    processes = []
+    for index in range(count):
+        work = work_root / f"task-{index}"
+        env = dict(
+            os.environ,
+            CLOUD_RUN_EXECUTION=run_id,
+            CLOUD_RUN_TASK_INDEX=str(index),
+            CLOUD_RUN_TASK_COUNT=str(count),
+            IMPORT_SHARD_DIR=str(shard_dir),
+            IMPORT_DATA_DIR=str(work / "dumps"),
+            IMPORT_OUTPUT_DIR=str(work / "output"),
+            IMPORT_CACHE_DIR=os.path.join(CACHE_FOLDER, f"shard-{index}-of-{count}"),
+        )
+        if settings is not None:
+            env[SETTINGS_ENV] = settings_to_env(settings)
+        processes.append(subprocess.Popen(command, env=env))
+    logger.info("Started %d local map tasks for run %s", count, run_id)
+
+    failed = [index for index, process in enumerate(processes) if process.wait() != 0]
+    shutil.rmtree(work_root, ignore_errors=True)
+    if failed:
+        raise RuntimeError(f"Local map tasks {failed} failed")
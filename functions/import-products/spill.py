@@ -0,0 +1,268 @@
+"""
+External-memory aggregation for deduplication under a memory budget.
+
+SpillingAggregator folds records (or pre-aggregated partials) into
+per-barcode BarcodeAggregates like aggregate.aggregate_records, but keeps
+an estimate of the in-memory table's size. Once it exceeds the budget, the
+table is hash-partitioned by barcode and each partition is written to disk
+as a run sorted by barcode, and the table starts over.
+
+finish() merges the runs of each partition (heapq.merge by barcode, runs
+merged in the order they were spilled, so tallies and tie-breaks come out
+exactly as in a single in-memory pass) into one run per partition, and
+returns a SpilledAggregates mapping that streams them back one entry at a
+time. If nothing was spilled, the plain in-memory dict is returned.
+
+On Cloud Run /tmp is backed by memory, so SPILL_FOLDER (IMPORT_SPILL_DIR)
+should point at a mounted volume for spilling to actually relieve memory.
+"""
+
+import heapq
+import itertools
+import logging
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import zlib
+
+from aggregate import BarcodeAggregate
+
+logger = logging.getLogger(__name__)
+
+SPILL_FOLDER = os.environ.get("IMPORT_SPILL_DIR", "/tmp/supermarket_spill")
+
+# Hash partitions per spill; each is merged on its own
+SPILL_PARTITIONS = 16
+
+# Size estimate is refreshed every CHECK_EVERY additions from a sample of
+# SAMPLE_SIZE aggregates
+CHECK_EVERY = 10_000
+SAMPLE_SIZE = 64
+
+# Entries per pickle frame in run files
+FRAME_SIZE = 1000
+
+
+def aggregate_size(agg):
+    """Approximate deep size of a BarcodeAggregate in bytes."""
+    size = sys.getsizeof(agg) + sys.getsizeof(agg.names) + sys.getsizeof(agg.categories)
+    size += sys.getsizeof(agg.prices)
+    size += sys.getsizeof(agg.suppliers)
+    size += sum(sys.getsizeof(name) for name in agg.names)
+    size += sum(sys.getsizeof(category) for category in agg.categories)
+    # Supplier strings are shared between aggregates (a handful of chains)
+    return size
+
+
+def _write_run(path, entries):
+    """Write (barcode, aggregate) pairs, already sorted by barcode, to a run file."""
+    with open(path, "wb") as f:
+        for frame in iter(lambda: list(itertools.islice(entries, FRAME_SIZE)), []):
+            pickle.dump(frame, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _read_run(path):
+    """Yield the (barcode, aggregate) pairs of a run file in order."""
+    with open(path, "rb") as f:
+        while True:
+            try:
+                frame = pickle.load(f)
+            except EOFError:
+                return
+            yield from frame
+
+
+class SpilledAggregates:
+    """
+    Read-only barcode → BarcodeAggregate mapping backed by merged run files.
+
+    items() streams entries partition by partition (sorted by barcode within
+    a partition); the iteration order differs from the in-memory dict, the
+    contents don't.
+    """
+
+    def __init__(self, runs, count, folder):
+        self._runs = runs
+        self._count = count
+        self._folder = folder
+
+    def __len__(self):
+        return self._count
+
+    def items(self):
+        for path in self._runs:
+            yield from _read_run(path)
+
+    def keys(self):
+        return (barcode for barcode, _ in self.items())
+
+    def values(self):
+        return (agg for _, agg in self.items())
+
+    def __iter__(self):
+        return self.keys()
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def close(self):
+        """Delete the run files."""
+        shutil.rmtree(self._folder, ignore_errors=True)
+
+
+class SpillingAggregator:
+    """
+    Per-barcode aggregation with a memory ceiling.
+
+    Args:
+        memory_limit_mb: budget for the in-memory aggregate table
+        spill_dir: parent folder of the run files (default: SPILL_FOLDER)
+        partitions: hash partitions per spill
+        track_prices: keep a price sketch per barcode (see aggregate.BarcodeAggregate)
+    """
+
+    def __init__(self, memory_limit_mb, spill_dir=None, partitions=SPILL_PARTITIONS, track_prices=False):
+        self.limit_bytes = int(memory_limit_mb * 1024 * 1024)
+        self.track_prices = track_prices
+        self.partitions = partitions
+        self._spill_dir = spill_dir or SPILL_FOLDER
+        self._folder = None
+        self._aggregates = {}
+        self._runs = [[] for _ in range(partitions)]
+        self._since_check = 0
+        self.record_count = 0
+        self.stats = {"spills": 0, "spilledEntries": 0, "peakEstimatedMb": 0.0}
+
+    def add_records(self, records):
+        """Fold product records (see aggregate.aggregate_records). Returns the count."""
+        aggregates = self._aggregates
+        count = 0
+        for rec in records:
+            count += 1
+            barcode = rec["barcode"]
+            agg = aggregates.get(barcode)
+            if agg is None:
+                agg = aggregates[barcode] = BarcodeAggregate(self.track_prices)
+            agg.add(rec["name"], rec["price"], rec.get("category"), rec.get("supplier"))
+            self._since_check += 1
+            if self._since_check >= CHECK_EVERY:
+                self._check_memory()
+                aggregates = self._aggregates
+        self.record_count += count
+        return count
+
+    def merge(self, items):
+        """Fold (barcode, BarcodeAggregate) pairs that come after everything added so far."""
+        for barcode, agg in items:
+            existing = self._aggregates.get(barcode)
+            if existing is None:
+                self._aggregates[barcode] = agg
+            else:
+                existing.merge(agg)
+            self._since_check += 1
+            if self._since_check >= CHECK_EVERY:
+                self._check_memory()
+
+    def _check_memory(self):
+        self._since_check = 0
+        if not self._aggregates:
+            return
+        sample = list(itertools.islice(self._aggregates.values(), SAMPLE_SIZE))
+        per_entry = sum(aggregate_size(agg) for agg in sample) / len(sample)
+        # Dict slot, key string and hash table overhead per entry
+        per_entry += 100
+        estimate = per_entry * len(self._aggregates)
+        self.stats["peakEstimatedMb"] = max(self.stats["peakEstimatedMb"], round(estimate / 1024 / 1024, 1))
+        if estimate > self.limit_bytes:
+            self._spill()
+
+    def _partition(self, barcode):
+        return zlib.crc32(barcode.encode("utf-8")) % self.partitions
+
+    def _spill(self):
+        """Write the in-memory table as one sorted run per partition and clear it."""
+        if self._folder is None:
+            os.makedirs(self._spill_dir, exist_ok=True)
+            self._folder = tempfile.mkdtemp(prefix="dedup_", dir=self._spill_dir)
+
+        buckets = [[] for _ in range(self.partitions)]
+        for barcode, agg in self._aggregates.items():
+            buckets[self._partition(barcode)].append((barcode, agg))
+        entries = len(self._aggregates)
+        self._aggregates = {}
+
+        run = self.stats["spills"]
+        for partition, bucket in enumerate(buckets):
+            if not bucket:
+                continue
+            bucket.sort(key=lambda entry: entry[0])
+            path = os.path.join(self._folder, f"p{partition:03d}-r{run:05d}.run")
+            _write_run(path, iter(bucket))
+            self._runs[partition].append(path)
+
+        self.stats["spills"] += 1
+        self.stats["spilledEntries"] += entries
+        logger.info("Spilled %d aggregates to disk (spill #%d)", entries, self.stats["spills"])
+
+    def finish(self):
+        """
+        Return all aggregates: the in-memory dict if nothing was spilled,
+        otherwise a SpilledAggregates over one merged run per partition.
+        """
+        if self.stats["spills"] == 0:
+            aggregates, self._aggregates = self._aggregates, {}
+            return aggregates
+
+        self._spill()
+        merged_runs = []
+        count = 0
+        for partition, runs in enumerate(self._runs):
+            if not runs:
+                continue
+            path = os.path.join(self._folder, f"p{partition:03d}-merged.run")
+            counter = _Counter(self._merge_runs(runs))
+            _write_run(path, counter)
+            count += counter.count
+            for run in runs:
+                os.remove(run)
+            merged_runs.append(path)
+
+        logger.info(
+            "Merged %d spills into %d partitions: %d barcodes",
+            self.stats["spills"],
+            len(merged_runs),
+            count,
+        )
+        return SpilledAggregates(merged_runs, count, self._folder)
+
+    @staticmethod
+    def _merge_runs(runs):
+        """Merge barcode-sorted runs; equal barcodes are merged in spill order."""
+        streams = [
+            ((barcode, run_index, agg) for barcode, agg in _read_run(path))
+            for run_index, path in enumerate(runs)
+        ]
+        merged = heapq.merge(*streams, key=lambda entry: (entry[0], entry[1]))
+        for barcode, group in itertools.groupby(merged, key=lambda entry: entry[0]):
+            _, _, agg = next(group)
+            for _, _, later in group:
+                agg.merge(later)
+            yield barcode, agg
+
+
+class _Counter:
+    """Iterator wrapper counting the items it yields."""
+
+    def __init__(self, iterable):
+        self._it = iter(iterable)
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = next(self._it)
+        self.count += 1
+        return item
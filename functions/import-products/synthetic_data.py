@@ -0,0 +1,180 @@
+"""
+Seeded generator of synthetic multi-chain PriceFull dumps.
+
+Produces realistic data for benchmarking the import pipeline at production
+scale without downloading anything:
+- Hebrew product names built from brand/product/size vocabularies
+- chain names appended to some names (as chains do in ItemName)
+- "במשקל" (sold by weight) items
+- barcodes shared across chains and stores, plus duplicated rows
+- valid GTIN-13 barcodes, with some leading zeros stripped
+
+Two layouts are written:
+- CSV: <root>/<chain>/<store>/prices.csv (as read by parser.iter_parsed_output)
+- XML: <root>/<chain>/PriceFull<chain code>-<store>-<timestamp>.gz
+  (as read by parser.iter_raw_xml)
+
+Files are generated one at a time, so memory use does not depend on size.
+"""
+
+import csv
+import gzip
+import os
+import random
+from xml.sax.saxutils import escape
+
+FORMAT_CSV = "csv"
+FORMAT_XML = "xml"
+
+# (folder name, Hebrew name as it appears in ItemName, GS1 chain code)
+SYNTHETIC_CHAINS = [
+    ("shufersal", "שופרסל", "7290027600007"),
+    ("rami_levy", "רמי לוי", "7290058140886"),
+    ("victory", "ויקטורי", "7290696200003"),
+    ("yayno_bitan", "יינות ביתן", "7290725900003"),
+]
+
+_PRODUCTS = [
+    "חלב", "גבינה לבנה", "קוטג'", "יוגורט", "לחם אחיד", "פיתות", "אורז", "פסטה",
+    "שמן קנולה", "קפה נמס", "תה ירוק", "שוקולד מריר", "במבה", "ביסלי", "טחינה",
+    "חומוס", "קטשופ", "מיונז", "סוכר", "קמח", "שמפו", "מרכך כביסה", "נייר טואלט",
+    "מים מינרליים", "מיץ תפוזים", "קורנפלקס", "טונה בשמן", "עוף שלם", "שניצל",
+]
+_BRANDS = [
+    "תנובה", "שטראוס", "עלית", "אסם", "תלמה", "סוגת", "יטבתה", "טרה",
+    "נסטלה", "פרי ניר", "וילי פוד", "סנו", "ניקול", "מי עדן", "פרימור",
+]
+_SIZES = ["100 גר'", "200 גרם", "500 גר'", "1 ק\"ג", "1 ליטר", "1.5 ליטר", "6 יח'", ""]
+_WEIGHT_MARKER = "במשקל"
+
+
+def _gtin13(body12):
+    """Append the GS1 check digit to a 12-digit body."""
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(body12))
+    return body12 + str((10 - total % 10) % 10)
+
+
+class _Catalog:
+    """Deterministic synthetic product catalog."""
+
+    def __init__(self, rng, size):
+        self.products = []
+        for i in range(size):
+            barcode = _gtin13("729" + f"{i:09d}")
+            name = f"{rng.choice(_PRODUCTS)} {rng.choice(_BRANDS)} {rng.choice(_SIZES)}".strip()
+            if rng.random() < 0.05:
+                name = f"{name} {_WEIGHT_MARKER}"
+            self.products.append(
+                {
+                    "barcode": barcode,
+                    "name": name,
+                    "price": round(rng.uniform(1.5, 80.0), 2),
+                    "manufacturer": rng.choice(_BRANDS),
+                }
+            )
+
+
+def _store_rows(rng, catalog, chain_hebrew, rows):
+    """Yield `rows` raw price rows for one store file."""
+    products = catalog.products
+    for _ in range(rows):
+        product = rng.choice(products)
+        barcode = product["barcode"]
+        if rng.random() < 0.02:
+            barcode = barcode.lstrip("7")  # mangled / internal-looking code
+        name = product["name"]
+        if rng.random() < 0.15:
+            name = f"{name} {chain_hebrew}"
+        price = round(product["price"] * rng.uniform(0.85, 1.2), 2)
+        yield {
+            "ItemCode": barcode,
+            "ItemName": name,
+            "ItemPrice": f"{price:.2f}",
+            "ManufacturerName": product["manufacturer"] if rng.random() < 0.9 else "",
+        }
+
+
+def _write_csv(path, rows):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["ItemCode", "ItemName", "ItemPrice", "ManufacturerName"])
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def _write_xml(path, rows, chain_code, store_id):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n<root>')
+        f.write(f"<ChainId>{chain_code}</ChainId><StoreId>{store_id}</StoreId><Items>")
+        for row in rows:
+            f.write(
+                "<Item>"
+                f"<ItemCode>{escape(row['ItemCode'])}</ItemCode>"
+                f"<ItemName>{escape(row['ItemName'])}</ItemName>"
+                f"<ManufacturerName>{escape(row['ManufacturerName'])}</ManufacturerName>"
+                f"<ItemPrice>{row['ItemPrice']}</ItemPrice>"
+                "</Item>"
+            )
+        f.write("</Items></root>\n")
+
+
+def generate_dump(
+    root,
+    rows,
+    fmt=FORMAT_CSV,
+    chains=4,
+    stores_per_chain=3,
+    catalog_size=None,
+    seed=0,
+    timestamp="202601040200",
+):
+    """
+    Write a synthetic dump of roughly `rows` price rows under `root`.
+
+    Args:
+        root: output folder (created if missing)
+        rows: total number of rows across all files
+        fmt: FORMAT_CSV or FORMAT_XML
+        chains: number of chains (up to len(SYNTHETIC_CHAINS))
+        stores_per_chain: store files per chain
+        catalog_size: distinct barcodes (default: rows // 6, so most barcodes
+            appear in several stores and chains)
+        seed: RNG seed; the same arguments always produce the same files
+        timestamp: file timestamp used in XML file names
+
+    Returns:
+        list of written file paths
+    """
+    if fmt not in (FORMAT_CSV, FORMAT_XML):
+        raise ValueError(f"Unknown format: {fmt!r}")
+
+    rng = random.Random(seed)
+    chain_defs = SYNTHETIC_CHAINS[: max(1, min(chains, len(SYNTHETIC_CHAINS)))]
+    catalog = _Catalog(rng, catalog_size or max(1, rows // 6))
+
+    files = len(chain_defs) * stores_per_chain
+    per_file, remainder = divmod(rows, files)
+    written = []
+
+    for c, (folder, hebrew_name, chain_code) in enumerate(chain_defs):
+        for s in range(stores_per_chain):
+            store_id = f"{s + 1:03d}"
+            file_rows = per_file + (1 if c * stores_per_chain + s < remainder else 0)
+            store_rows = _store_rows(rng, catalog, hebrew_name, file_rows)
+
+            if fmt == FORMAT_CSV:
+                path = os.path.join(root, folder, store_id, "prices.csv")
+                _write_csv(path, store_rows)
+            else:
+                name = f"PriceFull{chain_code}-{store_id}-{timestamp}.gz"
+                path = os.path.join(root, folder, name)
+                _write_xml(path, store_rows, chain_code, store_id)
+            written.append(path)
+
+    return written
+
+
+def chain_names():
+    """Hebrew chain names used in the synthetic ItemName suffixes."""
+    return [hebrew for _, hebrew, _ in SYNTHETIC_CHAINS]
@@ -0,0 +1,169 @@
+"""Tests for aggregate.BarcodeAggregate and process-pool aggregation."""
+
+import os
+import pickle
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from aggregate import (
+    PRICE_SKETCH_SIZE,
+    BarcodeAggregate,
+    aggregate_records,
+    merge_aggregates,
+    price_quantile,
+)
+from parser import (
+    ENGINE_XML,
+    aggregate_downloaded_data,
+    deduplicate_products,
+    finalize_products,
+    iter_raw_xml,
+)
+
+RECORDS = [
+    {"barcode": "111", "name": "Milk", "price": 8.0, "category": "Dairy", "supplier": "A"},
+    {"barcode": "111", "name": "Milk 1L", "price": 12.0, "category": "Dairy", "supplier": "B"},
+    {"barcode": "222", "name": "Bread", "price": 10.0, "category": "", "supplier": "A"},
+    {"barcode": "111", "name": "Milk 1L", "price": 9.0, "category": "Milk", "supplier": "C"},
+    {"barcode": "222", "name": "Bread", "price": 11.0, "category": "Bakery", "supplier": "B"},
+    {"barcode": "111", "name": "Milk", "price": 10.0, "category": "Milk", "supplier": "A"},
+]
+
+
+def test_add_tracks_running_summary():
+    agg = BarcodeAggregate()
+    agg.add("Milk", 8.0, "Dairy", "A")
+    agg.add("Milk", 12.0, "", "B")
+    assert agg.min_price == 8.0
+    assert agg.max_price == 12.0
+    assert agg.names == {"Milk": 2}
+    assert agg.categories == {"Dairy": 1}
+    assert agg.suppliers == {"A", "B"}
+
+
+def test_merge_is_associative():
+    parts = [aggregate_records(RECORDS[i : i + 2])[0] for i in range(0, len(RECORDS), 2)]
+    left = merge_aggregates(merge_aggregates({}, parts[0]), parts[1])
+    left = merge_aggregates(left, parts[2])
+
+    parts = [aggregate_records(RECORDS[i : i + 2])[0] for i in range(0, len(RECORDS), 2)]
+    right = merge_aggregates(parts[1], parts[2])
+    right = merge_aggregates(parts[0], right)
+
+    assert left == right == aggregate_records(RECORDS)[0]
+
+
+def test_merged_partials_match_single_pass():
+    whole = deduplicate_products(RECORDS, min_suppliers=2)
+
+    partials = {}
+    for i in range(0, len(RECORDS), 2):
+        merge_aggregates(partials, aggregate_records(RECORDS[i : i + 2])[0])
+
+    assert finalize_products(partials, min_suppliers=2) == whole
+    assert whole["111"]["name"] == "Milk"
+
+
+def test_aggregate_pickles_round_trip():
+    aggregates, _ = aggregate_records(RECORDS)
+    restored = pickle.loads(pickle.dumps(aggregates))
+    assert restored == aggregates
+
+
+def _write_chain(tmpdir, chain, items):
+    chain_dir = os.path.join(tmpdir, chain)
+    os.makedirs(chain_dir, exist_ok=True)
+    body = "".join(
+        f"<Item><ItemCode>{code}</ItemCode><ItemName>{name}</ItemName>"
+        f"<ItemPrice>{price}</ItemPrice></Item>"
+        for code, name, price in items
+    )
+    with open(os.path.join(chain_dir, "PriceFull1-001-202410200200.xml"), "w", encoding="utf-8") as f:
+        f.write(f"<root><Items>{body}</Items></root>")
+
+
+def test_process_pool_matches_single_process():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        _write_chain(tmpdir, "chain_a", [("111", "Milk", 8), ("222", "Bread", 10)])
+        _write_chain(tmpdir, "chain_b", [("111", "Milk 1L", 9), ("222", "Bread", 12)])
+        _write_chain(tmpdir, "chain_c", [("111", "Milk 1L", 11), ("333", "Eggs", 20)])
+
+        expected = deduplicate_products(iter_raw_xml(tmpdir), min_suppliers=2)
+        aggregates, count = aggregate_downloaded_data(tmpdir, engine=ENGINE_XML, workers=2)
+
+        assert count == 6
+        assert finalize_products(aggregates, min_suppliers=2) == expected
+        assert expected["111"]["suppliers"] == ["Chain A", "Chain B", "Chain C"]
+
+
+def test_price_quantiles_exact_for_few_prices():
+    agg = BarcodeAggregate(track_prices=True)
+    for price in [10, 11, 12, 12, 13, 14, 15, 15, 16, 90]:
+        agg.add("Milk", float(price))
+    assert agg.price_quantile(0) == 10
+    assert agg.price_quantile(0.1) == 10
+    assert agg.price_quantile(0.5) == 13
+    assert agg.price_quantile(0.9) == 16
+    assert agg.price_quantile(1) == 90
+
+
+def test_price_sketch_stays_bounded():
+    agg = BarcodeAggregate(track_prices=True)
+    for i in range(10_000):
+        agg.add("Milk", 5.0 + (i * 7919 % 1000) / 100)
+    assert len(agg.prices) <= 2 * PRICE_SKETCH_SIZE
+    assert sum(agg.prices.values()) == 10_000
+    assert agg.price_quantile(0) == 5.0
+    assert agg.price_quantile(1) == 14.99
+    assert abs(agg.price_quantile(0.5) - 10.0) < 0.5
+    assert abs(agg.price_quantile(0.9) - 14.0) < 0.5
+
+
+def test_price_sketch_only_when_tracked():
+    agg = BarcodeAggregate()
+    for price in [8.0, 9.0, 30.0]:
+        agg.add("Milk", price)
+    assert agg.prices is None
+    assert (agg.price_quantile(0), agg.price_quantile(1)) == (8.0, 30.0)
+    with pytest.raises(ValueError):
+        agg.price_quantile(0.5)
+
+    tracked, _ = aggregate_records(RECORDS, track_prices=True)
+    untracked, _ = aggregate_records(RECORDS)
+    assert all(agg.prices for agg in tracked.values())
+    assert all(agg.prices is None for agg in untracked.values())
+    # A merge keeps the sketch only if both sides have one
+    merged = merge_aggregates(tracked, untracked)
+    assert all(agg.prices is None for agg in merged.values())
+
+
+def test_price_sketch_merges():
+    left, right, single = (BarcodeAggregate(track_prices=True) for _ in range(3))
+    for price in [8.0, 9.0, 9.0]:
+        left.add("Milk", price)
+        single.add("Milk", price)
+    for price in [9.0, 10.0, 30.0]:
+        right.add("Milk", price)
+        single.add("Milk", price)
+    assert left.merge(right) == single
+    assert single.prices == {8.0: 1, 9.0: 3, 10.0: 1, 30.0: 1}
+
+
+def test_price_quantile_rank_rounding():
+    prices = {float(p): 1 for p in range(1, 11)}
+    assert price_quantile(prices, 0.3) == 3.0
+    assert price_quantile(prices, 0.31) == 4.0
+
+
+def test_percentile_price_range():
+    prices = [6, 7, 7, 8, 7, 6, 7, 8, 7, 60]
+    records = [
+        {"barcode": "1", "name": "Milk", "price": float(p), "supplier": "AB"[i % 2]}
+        for i, p in enumerate(prices)
+    ]
+    assert deduplicate_products(records)["1"]["priceRange"] == "₪6–60"
+    assert deduplicate_products(records, price_quantiles=(0.1, 0.9))["1"]["priceRange"] == "₪6–8"
@@ -0,0 +1,159 @@
+"""Tests for barcodes (GTIN normalization and the BarcodeIndex)"""
+
+import os
+import pickle
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from barcodes import BarcodeIndex, gtin_check_digit, is_valid_gtin, normalize_barcode, to_gtin
+from metrics import MetricsCollector
+from parser import ENGINE_XML, aggregate_downloaded_data, deduplicate_products, iter_raw_xml
+
+
+def _write_chain(root, chain, items):
+    chain_dir = os.path.join(root, chain)
+    os.makedirs(chain_dir, exist_ok=True)
+    body = "".join(
+        f"<Item><ItemCode>{code}</ItemCode><ItemName>{name}</ItemName>"
+        f"<ItemPrice>{price}</ItemPrice><ManufacturerName>M</ManufacturerName></Item>"
+        for code, name, price in items
+    )
+    with open(os.path.join(chain_dir, "PriceFull1-001-202410200200.xml"), "w", encoding="utf-8") as f:
+        f.write(f"<root><Items>{body}</Items></root>")
+
+
+def _write_dump(root):
+    # The same milk, published padded to GTIN-14 by one chain and as-is by the other
+    _write_chain(root, "chain_a", [("07290000000015", "Milk", 6), ("1234", "Bag", 4)])
+    _write_chain(root, "chain_b", [("7290000000015", "Milk", 7), ("001234", "Bag", 5)])
+
+
+def test_check_digit():
+    assert gtin_check_digit("729000000001") == "5"
+    assert is_valid_gtin("7290000000015")
+    assert is_valid_gtin("96385074")
+    assert is_valid_gtin("012345678905")
+    assert not is_valid_gtin("7290000000016")
+    assert not is_valid_gtin("72900000015")
+
+
+@pytest.mark.parametrize(
+    "raw, key, internal",
+    [
+        ("7290000000015", "7290000000015", False),
+        (" 07290000000015 ", "7290000000015", False),
+        ("012345678905", "12345678905", False),
+        ("12345678905", "12345678905", False),
+        ("96385074", "96385074", False),
+        ("7290000000016", "7290000000016", True),  # bad check digit
+        ("2000000000015", "2000000000015", True),  # in-store (prefix 20–29)
+        ("212345678900", "212345678900", True),  # UPC-A number system 2
+        ("001234", "001234", True),  # internal codes keep their zeros
+        ("AB-12", "AB-12", True),
+        ("000", "000", True),
+    ],
+)
+def test_normalize_barcode(raw, key, internal):
+    assert normalize_barcode(raw) == (key, internal)
+
+
+def test_to_gtin():
+    assert to_gtin("12345678905") == "0012345678905"
+    assert to_gtin("7290000000015", 14) == "07290000000015"
+    with pytest.raises(ValueError):
+        to_gtin("1234")
+    with pytest.raises(ValueError):
+        to_gtin("7290000000015", 12)
+
+
+def test_index_memoizes_and_tracks_raw_forms():
+    index = BarcodeIndex()
+    assert index.key("07290000000015") == "7290000000015"
+    assert index("7290000000015") == "7290000000015"
+    assert index.key("07290000000015") == "7290000000015"
+    assert index.key("001234") == "001234"
+    assert index.raw_forms("7290000000015") == ["07290000000015", "7290000000015"]
+    assert index.is_internal("001234") and not index.is_internal("7290000000015")
+    assert index.stats() == {"keys": 2, "rawForms": 3, "merged": 1, "internal": 1, "hits": 1, "misses": 3}
+
+
+def test_fork_update_and_save(tmp_path):
+    index = BarcodeIndex()
+    index.key("7290000000015")
+    fork = index.fork()
+    fork.key("07290000000015")
+    fork.key("001234")
+    index.update(fork)
+    assert sorted(index.raw_forms("7290000000015")) == ["07290000000015", "7290000000015"]
+    assert index.is_internal("001234")
+
+    index.save(tmp_path)
+    loaded = BarcodeIndex.load(tmp_path)
+    assert loaded.raw_forms("7290000000015") == index.raw_forms("7290000000015")
+    assert loaded.is_internal("001234")
+    assert loaded.stats()["hits"] == 0
+    assert loaded.key("07290000000015") == "7290000000015"
+    assert loaded.stats()["hits"] == 1
+    assert pickle.loads(pickle.dumps(loaded)).raw_forms("001234") == ["001234"]
+    assert len(BarcodeIndex.load(tmp_path / "missing")) == 0
+
+
+def test_saved_index_drops_codes_unused_for_too_long(tmp_path):
+    index = BarcodeIndex()
+    index.key("7290000000015")
+    index.key("001234")
+    index.save(tmp_path, max_idle_runs=2)
+
+    # Run 2 sees only the milk; the bag is idle once
+    index = BarcodeIndex.load(tmp_path)
+    index.key("7290000000015")
+    index.save(tmp_path, max_idle_runs=2)
+    assert index.raw_forms("001234") == ["001234"]
+
+    # Run 3: the bag has gone unseen for two runs and isn't saved again
+    index = BarcodeIndex.load(tmp_path)
+    assert "001234" in index
+    index.key("07290000000015")
+    index.save(tmp_path, max_idle_runs=2)
+    index = BarcodeIndex.load(tmp_path)
+    assert "001234" not in index and not index.is_internal("001234")
+    assert sorted(index.raw_forms("7290000000015")) == ["07290000000015", "7290000000015"]
+
+    # The cap keeps the codes seen most recently
+    index.key("96385074")
+    index.save(tmp_path, max_codes=1)
+    assert BarcodeIndex.load(tmp_path).raw_forms("96385074") == ["96385074"]
+    assert len(BarcodeIndex.load(tmp_path)) == 1
+
+
+def test_dedup_matches_padded_barcodes_across_chains(tmp_path):
+    _write_dump(str(tmp_path))
+    assert deduplicate_products(iter_raw_xml(str(tmp_path)), min_suppliers=2) == {}
+
+    index = BarcodeIndex()
+    products = deduplicate_products(iter_raw_xml(str(tmp_path), barcode_index=index), min_suppliers=2)
+    # Internal codes aren't folded across chains: "1234" and "001234" stay apart
+    assert list(products) == ["7290000000015"]
+    assert products["7290000000015"]["priceRange"] == "₪6–7"
+
+    records = list(iter_raw_xml(str(tmp_path)))
+    assert deduplicate_products(records, min_suppliers=2, barcode_index=BarcodeIndex()) == products
+
+
+def test_aggregate_downloaded_data_with_workers(tmp_path):
+    _write_dump(str(tmp_path))
+    for workers in (1, 2):
+        index = BarcodeIndex()
+        metrics = MetricsCollector(emit=False)
+        aggregates, count = aggregate_downloaded_data(
+            str(tmp_path), engine=ENGINE_XML, workers=workers, metrics=metrics, barcode_index=index
+        )
+        assert count == 4
+        assert set(aggregates) == {"7290000000015", "1234", "001234"}
+        assert aggregates["7290000000015"].suppliers == {"Chain A", "Chain B"}
+        assert metrics.summary()["stages"]["read"]["barcodeIndex"]["merged"] == 1
+        assert index.raw_forms("1234") == ["1234"]
+
@@ -0,0 +1,72 @@
+"""Tests for checkpoint — stage checkpoints and download manifests."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from aggregate import BarcodeAggregate
+from checkpoint import (
+    STAGE_AGGREGATE,
+    STAGE_SYNC,
+    RunCheckpoint,
+    build_manifest,
+    manifest_matches,
+)
+
+
+def test_round_trips_stage_output(tmp_path):
+    agg = BarcodeAggregate()
+    agg.add("Milk", 5.0, supplier="A")
+    checkpoint = RunCheckpoint("run-1", root=tmp_path)
+
+    checkpoint.save(STAGE_AGGREGATE, ({"111": agg}, 1))
+
+    aggregates, count = RunCheckpoint("run-1", root=tmp_path).load(STAGE_AGGREGATE)
+    assert count == 1
+    assert aggregates["111"] == agg
+
+
+def test_missing_and_other_runs_load_none(tmp_path):
+    RunCheckpoint("run-1", root=tmp_path).save(STAGE_SYNC, {"position": 500})
+    assert RunCheckpoint("run-1", root=tmp_path).load(STAGE_AGGREGATE) is None
+    assert RunCheckpoint("run-2", root=tmp_path).load(STAGE_SYNC) is None
+
+
+def test_corrupt_checkpoint_is_ignored(tmp_path):
+    checkpoint = RunCheckpoint("run-1", root=tmp_path)
+    checkpoint.save(STAGE_SYNC, {"position": 500})
+    (tmp_path / "run-1" / "sync.pkl.gz").write_bytes(b"not gzip")
+    assert checkpoint.load(STAGE_SYNC) is None
+
+
+def test_disabled_checkpoint_is_a_no_op(tmp_path):
+    checkpoint = RunCheckpoint(None, root=tmp_path)
+    checkpoint.save(STAGE_SYNC, {"position": 500})
+    assert not checkpoint.enabled
+    assert checkpoint.load(STAGE_SYNC) is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_clear_removes_run(tmp_path):
+    checkpoint = RunCheckpoint("run-1", root=tmp_path)
+    checkpoint.save(STAGE_SYNC, {"position": 500})
+    checkpoint.clear()
+    assert checkpoint.load(STAGE_SYNC) is None
+    assert not (tmp_path / "run-1").exists()
+
+
+def test_manifest_detects_changed_downloads(tmp_path):
+    data = tmp_path / "dumps"
+    (data / "shufersal").mkdir(parents=True)
+    (data / "shufersal" / "PriceFull1.gz").write_bytes(b"abc")
+
+    manifest = build_manifest(data)
+    assert manifest["files"] == {os.path.join("shufersal", "PriceFull1.gz"): 3}
+    assert manifest_matches(manifest)
+
+    (data / "shufersal" / "PriceFull1.gz").write_bytes(b"abcd")
+    assert not manifest_matches(manifest)
+
+    (data / "shufersal" / "PriceFull1.gz").unlink()
+    assert not manifest_matches(manifest)
@@ -0,0 +1,74 @@
+"""Tests for columnar.RecordColumns — compact record storage."""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from aggregate import aggregate_records
+from columnar import RecordColumns
+from parser import _read_parsed_output, deduplicate_products, read_parsed_columns
+from synthetic_data import FORMAT_CSV, generate_dump
+
+RECORDS = [
+    {"barcode": "7290000000011", "name": "חלב", "price": 6.9, "category": "תנובה", "supplier": "Shufersal"},
+    {"barcode": "111", "name": "Bread", "price": 12.0, "category": "", "supplier": "Victory"},
+    {"barcode": "7290000000011", "name": "חלב", "price": 7.5, "category": "תנובה", "supplier": "Victory"},
+    {"barcode": "X" * 40, "name": "Long code", "price": 3.0, "category": "", "supplier": "Victory"},
+    {"barcode": "קוד", "name": "Hebrew code", "price": 4.0, "category": "", "supplier": "Shufersal"},
+]
+
+
+def test_round_trips_records():
+    columns = RecordColumns().extend(RECORDS)
+    assert len(columns) == 5
+    assert list(columns) == RECORDS
+    assert columns[0] == RECORDS[0]
+    assert columns[-1] == RECORDS[-1]
+    with pytest.raises(IndexError):
+        columns[5]
+
+
+def test_strings_are_dictionary_encoded():
+    columns = RecordColumns().extend(RECORDS)
+    assert len(columns.suppliers) == 2
+    assert len(columns.categories) == 2
+    assert list(columns.supplier_codes) == [0, 1, 1, 1, 0]
+
+
+def test_views_are_zero_copy_slices():
+    columns = RecordColumns().extend(RECORDS)
+    with columns[1:3] as view:
+        assert len(view) == 2
+        assert list(view) == RECORDS[1:3]
+        assert view.prices.obj is columns.prices
+        # The parent can't be resized under a live view
+        with pytest.raises(BufferError):
+            columns.append("1", "x", 1.0)
+    columns.append("1", "x", 1.0)
+    assert len(columns) == 6
+
+
+def test_aggregates_like_record_dicts():
+    columns = RecordColumns().extend(RECORDS)
+    assert aggregate_records(columns) == aggregate_records(RECORDS)
+    assert aggregate_records(columns.view(0, 2)) == aggregate_records(RECORDS[:2])
+
+
+def test_dedup_from_columns_matches_dicts_and_is_compact():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        generate_dump(tmpdir, 5000, fmt=FORMAT_CSV, catalog_size=100)
+        records = _read_parsed_output(tmpdir)
+        columns = read_parsed_columns(tmpdir)
+
+    assert list(columns) == records
+    assert deduplicate_products(columns, min_suppliers=2) == deduplicate_products(records, min_suppliers=2)
+
+    dict_bytes = sum(
+        sys.getsizeof(r) + sum(sys.getsizeof(v) for v in r.values()) for r in records
+    )
+    # Per-record footprint drops by an order of magnitude
+    assert columns.nbytes() * 10 < dict_bytes
@@ -88,3 +88,24 @@ def test_most_common_category():
     ]
     result = deduplicate_products(records)
     assert result["123"]["category"] == "Dairy"
+
+
+def test_accepts_generator_input():
+    records = (
+        {"barcode": "123", "name": "Milk", "price": p, "category": "", "supplier": s}
+        for p, s in [(8.0, "A"), (12.0, "B")]
+    )
+    result = deduplicate_products(records, min_suppliers=2)
+    assert result["123"]["priceRange"] == "₪8–12"
+    assert result["123"]["suppliers"] == ["A", "B"]
+
+
+def test_chain_name_variants_merge_before_vote():
+    records = [
+        {"barcode": "123", "name": "Milk Shufersal", "price": 8.0, "category": "", "supplier": "A"},
+        {"barcode": "123", "name": "Milk", "price": 8.0, "category": "", "supplier": "B"},
+        {"barcode": "123", "name": "Milk 1L", "price": 8.0, "category": "", "supplier": "B"},
+        {"barcode": "123", "name": "Milk 1L", "price": 8.0, "category": "", "supplier": "B"},
+    ]
+    result = deduplicate_products(records, min_suppliers=1, chain_names=["Shufersal"])
+    assert result["123"]["name"] == "Milk"
@@ -0,0 +1,163 @@
+"""Tests for the vectorized dedup engine (dedup_numpy) against the Python engine"""
+
+import sys
+import os
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+pytest.importorskip("numpy")
+
+from columnar import RecordColumns
+from parser import DEDUP_NUMPY, DEDUP_PYTHON, deduplicate_products, read_parsed_columns
+from synthetic_data import FORMAT_CSV, chain_names, generate_dump
+
+
+def _both(records, **kwargs):
+    records = list(records)
+    expected = deduplicate_products(records, engine=DEDUP_PYTHON, **kwargs)
+    actual = deduplicate_products(records, engine=DEDUP_NUMPY, **kwargs)
+    return expected, actual
+
+
+def _rec(barcode, name, price, category="", supplier="A"):
+    return {"barcode": barcode, "name": name, "price": price, "category": category, "supplier": supplier}
+
+
+def test_matches_python_engine_basic():
+    records = [
+        _rec("123", "Milk", 8.0, "Dairy", "A"),
+        _rec("123", "Milk", 12.0, "Dairy", "B"),
+        _rec("123", "Milk 1L", 10.0, "", "B"),
+        _rec("456", "Bread", 5.0, "Bakery", "A"),
+    ]
+    expected, actual = _both(records, min_suppliers=1)
+    assert actual == expected
+    assert list(actual) == list(expected)
+    assert actual["123"]["priceRange"] == "₪8–12"
+    assert actual["123"]["suppliers"] == ["A", "B"]
+
+
+def test_empty_input():
+    assert deduplicate_products([], engine=DEDUP_NUMPY) == {}
+
+
+def test_ties_go_to_first_seen_value():
+    records = [
+        _rec("1", "Beta", 5.0, "Y", "A"),
+        _rec("1", "Alpha", 5.0, "X", "B"),
+        _rec("1", "Alpha", 5.0, "", "A"),
+        _rec("1", "Beta", 5.0, "X", "B"),
+        _rec("2", "Zed", 3.0, "", "A"),
+        _rec("2", "Ant", 3.0, "", "B"),
+    ]
+    expected, actual = _both(records, min_suppliers=1)
+    assert actual == expected
+    assert actual["1"]["name"] == "Beta"
+    assert actual["1"]["category"] == "X"
+    assert actual["2"]["name"] == "Zed"
+    assert actual["2"]["category"] == ""
+
+
+def test_filters_match_python_engine():
+    records = [
+        _rec("cheap", "Gum", 1.5, "", "A"),
+        _rec("cheap", "Gum", 1.0, "", "B"),
+        _rec("weight", "עגבניות במשקל", 9.0, "", "A"),
+        _rec("weight", "עגבניות במשקל", 9.0, "", "B"),
+        _rec("single", "Bread", 12.0, "", "A"),
+        _rec("single", "Bread", 12.0, "", "A"),
+        _rec("nosupplier", "Salt", 4.0, "", ""),
+        _rec("kept", "Oil", 20.0, "", "A"),
+        _rec("kept", "Oil", 25.0, "", "C"),
+    ]
+    expected, actual = _both(records, min_price=3.0, min_suppliers=2)
+    assert actual == expected
+    assert list(actual) == ["kept"]
+
+
+def test_chain_names_cleaned_before_vote():
+    records = [
+        _rec("123", "Milk Shufersal", 8.0, "", "A"),
+        _rec("123", "Milk", 8.0, "", "B"),
+        _rec("123", "Milk 1L", 8.0, "", "B"),
+        _rec("123", "Milk 1L", 8.0, "", "B"),
+    ]
+    expected, actual = _both(records, min_suppliers=1, chain_names=["Shufersal"])
+    assert actual == expected
+    assert actual["123"]["name"] == "Milk"
+
+
+def test_name_variants_voted_by_canonical_key():
+    records = [
+        _rec("1", "במבה נוגט", 5.0, "", "A"),
+        _rec("1", "במבה 80 גרם", 5.0, "", "B"),
+        _rec("1", "במבה 80 גר׳", 5.0, "", "A"),
+        _rec("1", "במבה 80 גר׳", 5.0, "", "B"),
+        _rec("1", "במבה נוגט", 5.0, "", "A"),
+        _rec("2", "חלב 1 ל'", 5.0, "", "A"),
+        _rec("2", "חלב 1 ליטר", 5.0, "", "A"),
+    ]
+    expected, actual = _both(records, min_suppliers=1)
+    assert actual == expected
+    assert actual["1"]["name"] == "במבה 80 גר׳"
+    assert actual["2"]["name"] == "חלב 1 ל'"
+
+
+def test_overflow_barcodes_kept_apart():
+    long_a = "9" * 30
+    long_b = "9" * 29 + "8"
+    records = [
+        _rec(long_a, "Long A", 5.0, "", "A"),
+        _rec("", "Empty", 6.0, "", "A"),
+        _rec(long_b, "Long B", 7.0, "", "B"),
+        _rec(long_a, "Long A", 9.0, "", "B"),
+        _rec("קוד", "Hebrew code", 4.0, "", "A"),
+    ]
+    expected, actual = _both(records, min_suppliers=1)
+    assert actual == expected
+    assert list(actual) == [long_a, "", long_b, "קוד"]
+    assert actual[long_a]["priceRange"] == "₪5–9"
+
+
+def test_accepts_record_columns():
+    records = [_rec("123", "Milk", 8.0, "", "A"), _rec("123", "Milk", 9.0, "", "B")]
+    columns = RecordColumns().extend(records)
+    assert deduplicate_products(columns, engine=DEDUP_NUMPY) == deduplicate_products(records)
+
+
+def test_matches_python_engine_on_synthetic_dump(tmp_path):
+    generate_dump(str(tmp_path), 3000, fmt=FORMAT_CSV, seed=5)
+    names = chain_names()
+    columns = read_parsed_columns(str(tmp_path))
+    for min_suppliers in (1, 2, 3):
+        expected = deduplicate_products(columns, min_suppliers=min_suppliers, chain_names=names)
+        actual = deduplicate_products(
+            columns, min_suppliers=min_suppliers, chain_names=names, engine=DEDUP_NUMPY
+        )
+        assert actual == expected
+        assert list(actual) == list(expected)
+
+
+def test_price_quantiles_match_python_engine(tmp_path):
+    generate_dump(str(tmp_path), 3000, fmt=FORMAT_CSV, seed=9, catalog_size=50)
+    columns = read_parsed_columns(str(tmp_path))
+    for quantiles in ((0.1, 0.9), (0.25, 0.75), (0.0, 1.0)):
+        expected = deduplicate_products(columns, min_suppliers=1, price_quantiles=quantiles)
+        actual = deduplicate_products(
+            columns, min_suppliers=1, price_quantiles=quantiles, engine=DEDUP_NUMPY
+        )
+        assert actual == expected
+
+
+def test_unknown_engine_rejected():
+    with pytest.raises(ValueError):
+        deduplicate_products([], engine="fortran")
+
+
+def test_nothing_kept_or_no_suppliers():
+    records = [_rec("1", "Salt", 4.0, "", ""), _rec("2", "Gum", 1.0, "", "")]
+    for kwargs in ({"min_suppliers": 1}, {"min_suppliers": 0}, {"min_suppliers": 0, "min_price": 10.0}):
+        expected, actual = _both(records, **kwargs)
+        assert actual == expected
@@ -0,0 +1,136 @@
+"""Tests for delta.PriceSnapshot (incremental Price file refresh)"""
+
+import gzip
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from delta import PriceSnapshot, classify_price_file
+from parser import deduplicate_products, iter_raw_xml
+
+CHAIN_CODE = "7290027600007"
+
+
+def _write_price_file(root, chain, kind, store, stamp, items):
+    folder = os.path.join(root, chain)
+    os.makedirs(folder, exist_ok=True)
+    body = "".join(
+        f"<Item><ItemCode>{code}</ItemCode><ItemName>{name}</ItemName>"
+        f"<ItemPrice>{price}</ItemPrice><ManufacturerName>M</ManufacturerName></Item>"
+        for code, name, price in items
+    )
+    path = os.path.join(folder, f"{kind}{CHAIN_CODE}-{store}-{stamp}.gz")
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write(f"<root><Items>{body}</Items></root>")
+    return path
+
+
+def _full_dump(root):
+    stamp = "202601040200"
+    _write_price_file(root, "chain_a", "PriceFull", "001", stamp, [("1", "Milk", 6), ("2", "Bread", 8)])
+    _write_price_file(root, "chain_a", "PriceFull", "002", stamp, [("1", "Milk", 7)])
+    _write_price_file(root, "chain_b", "PriceFull", "001", stamp, [("1", "Milk", 9), ("3", "Eggs", 20)])
+
+
+def _prices(snapshot):
+    return sorted((r["supplier"], r["barcode"], r["price"]) for r in snapshot.iter_records())
+
+
+def test_classify_price_file(tmp_path):
+    path = _write_price_file(str(tmp_path), "chain_a", "Price", "005", "202601051300", [])
+    assert classify_price_file(path, str(tmp_path)) == (f"chain_a/{CHAIN_CODE}-005", "202601051300", False)
+    path = _write_price_file(str(tmp_path), "chain_a", "PriceFull", "005", "202601040200", [])
+    assert classify_price_file(path, str(tmp_path))[2] is True
+
+
+def test_build_matches_full_read(tmp_path):
+    dump = str(tmp_path / "dump")
+    _full_dump(dump)
+    snapshot = PriceSnapshot(tmp_path / "snapshot")
+    assert not snapshot.exists()
+
+    stats = snapshot.build(dump)
+
+    assert stats == {"stores": 3, "rows": 5}
+    reopened = PriceSnapshot(tmp_path / "snapshot")
+    assert reopened.exists()
+    expected = deduplicate_products(iter_raw_xml(dump), min_suppliers=1)
+    assert deduplicate_products(reopened.iter_records(), min_suppliers=1) == expected
+
+
+def test_deltas_update_prices_on_top_of_snapshot(tmp_path):
+    dump = str(tmp_path / "dump")
+    _full_dump(dump)
+    snapshot = PriceSnapshot(tmp_path / "snapshot")
+    snapshot.build(dump)
+
+    deltas = str(tmp_path / "deltas")
+    _write_price_file(
+        deltas, "chain_a", "Price", "001", "202601051000", [("1", "Milk", 5), ("4", "Salt", 3)]
+    )
+    _write_price_file(deltas, "chain_a", "Price", "001", "202601051200", [("1", "Milk", 4.5)])
+    # Already covered by the full file
+    _write_price_file(deltas, "chain_b", "Price", "001", "202601040100", [("1", "Milk", 1)])
+    # No full snapshot for this store
+    _write_price_file(deltas, "chain_b", "Price", "009", "202601051000", [("1", "Milk", 2)])
+
+    stats = snapshot.apply_deltas(deltas)
+
+    unused = [
+        os.path.getsize(os.path.join(deltas, chain, name))
+        for chain, name in [
+            ("chain_b", f"Price{CHAIN_CODE}-001-202601040100.gz"),
+            ("chain_b", f"Price{CHAIN_CODE}-009-202601051000.gz"),
+        ]
+    ]
+    assert stats == {
+        "files": 4,
+        "applied": 2,
+        "skipped": 1,
+        "unknownStores": 1,
+        "rowsChanged": 3,
+        "wastedBytes": sum(unused),
+    }
+    assert _prices(PriceSnapshot(tmp_path / "snapshot")) == [
+        ("Chain A", "1", 4.5),
+        ("Chain A", "1", 7.0),
+        ("Chain A", "2", 8.0),
+        ("Chain A", "4", 3.0),
+        ("Chain B", "1", 9.0),
+        ("Chain B", "3", 20.0),
+    ]
+
+    # Re-applying the same files changes nothing
+    again = snapshot.apply_deltas(deltas)
+    assert again["applied"] == 0
+    assert again["skipped"] == 3
+
+
+def test_manifest_records_whether_every_store_was_built(tmp_path):
+    dump = str(tmp_path / "dump")
+    _full_dump(dump)
+    snapshot = PriceSnapshot(tmp_path / "snapshot")
+    snapshot.build(dump)
+    assert not PriceSnapshot(tmp_path / "snapshot").covers_all_stores()
+
+    snapshot.build(dump, all_stores=True)
+    assert PriceSnapshot(tmp_path / "snapshot").covers_all_stores()
+
+
+def test_rebuild_keeps_chains_missing_from_dump(tmp_path):
+    dump = str(tmp_path / "dump")
+    _full_dump(dump)
+    snapshot = PriceSnapshot(tmp_path / "snapshot")
+    snapshot.build(dump)
+
+    partial = str(tmp_path / "partial")
+    _write_price_file(partial, "chain_a", "PriceFull", "001", "202601110200", [("1", "Milk", 6.5)])
+    snapshot.build(partial)
+
+    # Store 002 had no file in the new dump, but its chain was rebuilt
+    assert _prices(snapshot) == [
+        ("Chain A", "1", 6.5),
+        ("Chain B", "1", 9.0),
+        ("Chain B", "3", 20.0),
+    ]
@@ -0,0 +1,120 @@
+"""Tests for disk_budget.DiskBudget and the per-chain streaming pipeline."""
+
+import enum
+import os
+import shutil
+import sys
+import threading
+import time
+from types import ModuleType
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import parser
+from aggregate import aggregate_records
+from disk_budget import DiskBudget
+from metrics import MetricsCollector
+from synthetic_data import FORMAT_XML, SYNTHETIC_CHAINS, generate_dump
+
+
+def test_admits_one_chain_until_a_footprint_is_known(tmp_path):
+    budget = DiskBudget(1, [tmp_path])
+    entered = threading.Event()
+
+    with budget.admit("a"):
+        def second():
+            with budget.admit("b"):
+                entered.set()
+
+        thread = threading.Thread(target=second)
+        thread.start()
+        assert not entered.wait(0.1)  # unknown footprint: wait for "a"
+    thread.join(1)
+    assert entered.is_set()
+    assert budget.waits >= 1
+
+
+def test_records_high_water_and_chain_peaks(tmp_path):
+    chain_dir = tmp_path / "a"
+    chain_dir.mkdir()
+    (chain_dir / "dump.xml").write_bytes(b"x" * 2048)
+
+    budget = DiskBudget(0, [tmp_path])
+    budget.record("a", chain_dir)
+    (chain_dir / "dump.xml").unlink()
+    budget.record("a", chain_dir)
+
+    assert budget.high_water_bytes == 2048
+    assert budget.chain_peaks == {"a": 2048}
+    assert budget.stats()["budgetMb"] == 0
+
+
+def test_concurrent_chains_fit_the_budget(tmp_path):
+    budget = DiskBudget(1, [tmp_path])
+    chain_dir = tmp_path / "first"
+    chain_dir.mkdir()
+    (chain_dir / "dump.xml").write_bytes(b"x" * 400 * 1024)
+    with budget.admit("first"):
+        budget.record("first", chain_dir)
+    # 400 KB per chain: two fit in 1 MB, a third has to wait
+    assert budget._fits()
+    with budget.admit("a"), budget.admit("b"):
+        assert not budget._fits()
+
+
+@pytest.fixture
+def streaming_env(tmp_path, monkeypatch):
+    """Fake scraper package and downloader serving a synthetic XML dump."""
+    source = tmp_path / "source"
+    generate_dump(source, 2000, fmt=FORMAT_XML, chains=3, stores_per_chain=2)
+    folders = {folder.upper(): folder for folder, _, _ in SYNTHETIC_CHAINS[:3]}
+
+    factory_mod = ModuleType("il_supermarket_scarper.scrappers_factory")
+    factory_mod.ScraperFactory = enum.Enum("ScraperFactory", list(folders))
+    monkeypatch.setitem(sys.modules, "il_supermarket_scarper", ModuleType("il_supermarket_scarper"))
+    monkeypatch.setitem(sys.modules, "il_supermarket_scarper.scrappers_factory", factory_mod)
+    monkeypatch.setattr(parser, "DATA_FOLDER", str(tmp_path / "dumps"))
+    monkeypatch.setattr(parser, "OUTPUT_FOLDER", str(tmp_path / "output"))
+
+    state = {"active": 0, "max_active": 0}
+    lock = threading.Lock()
+
+    def fake_download(scraper_enum, limiter, dump_folder=None, limit=1):
+        with lock:
+            state["active"] += 1
+            state["max_active"] = max(state["max_active"], state["active"])
+        folder = folders[scraper_enum.name]
+        shutil.copytree(source / folder, os.path.join(dump_folder, folder))
+        time.sleep(0.05)
+        with lock:
+            state["active"] -= 1
+        return True
+
+    monkeypatch.setattr(parser, "_download_chain", fake_download)
+    return source, list(folders), state
+
+
+def test_stream_matches_batch_and_cleans_up(streaming_env, tmp_path):
+    source, chain_ids, _ = streaming_env
+    expected, expected_count = aggregate_records(parser.iter_raw_xml(source))
+
+    metrics = MetricsCollector(emit=False)
+    aggregates, count = parser.stream_chain_data(
+        chain_ids, engine=parser.ENGINE_XML, max_workers=3, metrics=metrics
+    )
+
+    assert count == expected_count == 2000
+    assert aggregates == expected
+    assert list((tmp_path / "dumps").iterdir()) == []
+    disk = metrics.summary()["stages"]["stream"]["disk"]
+    assert disk["highWaterMb"] >= max(disk["chainPeakMb"].values())
+    assert set(disk["chainPeakMb"]) == set(chain_ids)
+
+
+def test_stream_serializes_chains_over_budget(streaming_env):
+    _, chain_ids, state = streaming_env
+    # Far below one chain's footprint: chains must run one at a time
+    parser.stream_chain_data(chain_ids, engine=parser.ENGINE_XML, max_workers=3, disk_budget_mb=0.001)
+    assert state["max_active"] == 1
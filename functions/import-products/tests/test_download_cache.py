@@ -0,0 +1,160 @@
+"""Tests for download_cache.DownloadCache."""
+
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from download_cache import DownloadCache, parse_file_name
+
+
+def _write(folder, name, content):
+    path = Path(folder) / name
+    path.write_bytes(content)
+    return path
+
+
+def test_parse_file_name():
+    assert parse_file_name("PriceFull7290027600007-001-202410200200.gz") == (
+        "7290027600007",
+        "001",
+        "202410200200",
+    )
+    assert parse_file_name("readme.txt") is None
+
+
+def test_describe_uses_store_and_timestamp_keys():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        raw = _write(tmpdir, "PriceFull7290027600007-001-202410200200.gz", b"data")
+        cache = DownloadCache(os.path.join(tmpdir, "cache"))
+        files = cache.describe("Shufersal", [raw])
+        assert files[0][0] == "Shufersal/001/202410200200"
+        assert len(files[0][1]) == 64
+
+
+def test_miss_then_hit_after_store():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        raw = _write(tmpdir, "PriceFull1-001-202410200200.gz", b"data")
+        cache = DownloadCache(os.path.join(tmpdir, "cache"))
+        files = cache.describe("Victory", [raw])
+
+        assert cache.lookup("Victory", files) is None
+
+        output_dir = cache.output_dir_for("Victory", files)
+        output_dir.mkdir(parents=True)
+        cache.store("Victory", files, output_dir)
+        cache.save()
+
+        reloaded = DownloadCache(os.path.join(tmpdir, "cache"))
+        assert reloaded.lookup("Victory", files) == output_dir
+        assert reloaded.stats["Victory"] == {"hits": 1, "misses": 0}
+
+
+def test_changed_content_is_a_miss():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        raw = _write(tmpdir, "PriceFull1-001-202410200200.gz", b"old")
+        cache = DownloadCache(os.path.join(tmpdir, "cache"))
+        files = cache.describe("Victory", [raw])
+        output_dir = cache.output_dir_for("Victory", files)
+        output_dir.mkdir(parents=True)
+        cache.store("Victory", files, output_dir)
+
+        raw.write_bytes(b"new")
+        assert cache.lookup("Victory", cache.describe("Victory", [raw])) is None
+        assert cache.stats["Victory"]["misses"] == 1
+
+
+def test_evicts_old_entries_and_their_output():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        raw = _write(tmpdir, "PriceFull1-001-202410200200.gz", b"data")
+        cache = DownloadCache(os.path.join(tmpdir, "cache"), max_age_days=1)
+        files = cache.describe("Victory", [raw])
+        output_dir = cache.output_dir_for("Victory", files)
+        output_dir.mkdir(parents=True)
+        cache.store("Victory", files, output_dir)
+
+        evicted = cache.evict(now=time.time() + 2 * 86400)
+        assert evicted == 1
+        assert cache.entries == {}
+        assert not output_dir.exists()
+
+
+def test_lru_eviction_keeps_most_recent():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = DownloadCache(os.path.join(tmpdir, "cache"), max_output_dirs=1)
+        cache.store("A", [("A/001/1", "x")], Path(tmpdir) / "a")
+        cache.store("B", [("B/001/1", "y")], Path(tmpdir) / "b")
+        cache.entries["A/001/1"]["lastUsedAt"] -= 10
+
+        cache.evict()
+        assert list(cache.entries) == ["B/001/1"]
+
+
+def test_lru_eviction_keeps_each_output_whole():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = DownloadCache(os.path.join(tmpdir, "cache"), max_output_dirs=1)
+        # An allStores chain: many files converted into one output
+        stores = [(f"A/{store:03d}/1", "x") for store in range(600)]
+        cache.store("A", stores, Path(tmpdir) / "a")
+        cache.store("B", [("B/001/1", "y")], Path(tmpdir) / "b")
+        cache.entries["B/001/1"]["lastUsedAt"] -= 10
+
+        cache.evict()
+        assert sorted(cache.entries) == [key for key, _ in stores]
+
+
+def test_eviction_keeps_output_this_manifest_doesnt_know():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        root = os.path.join(tmpdir, "cache")
+        other = DownloadCache(root)
+        other_dir = other.output_dir_for("Victory", [("Victory/001/1", "x")])
+        other_dir.mkdir(parents=True)
+
+        # A second task sharing the folder, whose manifest predates other's entry
+        cache = DownloadCache(root)
+        cache.evict()
+        assert other_dir.is_dir()
+
+        other.store("Victory", [("Victory/001/1", "x")], other_dir)
+        other.save()
+        cache.save()
+        assert "Victory/001/1" in cache.entries
+        assert "Victory/001/1" in DownloadCache(root).entries
+
+
+def test_finish_download_keeps_newest_file_and_counts_skipped():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = DownloadCache(os.path.join(tmpdir, "cache"))
+        folder = cache.dump_folder("VICTORY") / "Victory"
+        folder.mkdir(parents=True)
+        _write(folder, "PriceFull1-001-202410190200.gz", b"old")
+        _write(folder, "PriceFull1-001-202410200200.gz", b"latest")
+        before = cache.dump_files("VICTORY")
+
+        # A run that found the latest file already there downloads nothing
+        assert cache.finish_download("VICTORY", before) == {"downloaded": 0, "skipped": 1}
+        assert [p.name for p in cache.dump_files("VICTORY")] == ["PriceFull1-001-202410200200.gz"]
+
+        _write(folder, "PriceFull1-001-202410210200.gz", b"new")
+        _write(folder, "PriceFull1-002-202410210200.gz", b"other store")
+        assert cache.finish_download("VICTORY", before, limit=None) == {"downloaded": 2, "skipped": 0}
+        assert sorted(p.name for p in cache.dump_files("VICTORY")) == [
+            "PriceFull1-001-202410210200.gz",
+            "PriceFull1-002-202410210200.gz",
+        ]
+
+
+def test_abandoned_dumps_are_evicted():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = DownloadCache(os.path.join(tmpdir, "cache"), max_age_days=1)
+        folder = cache.dump_folder("VICTORY")
+        folder.mkdir(parents=True)
+        _write(folder, "PriceFull1-001-202410200200.gz", b"data")
+
+        cache.evict()
+        assert folder.is_dir()
+        cache.evict(now=time.time() + 2 * 86400)
+        assert not folder.exists()
@@ -0,0 +1,116 @@
+"""Tests for filters.RowFilter and filter push-down into the read stage"""
+
+import os
+import pickle
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from filters import FILTER_CATEGORY, FILTER_PRICE, FILTER_WEIGHT, RowFilter
+from metrics import MetricsCollector
+from parser import ENGINE_XML, aggregate_downloaded_data, deduplicate_products, iter_raw_xml
+
+
+def _rec(name="Milk", price=8.0, category="Dairy"):
+    return {"barcode": "1", "name": name, "price": price, "category": category, "supplier": "A"}
+
+
+def _write_chain(root, chain, items):
+    chain_dir = os.path.join(root, chain)
+    os.makedirs(chain_dir, exist_ok=True)
+    body = "".join(
+        f"<Item><ItemCode>{code}</ItemCode><ItemName>{name}</ItemName>"
+        f"<ItemPrice>{price}</ItemPrice><ManufacturerName>{category}</ManufacturerName></Item>"
+        for code, name, price, category in items
+    )
+    with open(os.path.join(chain_dir, "PriceFull1-001-202410200200.xml"), "w", encoding="utf-8") as f:
+        f.write(f"<root><Items>{body}</Items></root>")
+
+
+def _write_dump(root):
+    _write_chain(root, "chain_a", [
+        ("111", "Milk", 8, "Tnuva"),
+        ("222", "Gum", 1.5, "Elite"),
+        ("333", "עגבניות במשקל", 9, "Farm"),
+    ])
+    _write_chain(root, "chain_b", [
+        ("111", "Milk", 9, "Tnuva"),
+        ("222", "Gum", 2, "Elite"),
+        ("444", "Soap", 12, "Sano"),
+    ])
+
+
+def test_rejections_counted_per_filter():
+    row_filter = RowFilter(min_price=3.0, allowed_categories=["dairy"])
+    records = [
+        _rec(),
+        _rec(price=2.0),
+        _rec(name="בננה במשקל"),
+        _rec(category="Bakery"),
+        _rec(category="DAIRY"),
+    ]
+    kept = list(row_filter.apply(records))
+    assert len(kept) == 2
+    assert row_filter.stats() == {
+        "accepted": 2,
+        "rejected": {FILTER_PRICE: 1, FILTER_WEIGHT: 1, FILTER_CATEGORY: 1},
+    }
+
+
+def test_no_category_filter_when_unset():
+    row_filter = RowFilter()
+    assert row_filter.accept(_rec(category=""))
+    assert not row_filter.accept(_rec(name="במשקל"))
+
+
+def test_from_settings():
+    row_filter = RowFilter.from_settings({"minPrice": 5.0, "allowedCategories": ["A"]})
+    assert row_filter.min_price == 5.0
+    assert row_filter.allowed_categories == ["A"]
+    assert RowFilter.from_settings({}).min_price == 0.0
+
+
+def test_pickles_without_counts():
+    row_filter = RowFilter(min_price=3.0)
+    row_filter.accept(_rec(price=1.0))
+    restored = pickle.loads(pickle.dumps(row_filter))
+    assert restored.min_price == 3.0
+    assert restored.stats()["rejected"][FILTER_PRICE] == 0
+
+
+def test_fork_and_add_counts():
+    row_filter = RowFilter(min_price=3.0)
+    forked = row_filter.fork()
+    forked.accept(_rec(price=1.0))
+    forked.accept(_rec())
+    row_filter.add_counts(forked.stats())
+    assert row_filter.stats() == forked.stats()
+
+
+def test_iter_raw_xml_drops_rejected_rows(tmp_path):
+    _write_dump(str(tmp_path))
+    row_filter = RowFilter(min_price=3.0)
+    records = list(iter_raw_xml(str(tmp_path), row_filter=row_filter))
+    assert sorted(r["barcode"] for r in records) == ["111", "111", "444"]
+    assert row_filter.stats()["rejected"] == {FILTER_PRICE: 2, FILTER_WEIGHT: 1, FILTER_CATEGORY: 0}
+
+
+def test_pushed_down_read_matches_late_filters(tmp_path):
+    _write_dump(str(tmp_path))
+    expected = deduplicate_products(iter_raw_xml(str(tmp_path)), min_price=3.0, min_suppliers=1)
+    pushed = iter_raw_xml(str(tmp_path), row_filter=RowFilter(min_price=3.0))
+    assert deduplicate_products(pushed, min_price=3.0, min_suppliers=1) == expected
+
+    for workers in (1, 2):
+        row_filter = RowFilter(min_price=3.0)
+        metrics = MetricsCollector(emit=False)
+        aggregates, count = aggregate_downloaded_data(
+            str(tmp_path), engine=ENGINE_XML, workers=workers, metrics=metrics, row_filter=row_filter
+        )
+        assert count == 3
+        assert set(aggregates) == {"111", "444"}
+        read = metrics.summary()["stages"]["read"]
+        assert read["rowFilter"] == {
+            "accepted": 3,
+            "rejected": {FILTER_PRICE: 2, FILTER_WEIGHT: 1, FILTER_CATEGORY: 0},
+        }
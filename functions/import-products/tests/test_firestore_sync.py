@@ -18,7 +18,16 @@ sys.modules["google.cloud.firestore"] = _mock_firestore_mod
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
-from firestore_sync import sync_products, IMPORT_SOURCE, STALE_THRESHOLD_WEEKS
+from barcodes import BarcodeIndex, normalize_barcode
+from firestore_sync import (
+    _archive_stale_products_indexed,
+    migrate_to_barcode_ids,
+    product_doc_id,
+    sync_products,
+    IMPORT_SOURCE,
+    REFRESH_INTERVAL_WEEKS,
+    STALE_THRESHOLD_WEEKS,
+)
 
 
 def _make_mock_db(existing_docs=None):
@@ -32,14 +41,19 @@ def _make_mock_db(existing_docs=None):
         existing_docs = []
 
     mock_stream = []
-    for doc_data in existing_docs:
+    for i, doc_data in enumerate(existing_docs):
         mock_doc = MagicMock()
+        mock_doc.id = f"doc-{i}"
         mock_doc.to_dict.return_value = doc_data
         mock_doc.reference = MagicMock()
         mock_stream.append(mock_doc)
 
+    # Projection and partition filters return the same query, so every
+    # partition streams every doc (the index dedupes by barcode)
     query_mock = MagicMock()
-    query_mock.stream.return_value = mock_stream
+    query_mock.stream.side_effect = lambda: iter(mock_stream)
+    query_mock.select.return_value = query_mock
+    query_mock.where.return_value = query_mock
     db.collection.return_value.where.return_value = query_mock
 
     # Mock document creation
@@ -193,3 +207,500 @@ def test_empty_products_dict():
     counts = sync_products(db, {})
     assert counts["created"] == 0
     assert counts["updated"] == 0
+
+
+def test_skips_write_for_unchanged_recent_products():
+    recent_date = datetime.now(timezone.utc) - timedelta(days=3)
+    existing = [
+        {
+            "barcode": "111",
+            "name": "Milk",
+            "priceRange": "₪8–12",
+            "category": "Dairy",
+            "status": "active",
+            "lastImportedAt": recent_date,
+            "importSource": IMPORT_SOURCE,
+        }
+    ]
+    db, batch = _make_mock_db(existing)
+    products = {"111": {"name": "Milk", "priceRange": "₪8–12", "category": "Dairy"}}
+
+    counts = sync_products(db, products)
+
+    assert counts["unchanged"] == 1
+    assert counts["changed"] == 0
+    assert counts["refreshed"] == 0
+    assert batch.update.call_count == 0
+    assert batch.commit.call_count == 0
+
+
+def test_refreshes_last_imported_for_unchanged_old_products():
+    old_date = datetime.now(timezone.utc) - timedelta(weeks=REFRESH_INTERVAL_WEEKS + 1)
+    existing = [
+        {
+            "barcode": "111",
+            "name": "Milk",
+            "priceRange": "₪8–12",
+            "category": "Dairy",
+            "status": "active",
+            "lastImportedAt": old_date,
+            "importSource": IMPORT_SOURCE,
+        }
+    ]
+    db, batch = _make_mock_db(existing)
+    products = {"111": {"name": "Milk", "priceRange": "₪8–12", "category": "Dairy"}}
+
+    counts = sync_products(db, products)
+
+    assert counts["unchanged"] == 1
+    assert counts["refreshed"] == 1
+    update_data = batch.update.call_args[0][1]
+    assert update_data == {"lastImportedAt": "SERVER_TIMESTAMP_SENTINEL"}
+
+
+def test_rewrites_everything_when_diff_disabled():
+    recent_date = datetime.now(timezone.utc) - timedelta(days=3)
+    existing = [
+        {
+            "barcode": "111",
+            "name": "Milk",
+            "priceRange": "₪8–12",
+            "category": "Dairy",
+            "status": "active",
+            "lastImportedAt": recent_date,
+            "importSource": IMPORT_SOURCE,
+        }
+    ]
+    db, batch = _make_mock_db(existing)
+    products = {"111": {"name": "Milk", "priceRange": "₪8–12", "category": "Dairy"}}
+
+    counts = sync_products(db, products, skip_unchanged=False)
+
+    assert counts["changed"] == 1
+    assert batch.update.call_count == 1
+
+
+def _snapshot(doc_id, data):
+    snap = MagicMock()
+    snap.id = doc_id
+    snap.exists = data is not None
+    snap.to_dict.return_value = data
+    return snap
+
+
+def test_product_doc_id_normalizes_barcode():
+    assert product_doc_id("7290000000015") == "bc_7290000000015"
+    assert product_doc_id(" 07290000000015 ") == "bc_7290000000015"
+    assert product_doc_id("a/b") == "bc_a_b"
+    # Internal codes keep their zeros, as their canonical keys do
+    assert product_doc_id("001234") == "bc_001234"
+    assert product_doc_id("1234") == "bc_1234"
+
+
+def test_canonical_barcodes_keep_their_doc_ids():
+    for raw in ("0007290000000015", "7290000000015", "001234", " 42 "):
+        key, _ = normalize_barcode(raw)
+        assert product_doc_id(key) == product_doc_id(raw)
+
+
+def test_barcode_index_matches_padded_existing_barcodes():
+    existing = [
+        {
+            "barcode": "07290000000015",
+            "name": "Milk",
+            "priceRange": "₪7",
+            "status": "active",
+            "importSource": IMPORT_SOURCE,
+            "lastImportedAt": datetime.now(timezone.utc) - timedelta(weeks=STALE_THRESHOLD_WEEKS + 1),
+        }
+    ]
+    db, batch = _make_mock_db(existing)
+    products = {"7290000000015": {"name": "Milk", "priceRange": "₪8", "category": ""}}
+
+    counts = sync_products(db, products, barcode_index=BarcodeIndex())
+
+    assert counts["changed"] == 1
+    assert counts["created"] == 0
+    assert counts["archived"] == 0
+
+
+def test_barcode_index_archives_padded_duplicate_documents():
+    now = datetime.now(timezone.utc)
+    existing = [
+        {
+            "barcode": "07290000000015",
+            "name": "Milk",
+            "priceRange": "₪7",
+            "status": "active",
+            "importSource": IMPORT_SOURCE,
+            "lastImportedAt": now - timedelta(weeks=8),
+        },
+        {
+            "barcode": "7290000000015",
+            "name": "Milk",
+            "priceRange": "₪7",
+            "status": "active",
+            "importSource": IMPORT_SOURCE,
+            "lastImportedAt": now - timedelta(days=1),
+        },
+    ]
+    db, batch = _make_mock_db(existing)
+    products = {"7290000000015": {"name": "Milk", "priceRange": "₪8", "category": ""}}
+
+    counts = sync_products(db, products, barcode_index=BarcodeIndex())
+
+    assert counts["changed"] == 1
+    assert counts["archived"] == 1
+    # Update the latest document, archive the padded copy (other calls are partition bounds)
+    refs = [c[0][0] for c in db.collection.return_value.document.call_args_list]
+    assert [doc_id for doc_id in refs if doc_id.startswith("doc-")] == ["doc-1", "doc-0"]
+    assert batch.update.call_args_list[-1][0][1] == {"status": "archived"}
+
+
+def _migrated(db, ids=None):
+    """Make the mock db hold the ID map written by migrate_to_barcode_ids()."""
+    id_map_doc = db.document.return_value.get.return_value
+    id_map_doc.exists = True
+    id_map_doc.to_dict.return_value = {"ids": ids or {}}
+
+
+def test_deterministic_ids_create_without_loading_catalog():
+    db, batch = _make_mock_db()
+    _migrated(db)
+    db.get_all.return_value = [_snapshot("bc_111", None)]
+    products = {"111": {"name": "Milk", "priceRange": "₪8", "category": "Dairy"}}
+
+    counts = sync_products(db, products, deterministic_ids=True)
+
+    assert counts["created"] == 1
+    db.collection.return_value.document.assert_any_call("bc_111")
+    batch.set.assert_not_called()
+    doc_data = batch.create.call_args[0][1]
+    assert doc_data["barcode"] == "111"
+    assert doc_data["currentWeekVotes"] == 0
+
+
+def test_deterministic_ids_update_existing_doc():
+    db, batch = _make_mock_db()
+    _migrated(db)
+    db.get_all.return_value = [
+        _snapshot("bc_111", {"name": "Old", "priceRange": "₪7", "category": "", "status": "boycotted"})
+    ]
+    products = {"111": {"name": "Milk", "priceRange": "₪8", "category": "Dairy"}}
+
+    counts = sync_products(db, products, deterministic_ids=True)
+
+    assert counts["changed"] == 1
+    assert counts["created"] == 0
+    update_data = batch.update.call_args[0][1]
+    assert "currentWeekVotes" not in update_data
+    assert "status" not in update_data
+
+
+def test_deterministic_ids_write_each_document_once():
+    db, batch = _make_mock_db()
+    _migrated(db)
+    db.get_all.return_value = [
+        _snapshot(
+            "bc_7290000000015",
+            {"name": "Milk", "priceRange": "₪7", "category": "", "status": "boycotted", "currentWeekVotes": 40},
+        )
+    ]
+    products = {
+        "07290000000015": {"name": "Milk", "priceRange": "₪8", "category": ""},
+        "7290000000015": {"name": "Milk 1L", "priceRange": "₪9", "category": ""},
+    }
+
+    counts = sync_products(db, products, deterministic_ids=True)
+
+    assert counts["changed"] == 1
+    assert counts["created"] == 0
+    assert counts["sharedIds"] == 1
+    batch.set.assert_not_called()
+    batch.create.assert_not_called()
+    batch.update.assert_called_once()
+    refs = db.get_all.call_args[0][0]
+    assert len(refs) == 1
+    update_data = batch.update.call_args[0][1]
+    assert update_data["priceRange"] == "₪8"
+    assert "currentWeekVotes" not in update_data and "status" not in update_data
+
+
+def test_deterministic_ids_keep_internal_codes_apart():
+    db, batch = _make_mock_db()
+    _migrated(db)
+    db.get_all.return_value = []
+    products = {
+        "001234": {"name": "Bag", "priceRange": "₪1", "category": ""},
+        "1234": {"name": "Rolls", "priceRange": "₪5", "category": ""},
+    }
+
+    counts = sync_products(db, products, deterministic_ids=True, barcode_index=BarcodeIndex())
+
+    assert counts["created"] == 2
+    assert counts["sharedIds"] == 0
+    db.collection.return_value.document.assert_any_call("bc_001234")
+    db.collection.return_value.document.assert_any_call("bc_1234")
+
+
+def test_deterministic_ids_archive_without_loading_catalog():
+    db, batch = _make_mock_db()
+    _migrated(db)
+    db.get_all.return_value = [_snapshot("bc_111", None)]
+    products = {"111": {"name": "Milk", "priceRange": "₪8", "category": ""}}
+
+    sync_products(db, products, deterministic_ids=True)
+
+    query = db.collection.return_value.where.return_value
+    # The stale-candidate query ran; the catalog projection (select on the
+    # plain importSource query) never did
+    query.order_by.assert_called_once_with("lastImportedAt")
+    query.select.assert_not_called()
+
+
+def test_deterministic_ids_use_legacy_id_map():
+    db, batch = _make_mock_db()
+    _migrated(db, {"111": "legacy-id"})
+    db.get_all.return_value = [
+        _snapshot("legacy-id", {"name": "Milk", "priceRange": "₪8", "category": "Dairy"})
+    ]
+    products = {"111": {"name": "Milk", "priceRange": "₪9", "category": "Dairy"}}
+
+    counts = sync_products(db, products, deterministic_ids=True)
+
+    assert counts["changed"] == 1
+    db.collection.return_value.document.assert_any_call("legacy-id")
+
+
+def test_deterministic_ids_need_the_migration():
+    existing = [
+        {
+            "barcode": "111",
+            "name": "Milk",
+            "priceRange": "₪8",
+            "category": "",
+            "status": "active",
+            "importSource": IMPORT_SOURCE,
+            "lastImportedAt": datetime.now(timezone.utc),
+        }
+    ]
+    db, batch = _make_mock_db(existing)
+    db.document.return_value.get.return_value.exists = False
+    products = {"111": {"name": "Milk", "priceRange": "₪9", "category": ""}}
+
+    counts = sync_products(db, products, deterministic_ids=True)
+
+    # The random-ID product is found in the loaded catalog, not created again
+    assert counts["changed"] == 1
+    assert counts["created"] == 0
+    db.get_all.assert_not_called()
+    batch.create.assert_not_called()
+
+
+def test_migration_moves_idle_products_and_maps_engaged_ones():
+    existing = [
+        {"barcode": "111", "name": "Idle", "status": "active", "importSource": IMPORT_SOURCE},
+        {
+            "barcode": "222",
+            "name": "Voted",
+            "status": "active",
+            "totalHistoricalVotes": 3,
+            "importSource": IMPORT_SOURCE,
+        },
+    ]
+    db, batch = _make_mock_db(existing)
+    db.document.return_value.get.return_value.exists = False
+
+    counts = migrate_to_barcode_ids(db)
+
+    assert counts == {"moved": 1, "mapped": 1, "redirected": 0, "unchanged": 0}
+    batch.set.assert_not_called()
+    moved = batch.create.call_args[0][1]
+    assert moved["productId"] == "bc_111"
+    assert batch.delete.call_count == 1
+    id_map = db.document.return_value.set.call_args[0][0]["ids"]
+    assert id_map == {"222": "doc-1"}
+
+
+def test_migration_never_overwrites_an_existing_target():
+    existing = [
+        {"barcode": "111", "name": "Idle", "status": "active", "importSource": IMPORT_SOURCE},
+        {"barcode": "222", "name": "Idle", "status": "active", "importSource": IMPORT_SOURCE},
+    ]
+    db, batch = _make_mock_db(existing)
+    db.document.return_value.get.return_value.exists = False
+    # bc_111 was created by an earlier deterministic sync
+    db.get_all.return_value = [_snapshot("bc_111", {"barcode": "111"})]
+
+    counts = migrate_to_barcode_ids(db)
+
+    assert counts == {"moved": 1, "mapped": 0, "redirected": 1, "unchanged": 0}
+    assert [c[0][1]["productId"] for c in batch.create.call_args_list] == ["bc_222"]
+    batch.set.assert_not_called()
+    batch.update.assert_called_once()
+    assert batch.update.call_args[0][1] == {"status": "archived"}
+    saved = db.document.return_value.set.call_args[0][0]
+    assert saved["redirects"] == {"doc-0": "bc_111"}
+    assert saved["ids"] == {}
+
+
+def test_resume_skips_committed_products_and_reports_progress():
+    db, batch = _make_mock_db()
+    products = {str(i): {"name": f"P{i}", "priceRange": "₪5", "category": ""} for i in range(3)}
+    progress = []
+
+    counts = sync_products(db, products, resume_from=2, on_progress=progress.append)
+
+    assert counts["created"] == 1
+    assert batch.set.call_args[0][1]["barcode"] == "2"
+    assert progress == [3]
+
+
+def test_resumed_products_are_not_archived():
+    old_date = datetime.now(timezone.utc) - timedelta(weeks=STALE_THRESHOLD_WEEKS + 1)
+    existing = [
+        {
+            "barcode": "111",
+            "name": "Milk",
+            "priceRange": "₪8",
+            "category": "",
+            "status": "active",
+            "importSource": IMPORT_SOURCE,
+            "lastImportedAt": old_date,
+        }
+    ]
+    db, batch = _make_mock_db(existing)
+    products = {"111": {"name": "Milk", "priceRange": "₪8", "category": ""}}
+
+    counts = sync_products(db, products, resume_from=1)
+
+    assert counts["archived"] == 0
+    batch.update.assert_not_called()
+
+
+class _FakeStaleQuery:
+    """Query stand-in that evaluates where/order_by/limit/start_after over dicts."""
+
+    def __init__(self, docs, filters=(), order=None, limit=None, after=None, log=None):
+        self._docs = docs
+        self._filters = list(filters)
+        self._order = order
+        self._limit = limit
+        self._after = after
+        self.log = log if log is not None else []
+
+    def _with(self, **changes):
+        state = dict(filters=self._filters, order=self._order, limit=self._limit, after=self._after)
+        state.update(changes)
+        return _FakeStaleQuery(self._docs, log=self.log, **state)
+
+    def where(self, field, op, value):
+        return self._with(filters=self._filters + [(field, op, value)])
+
+    def order_by(self, field):
+        return self._with(order=field)
+
+    def select(self, fields):
+        return self
+
+    def limit(self, count):
+        return self._with(limit=count)
+
+    def start_after(self, doc):
+        return self._with(after=doc)
+
+    def stream(self):
+        ops = {"==": lambda a, b: a == b, "<": lambda a, b: a is not None and a < b}
+        docs = [
+            doc for doc in self._docs
+            if all(ops[op](doc.to_dict().get(field), value) for field, op, value in self._filters)
+        ]
+        docs.sort(key=lambda doc: (doc.to_dict()[self._order], doc.id))
+        if self._after is not None:
+            docs = docs[docs.index(self._after) + 1 :]
+        page = docs[: self._limit]
+        self.log.append(len(page))
+        return iter(page)
+
+
+def _stale_db(docs_data):
+    db = MagicMock()
+    batch = MagicMock()
+    db.batch.return_value = batch
+    docs = []
+    for i, data in enumerate(docs_data):
+        doc = MagicMock()
+        doc.id = f"doc-{i:03d}"
+        doc.to_dict.return_value = data
+        doc.reference = f"ref-{i:03d}"
+        docs.append(doc)
+    query = _FakeStaleQuery(docs)
+    db.collection.return_value = query
+    return db, batch, query
+
+
+def test_indexed_archive_pages_through_stale_candidates():
+    now = datetime.now(timezone.utc)
+    old = now - timedelta(weeks=STALE_THRESHOLD_WEEKS + 1)
+    docs = [
+        {
+            "barcode": str(i),
+            "status": "active",
+            "importSource": IMPORT_SOURCE,
+            "lastImportedAt": old - timedelta(hours=i),
+        }
+        for i in range(7)
+    ]
+    docs += [
+        {"barcode": "fresh", "status": "active", "importSource": IMPORT_SOURCE, "lastImportedAt": now},
+        {"barcode": "boycotted", "status": "boycotted", "importSource": IMPORT_SOURCE, "lastImportedAt": old},
+        {"barcode": "manual", "status": "active", "importSource": "manual", "lastImportedAt": old},
+    ]
+    db, batch, query = _stale_db(docs)
+
+    archived, _ = _archive_stale_products_indexed(db, seen_barcodes={"3"}, page_size=3)
+
+    assert archived == 6
+    archived_refs = {c[0][0] for c in batch.update.call_args_list}
+    assert archived_refs == {f"ref-{i:03d}" for i in range(7) if i != 3}
+    for c in batch.update.call_args_list:
+        assert c[0][1] == {"status": "archived"}
+    # Only the 7 candidates were read, in pages of 3
+    assert query.log == [3, 3, 1]
+
+    # Stored barcodes are compared by canonical key with a barcode index
+    db, batch, query = _stale_db(docs)
+    archived, _ = _archive_stale_products_indexed(
+        db, seen_barcodes={"3"}, page_size=3, barcode_index=BarcodeIndex()
+    )
+    assert archived == 6
+
+    # A seen barcode's stale candidate that isn't the document written this
+    # run is a duplicate of it (e.g. zero-padded) and is archived too
+    db, batch, query = _stale_db(docs)
+    archived, _ = _archive_stale_products_indexed(
+        db, seen_barcodes={"3"}, page_size=3, written_ids={"bc_3"}
+    )
+    assert archived == 7
+
+
+def test_sync_with_server_side_archive_skips_catalog_load():
+    old = datetime.now(timezone.utc) - timedelta(weeks=STALE_THRESHOLD_WEEKS + 1)
+    db, batch = _make_mock_db()
+    _migrated(db)
+    db.get_all.return_value = [_snapshot("bc_111", None)]
+    stale = MagicMock()
+    stale.to_dict.return_value = {"barcode": "999", "status": "active", "lastImportedAt": old}
+    stale.reference = "stale-ref"
+    query = db.collection.return_value.where.return_value
+    query.order_by.return_value = query
+    query.limit.return_value = query
+    query.stream.side_effect = lambda: iter([stale])
+    products = {"111": {"name": "Milk", "priceRange": "₪8", "category": ""}}
+
+    counts = sync_products(db, products, deterministic_ids=True, server_side_archive=True)
+
+    assert counts["created"] == 1
+    assert counts["archived"] == 1
+    batch.update.assert_called_once_with("stale-ref", {"status": "archived"})
+    assert [c[0][:2] for c in query.where.call_args_list] == [("status", "=="), ("lastImportedAt", "<")]
@@ -0,0 +1,169 @@
+"""Tests for metrics — stage collector and run status persistence."""
+
+import json
+import logging
+import sys
+import os
+import time
+from types import ModuleType
+from unittest.mock import MagicMock
+
+import pytest
+
+# Mock google.cloud.firestore before importing config (kept if already mocked/installed)
+_mock_firestore_mod = ModuleType("google.cloud.firestore")
+_mock_firestore_mod.SERVER_TIMESTAMP = "SERVER_TIMESTAMP_SENTINEL"
+_mock_google = ModuleType("google")
+_mock_google_cloud = ModuleType("google.cloud")
+_mock_google.cloud = _mock_google_cloud
+sys.modules.setdefault("google", _mock_google)
+sys.modules.setdefault("google.cloud", _mock_google_cloud)
+sys.modules.setdefault("google.cloud.firestore", _mock_firestore_mod)
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from config import RUN_HISTORY_LENGTH, update_run_status
+from metrics import MetricsCollector, current_rss_mb, folder_size, write_stats_metrics
+
+
+class TestMetricsCollector:
+    def test_stage_records_timings_and_counters(self):
+        metrics = MetricsCollector(emit=False)
+        with metrics.stage("dedup", records_in=10) as stage:
+            stage.records_out = 4
+            stage.extra["barcodes"] = 7
+
+        summary = metrics.summary()
+        dedup = summary["stages"]["dedup"]
+        assert dedup["recordsIn"] == 10
+        assert dedup["recordsOut"] == 4
+        assert dedup["barcodes"] == 7
+        assert dedup["status"] == "success"
+        assert dedup["wallS"] >= 0
+        assert dedup["cpuS"] >= 0
+        assert "bytesRead" not in dedup  # unset counters are omitted
+
+    def test_failed_stage_is_recorded_and_reraised(self):
+        metrics = MetricsCollector(emit=False)
+        with pytest.raises(RuntimeError):
+            with metrics.stage("sync"):
+                raise RuntimeError("boom")
+        assert metrics.summary()["stages"]["sync"]["status"] == "failed"
+
+    def test_emits_one_json_log_line_per_stage(self, caplog):
+        metrics = MetricsCollector(run_id="exec-1")
+        with caplog.at_level(logging.INFO, logger="metrics"):
+            with metrics.stage("download") as stage:
+                stage.bytes_read = 1234
+            with metrics.stage("read"):
+                pass
+
+        payloads = [json.loads(r.getMessage()) for r in caplog.records if r.name == "metrics"]
+        assert [p["stage"] for p in payloads] == ["download", "read"]
+        assert payloads[0]["event"] == "import_stage"
+        assert payloads[0]["bytesRead"] == 1234
+        assert payloads[0]["runId"] == "exec-1"
+
+    def test_folder_size(self, tmp_path):
+        (tmp_path / "a").mkdir()
+        (tmp_path / "a" / "x.csv").write_bytes(b"12345")
+        (tmp_path / "y.xml").write_bytes(b"123")
+        assert folder_size(tmp_path) == 8
+        assert folder_size(tmp_path / "missing") == 0
+
+    @pytest.mark.skipif(current_rss_mb() is None, reason="needs /proc/self/statm")
+    def test_stage_rss_is_measured_per_stage(self):
+        metrics = MetricsCollector(emit=False, rss_sample_s=0.005)
+        with metrics.stage("big"):
+            buf = b"x" * (64 << 20)
+            time.sleep(0.05)
+            del buf
+        with metrics.stage("small"):
+            pass
+
+        big = metrics.summary()["stages"]["big"]
+        small = metrics.summary()["stages"]["small"]
+        assert big["peakRssMb"] >= big["rssStartMb"] + 60
+        assert big["rssEndMb"] < big["peakRssMb"] - 60
+        # A later, small stage doesn't inherit the earlier stage's peak
+        assert small["peakRssMb"] < big["peakRssMb"] - 60
+
+
+class TestWriteStatsMetrics:
+    def test_flattens_phases(self):
+        write_stats = {
+            "upsert": {
+                "commits": 3,
+                "ops": 1200,
+                "retries": 1,
+                "latencyMsTotal": 300.0,
+                "latencyMsMax": 150.0,
+                "latencyHistogram": {"<=100ms": 2, "<=250ms": 1},
+            },
+            "archive": {
+                "commits": 1,
+                "ops": 10,
+                "retries": 0,
+                "latencyMsTotal": 100.0,
+                "latencyMsMax": 100.0,
+                "latencyHistogram": {"<=100ms": 1},
+            },
+        }
+        result = write_stats_metrics(write_stats)
+        assert result["firestoreOps"] == 1210
+        assert result["firestoreCommits"] == 4
+        assert result["firestoreRetries"] == 1
+        assert result["commitLatencyMsAvg"] == 100.0
+        assert result["commitLatencyMsMax"] == 150.0
+        assert result["commitLatencyHistogram"] == {"<=100ms": 3, "<=250ms": 1}
+
+    def test_no_commits(self):
+        result = write_stats_metrics({"upsert": {"commits": 0, "ops": 0}})
+        assert result["firestoreCommits"] == 0
+        assert result["commitLatencyMsAvg"] is None
+
+
+class TestUpdateRunStatus:
+    def _make_db(self, existing=None):
+        db = MagicMock()
+        doc_ref = db.document.return_value
+        snapshot = MagicMock()
+        snapshot.exists = existing is not None
+        snapshot.to_dict.return_value = existing
+        doc_ref.get.return_value = snapshot
+        return db, doc_ref
+
+    def test_without_metrics_writes_status_only(self):
+        db, doc_ref = self._make_db()
+        update_run_status(db, "skipped")
+
+        data = doc_ref.set.call_args[0][0]
+        assert data["lastRunStatus"] == "skipped"
+        assert "lastRunMetrics" not in data
+        assert "runHistory" not in data
+        doc_ref.get.assert_not_called()
+
+    def test_metrics_and_history_are_written(self):
+        db, doc_ref = self._make_db(existing={"lastRunStatus": "success"})
+        metrics = {"totalWallS": 12.5, "stages": {"download": {"wallS": 10.0}, "sync": {"wallS": 2.5}}}
+        update_run_status(db, "success", 42, metrics=metrics)
+
+        data = doc_ref.set.call_args[0][0]
+        assert doc_ref.set.call_args[1] == {"merge": True}
+        assert data["lastRunProductCount"] == 42
+        assert data["lastRunMetrics"] == metrics
+        assert len(data["runHistory"]) == 1
+        entry = data["runHistory"][0]
+        assert entry["status"] == "success"
+        assert entry["productCount"] == 42
+        assert entry["stageWallS"] == {"download": 10.0, "sync": 2.5}
+
+    def test_history_is_trimmed(self):
+        old = [{"status": "success", "productCount": i} for i in range(RUN_HISTORY_LENGTH)]
+        db, doc_ref = self._make_db(existing={"runHistory": old})
+        update_run_status(db, "failed", 0, metrics={"totalWallS": 1.0, "stages": {}})
+
+        history = doc_ref.set.call_args[0][0]["runHistory"]
+        assert len(history) == RUN_HISTORY_LENGTH
+        assert history[0]["productCount"] == 1
+        assert history[-1]["status"] == "failed"
@@ -0,0 +1,132 @@
+"""Tests for names.NameCleaner"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from chains import CHAINS, chain_name_variants
+from names import NameCleaner, canonical_name, vote_name
+from parser import clean_product_name, deduplicate_products, iter_parsed_output
+from synthetic_data import FORMAT_CSV, chain_names, generate_dump
+
+
+def test_strips_chain_names():
+    cleaner = NameCleaner(["Shufersal", "שופרסל"])
+    assert cleaner("נתחי סלמון טרי שופרסל") == "נתחי סלמון טרי"
+    assert cleaner("Shufersal Milk") == "Milk"
+    assert cleaner("  Bread  ") == "Bread"
+
+
+def test_longest_name_wins():
+    cleaner = NameCleaner(["Rami", "Rami Levy"])
+    assert cleaner("Milk Rami Levy") == "Milk"
+
+
+def test_no_chain_names():
+    cleaner = NameCleaner([])
+    assert cleaner(" Milk ") == "Milk"
+
+
+def test_regex_metacharacters_escaped():
+    cleaner = NameCleaner(["A.B"])
+    assert cleaner("Milk A.B") == "Milk"
+    assert cleaner("Milk AxB") == "Milk AxB"
+
+
+def test_matches_clean_product_name_on_synthetic_names(tmp_path):
+    generate_dump(str(tmp_path), 2000, fmt=FORMAT_CSV, seed=3)
+    names = chain_names()
+    cleaner = NameCleaner(names)
+    for record in iter_parsed_output(str(tmp_path)):
+        assert cleaner(record["name"]) == clean_product_name(record["name"], names)
+
+
+def test_cache_stats():
+    cleaner = NameCleaner(["X"], cache_size=2)
+    for name in ["a X", "a X", "b X", "a X", "c X", "b X"]:
+        cleaner(name)
+    stats = cleaner.stats()
+    assert stats["hits"] + stats["misses"] == 6
+    assert stats["hits"] == 2
+    assert stats["cached"] == 2
+    assert stats["hitRate"] == round(2 / 6, 4)
+    assert NameCleaner([]).stats()["hitRate"] is None
+
+
+def test_chain_name_variants_include_hebrew_aliases():
+    variants = chain_name_variants(CHAINS)
+    assert variants[: len(CHAINS)] == [c["name"] for c in CHAINS]
+    assert "שופרסל" in variants
+    assert "רמי לוי" in variants
+    assert len(variants) == len(set(variants))
+
+
+def test_dedup_strips_hebrew_chain_names():
+    records = [
+        {"barcode": "1", "name": "חלב תנובה שופרסל", "price": 6.0, "supplier": "Shufersal"},
+        {"barcode": "1", "name": "חלב תנובה", "price": 7.0, "supplier": "Rami Levy"},
+    ]
+    result = deduplicate_products(records, chain_names=chain_name_variants(CHAINS))
+    assert result["1"]["name"] == "חלב תנובה"
+
+
+def test_canonical_name_folds_spelling_variants():
+    assert canonical_name("חָלָב 1 ל׳") == canonical_name("חלב  1ליטר")
+    assert canonical_name("קוטג׳ 250 גר׳") == canonical_name("קוטג' 250גרם")
+    assert canonical_name("שוקו 1 ק״ג") == canonical_name('שוקו 1 קג')
+    assert canonical_name("Milk\u00a0 1L") == "milk 1l"
+
+
+def test_canonical_name_keeps_different_products_apart():
+    assert canonical_name("חלב 1 ליטר") != canonical_name("חלב 2 ליטר")
+    assert canonical_name("גרעינים") == "גרעינים"
+    # Unit words are only rewritten after a quantity
+    assert canonical_name("גר ביער") == "גר ביער"
+
+
+def test_vote_name_counts_variants_together():
+    counts = [("קוטג' 250 גרם", 2), ("קוטג׳ 250 גר׳", 2), ("קוטג' 250גרם", 1), ("גבינה לבנה", 3)]
+    # 5 votes for the cottage cheese key beat 3; shown in its most common spelling
+    assert vote_name(counts, NameCleaner([]).normalize) == "קוטג' 250 גרם"
+
+
+def test_vote_name_ties_go_to_first_seen():
+    normalize = NameCleaner([]).normalize
+    assert vote_name([("Beta", 1), ("Alpha", 1)], normalize) == "Beta"
+    assert vote_name([("חלב 1 ל'", 1), ("חלב 1 ליטר", 1)], normalize) == "חלב 1 ל'"
+
+
+def test_normalize_is_cached():
+    cleaner = NameCleaner(["X"])
+    assert cleaner.normalize("Milk X") == ("Milk", "milk")
+    cleaner.normalize("Milk X")
+    cleaner("Milk X")
+    assert cleaner.stats()["hits"] == 2
+
+
+def test_dedup_merges_spelling_variants():
+    records = [
+        {"barcode": "1", "name": "במבה 80 גר׳", "price": 5.0, "supplier": "A"},
+        {"barcode": "1", "name": "במבה 80 גרם", "price": 5.0, "supplier": "B"},
+        {"barcode": "1", "name": "במבה 80 גר׳", "price": 5.0, "supplier": "B"},
+        {"barcode": "1", "name": "במבה נוגט", "price": 5.0, "supplier": "A"},
+        {"barcode": "1", "name": "במבה נוגט", "price": 5.0, "supplier": "A"},
+    ]
+    result = deduplicate_products(records, min_suppliers=1)
+    assert result["1"]["name"] == "במבה 80 גר׳"
+
+
+def test_normalize_many_matches_normalize():
+    cleaner = NameCleaner(["Shufersal", "שופרסל"])
+    names = [
+        "במבה 80גר׳ שופרסל",
+        "  Shufersal  חלב 3%  1 ל' ",
+        "Shufersal",
+        "מים 1.5ליטר\n",
+        "",
+        "קפה נָמֵס 200 גרם",
+    ]
+    assert cleaner.normalize_many(names) == [cleaner.normalize(name) for name in names]
+    assert cleaner.normalize_many([]) == []
+    assert cleaner.normalize_many(["a\0b"]) == [cleaner.normalize("a\0b")]
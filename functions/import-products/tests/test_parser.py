@@ -7,7 +7,7 @@ import tempfile
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
-from parser import _read_parsed_output
+from parser import _read_parsed_output, iter_parsed_output
 
 
 def _write_csv(folder, filename, rows):
@@ -89,3 +89,16 @@ def test_empty_folder():
     with tempfile.TemporaryDirectory() as tmpdir:
         records = _read_parsed_output(tmpdir)
         assert records == []
+
+
+def test_iter_parsed_output_is_lazy():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        _write_csv(
+            tmpdir,
+            "prices.csv",
+            [{"ItemCode": "111", "ItemName": "Milk", "ItemPrice": "8.0", "ManufacturerName": ""}],
+        )
+        records = iter_parsed_output(tmpdir)
+        assert iter(records) is records
+        assert next(records)["barcode"] == "111"
+        assert next(records, None) is None
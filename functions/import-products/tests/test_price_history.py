@@ -0,0 +1,110 @@
+"""Tests for price_history (weekly varint-encoded chunks, mmap reader)"""
+
+import os
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from aggregate import aggregate_records
+from price_history import (
+    HistoryChunk,
+    PriceHistory,
+    decode_entry,
+    decode_varint,
+    encode_entry,
+    encode_varint,
+    week_start,
+    write_chunk,
+)
+
+
+def _aggregates(rows):
+    aggregates, _ = aggregate_records(
+        ({"barcode": b, "name": "x", "price": p, "category": "", "supplier": s} for b, p, s in rows),
+        track_prices=True,
+    )
+    return aggregates
+
+
+def test_varint_round_trip():
+    out = bytearray()
+    values = [0, 1, 127, 128, 300, 2**32 + 5]
+    for value in values:
+        encode_varint(value, out)
+    pos = 0
+    decoded = []
+    for _ in values:
+        value, pos = decode_varint(out, pos)
+        decoded.append(value)
+    assert decoded == values
+    assert pos == len(out)
+
+
+def test_entry_is_delta_encoded_in_agorot():
+    entry = encode_entry(12.9, 15.5, 13.4, 3)
+    assert len(entry) == 6  # 1290 (2 bytes), 260 (2), 50, 3
+    assert decode_entry(entry) == (12.9, 15.5, 13.4, 3)
+
+
+def test_week_start_is_monday():
+    assert week_start(date(2026, 10, 17)) == date(2026, 10, 12)
+    assert week_start(date(2026, 10, 12)) == date(2026, 10, 12)
+
+
+def test_chunk_random_access(tmp_path):
+    path = tmp_path / "w.phc"
+    entries = [(str(7290000000000 + i * 7), (i + 1.0, i + 2.5, i + 1.5, i % 5)) for i in range(1000)]
+    assert write_chunk(path, date(2026, 10, 12), reversed(entries)) == 1000
+
+    with HistoryChunk(path) as chunk:
+        assert len(chunk) == 1000
+        assert chunk.week == date(2026, 10, 12)
+        assert chunk.get("7290000000007") == (2.0, 3.5, 2.5, 1)
+        assert chunk.get("7290000006993") == (1000.0, 1001.5, 1000.5, 4)
+        assert chunk.get("missing") is None
+        assert [barcode for barcode, _ in chunk.items()] == sorted(barcode for barcode, _ in entries)
+
+
+def test_record_run_and_query(tmp_path):
+    history = PriceHistory(tmp_path)
+    assert history.query(["1"]) == {"1": []}
+
+    week1 = _aggregates([("1", 5.0, "A"), ("1", 7.0, "B"), ("1", 6.0, "C"), ("2", 9.0, "A")])
+    assert history.record_run(week1, day=date(2026, 10, 5)) == 2
+    week2 = _aggregates([("1", 5.5, "A"), ("2", 9.0, "A"), ("3", 4.0, "B")])
+    assert history.record_run(week2, barcodes={"1", "3"}, day=date(2026, 10, 14)) == 2
+
+    assert history.weeks() == [date(2026, 10, 5), date(2026, 10, 12)]
+    result = history.query(["1", "2", "4"], weeks=2)
+    assert result["1"] == [(date(2026, 10, 5), 5.0, 7.0, 6.0, 3), (date(2026, 10, 12), 5.5, 5.5, 5.5, 1)]
+    assert result["2"] == [(date(2026, 10, 5), 9.0, 9.0, 9.0, 1)]
+    assert result["4"] == []
+    assert history.query(["1"], weeks=1)["1"] == [(date(2026, 10, 12), 5.5, 5.5, 5.5, 1)]
+    history.close()
+
+
+def test_later_run_replaces_the_week(tmp_path):
+    history = PriceHistory(tmp_path)
+    history.record_run(_aggregates([("1", 5.0, "A")]), day=date(2026, 10, 12))
+    assert history.query(["1"])["1"][0][1] == 5.0
+    history.record_run(_aggregates([("1", 4.0, "A")]), day=date(2026, 10, 16))
+    assert history.query(["1"])["1"] == [(date(2026, 10, 12), 4.0, 4.0, 4.0, 1)]
+    history.close()
+
+
+def test_query_is_fast(tmp_path):
+    history = PriceHistory(tmp_path)
+    barcodes = [str(7290000000000 + i) for i in range(20_000)]
+    for week in range(12):
+        entries = [(b, (3.0 + week, 5.0 + week, 4.0 + week, 2)) for b in barcodes]
+        day = date.fromordinal(date(2026, 7, 27).toordinal() + 7 * week)
+        write_chunk(history._path(day), day, entries)
+
+    start = time.perf_counter()
+    result = history.query(barcodes[::1000], weeks=12)
+    elapsed = time.perf_counter() - start
+    assert all(len(rows) == 12 for rows in result.values())
+    assert elapsed < 0.5
+    history.close()
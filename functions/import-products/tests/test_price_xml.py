@@ -0,0 +1,131 @@
+"""Tests for price_xml streaming reader and parser._read_raw_xml()."""
+
+import gzip
+import os
+import sys
+import tempfile
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from parser import _read_raw_xml
+from price_xml import iter_price_rows, open_price_file
+
+SHUFERSAL_XML = """<?xml version="1.0" encoding="utf-8"?>
+<root>
+  <ChainId>7290027600007</ChainId>
+  <StoreId>001</StoreId>
+  <Items Count="2">
+    <Item>
+      <ItemCode>111</ItemCode>
+      <ItemName>חלב 3%</ItemName>
+      <ManufacturerName>תנובה</ManufacturerName>
+      <ItemPrice>6.90</ItemPrice>
+    </Item>
+    <Item>
+      <ItemCode>222</ItemCode>
+      <ItemName>לחם</ItemName>
+      <ManufacturerName>אנג'ל</ManufacturerName>
+      <ItemPrice>12.00</ItemPrice>
+    </Item>
+  </Items>
+</root>
+"""
+
+VICTORY_XML = """<?xml version="1.0" encoding="utf-8"?>
+<Prices>
+  <Products>
+    <Product>
+      <itemcode>333</itemcode>
+      <itemname>Water</itemname>
+      <itemprice>5.5</itemprice>
+    </Product>
+  </Products>
+</Prices>
+"""
+
+
+def _write(path, xml, compression=None):
+    data = xml.encode("utf-8")
+    if compression == "gzip":
+        with gzip.open(path, "wb") as f:
+            f.write(data)
+    elif compression == "zip":
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr("prices.xml", data)
+    else:
+        with open(path, "wb") as f:
+            f.write(data)
+    return path
+
+
+def test_reads_plain_xml_items():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = _write(os.path.join(tmpdir, "PriceFull.xml"), SHUFERSAL_XML)
+        rows = list(iter_price_rows(path))
+        assert len(rows) == 2
+        assert rows[0] == {
+            "ItemCode": "111",
+            "ItemName": "חלב 3%",
+            "ItemPrice": "6.90",
+            "ManufacturerName": "תנובה",
+        }
+
+
+def test_reads_gzipped_xml_regardless_of_extension():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = _write(os.path.join(tmpdir, "PriceFull.xml"), SHUFERSAL_XML, "gzip")
+        assert [r["ItemCode"] for r in iter_price_rows(path)] == ["111", "222"]
+
+
+def test_reads_zipped_xml():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = _write(os.path.join(tmpdir, "PriceFull.zip"), SHUFERSAL_XML, "zip")
+        assert [r["ItemCode"] for r in iter_price_rows(path)] == ["111", "222"]
+
+
+def test_zipped_stream_closes_its_archive():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = _write(os.path.join(tmpdir, "PriceFull.zip"), SHUFERSAL_XML, "zip")
+        with open_price_file(path) as stream:
+            archive = stream._archive
+            assert stream.read(5) == b"<?xml"
+            assert archive.fp is not None
+        assert stream.closed and archive.fp is None
+
+
+def test_product_tags_and_lowercase_fields():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = _write(os.path.join(tmpdir, "PriceFull.xml"), VICTORY_XML)
+        rows = list(iter_price_rows(path))
+        assert rows == [
+            {"ItemCode": "333", "ItemName": "Water", "ItemPrice": "5.5", "ManufacturerName": ""}
+        ]
+
+
+def test_read_raw_xml_matches_record_shape():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        chain_dir = os.path.join(tmpdir, "shufersal")
+        os.makedirs(chain_dir)
+        _write(os.path.join(chain_dir, "PriceFull7290027600007-001-202410200200.gz"), SHUFERSAL_XML, "gzip")
+
+        records = _read_raw_xml(tmpdir)
+        assert records[0] == {
+            "barcode": "111",
+            "name": "חלב 3%",
+            "price": 6.9,
+            "category": "תנובה",
+            "supplier": "Shufersal",
+        }
+        assert len(records) == 2
+
+
+def test_read_raw_xml_skips_corrupt_files():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        chain_dir = os.path.join(tmpdir, "victory")
+        os.makedirs(chain_dir)
+        _write(os.path.join(chain_dir, "bad.xml"), "<Prices><Product>")
+        _write(os.path.join(chain_dir, "good.xml"), VICTORY_XML)
+
+        records = _read_raw_xml(tmpdir)
+        assert [r["barcode"] for r in records] == ["333"]
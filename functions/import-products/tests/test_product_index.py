@@ -0,0 +1,99 @@
+"""Tests for product_index — projected, partitioned load of existing products."""
+
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from barcodes import BarcodeIndex
+from product_index import ProductIndex, load_product_index, partition_bounds
+
+
+class _FakeQuery:
+    """Minimal query that honours select() and __name__ range filters."""
+
+    def __init__(self, docs, selected=None, filters=()):
+        self.docs = docs
+        self.selected = selected
+        self.filters = filters
+
+    def select(self, fields):
+        return _FakeQuery(self.docs, list(fields), self.filters)
+
+    def where(self, field, op, value):
+        assert field == "__name__"
+        return _FakeQuery(self.docs, self.selected, self.filters + ((op, value),))
+
+    def stream(self):
+        for doc_id, data in self.docs:
+            if all(doc_id >= v if op == ">=" else doc_id < v for op, v in self.filters):
+                doc = MagicMock()
+                doc.id = doc_id
+                doc.to_dict.return_value = {k: data[k] for k in self.selected if k in data}
+                yield doc
+
+
+def _collection():
+    collection = MagicMock()
+    # Range filters compare against the boundary ID itself
+    collection.document.side_effect = lambda doc_id: doc_id
+    return collection
+
+
+def test_partition_bounds_cover_the_id_space():
+    bounds = partition_bounds(4)
+    assert len(bounds) == 4
+    assert bounds[0][0] is None and bounds[-1][1] is None
+    for (_, end), (start, _) in zip(bounds, bounds[1:]):
+        assert end == start
+
+
+def test_single_partition_is_unbounded():
+    assert partition_bounds(1) == [(None, None)]
+
+
+def test_loads_each_doc_once_across_partitions():
+    docs = [
+        (doc_id, {"barcode": f"bc-{doc_id}", "name": "X", "internal": "secret"})
+        for doc_id in ["0abc", "Abc", "Zzz", "abc", "zzz", "5x"]
+    ]
+    index = load_product_index(_collection(), _FakeQuery(docs), partitions=4)
+    assert len(index) == 6
+    assert index["bc-Zzz"].doc_id == "Zzz"
+
+
+def test_keys_by_canonical_barcode_with_a_barcode_index():
+    docs = [("doc1", {"barcode": "07290000000015", "name": "Milk"}), ("doc2", {"barcode": "55", "name": "X"})]
+    index = load_product_index(_collection(), _FakeQuery(docs), partitions=2, barcode_index=BarcodeIndex())
+    assert index["7290000000015"].doc_id == "doc1"
+    assert "55" in index
+
+
+def test_padded_duplicates_keep_the_latest_import():
+    now = datetime.now(timezone.utc)
+    docs = [
+        ("doc1", {"barcode": "07290000000015", "status": "active", "lastImportedAt": now - timedelta(weeks=8)}),
+        ("doc2", {"barcode": "7290000000015", "status": "active", "lastImportedAt": now}),
+        ("doc3", {"barcode": "007290000000015", "status": "boycotted"}),
+    ]
+    index = load_product_index(_collection(), _FakeQuery(docs), partitions=2, barcode_index=BarcodeIndex())
+    assert len(index) == 1
+    assert index["7290000000015"].doc_id == "doc2"
+    assert sorted(entry.doc_id for _, entry in index.duplicates) == ["doc1", "doc3"]
+
+
+def test_change_detection_and_refresh():
+    recent = datetime.now(timezone.utc) - timedelta(days=1)
+    index = ProductIndex(_collection())
+    index.add("doc-1", {"barcode": "111", "name": "Milk", "priceRange": "₪8", "category": "Dairy",
+                        "status": "active", "lastImportedAt": recent})
+    index.add("doc-2", {"name": "no barcode"})
+
+    assert len(index) == 1
+    assert index.is_unchanged("111", "Milk", "₪8", "Dairy")
+    assert not index.is_unchanged("111", "Milk", "₪9", "Dairy")
+    assert not index.needs_refresh("111", recent - timedelta(days=1))
+    assert index.needs_refresh("111", recent + timedelta(days=1))
+    assert index.ref("111") == "doc-1"
@@ -0,0 +1,76 @@
+"""Tests for rate_limit.TokenBucket and RateLimiterRegistry."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from rate_limit import RateLimiterRegistry, TokenBucket
+
+
+class _FakeClock:
+    """Manual clock; sleeping advances time instantly."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _bucket(rate, capacity=1):
+    clock = _FakeClock()
+    return TokenBucket(rate, capacity, clock=clock, sleep=clock.sleep), clock
+
+
+def test_first_acquire_does_not_wait():
+    bucket, clock = _bucket(rate=0.5)
+    assert bucket.acquire() == 0.0
+    assert clock.sleeps == []
+
+
+def test_second_acquire_waits_for_refill():
+    bucket, clock = _bucket(rate=0.5)
+    bucket.acquire()
+    waited = bucket.acquire()
+    assert waited == 2.0
+    assert clock.now == 2.0
+
+
+def test_elapsed_time_refills_tokens():
+    bucket, clock = _bucket(rate=0.5)
+    bucket.acquire()
+    clock.now += 5.0
+    assert bucket.acquire() == 0.0
+
+
+def test_capacity_allows_bursts():
+    bucket, clock = _bucket(rate=1.0, capacity=3)
+    assert [bucket.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.acquire() == 1.0
+
+
+def test_try_acquire_never_blocks():
+    bucket, clock = _bucket(rate=1.0)
+    assert bucket.try_acquire() is True
+    assert bucket.try_acquire() is False
+    assert clock.sleeps == []
+
+
+def test_registry_shares_bucket_per_key():
+    clock = _FakeClock()
+    registry = RateLimiterRegistry(rate=1.0, clock=clock, sleep=clock.sleep)
+    assert registry.get("a.example") is registry.get("a.example")
+    assert registry.get("a.example") is not registry.get("b.example")
+
+
+def test_registry_keys_are_independent():
+    clock = _FakeClock()
+    registry = RateLimiterRegistry(rate=0.5, clock=clock, sleep=clock.sleep)
+    registry.get("a.example").acquire()
+    assert registry.get("b.example").acquire() == 0.0
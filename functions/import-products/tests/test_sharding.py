@@ -0,0 +1,151 @@
+"""Tests for sharding — chain assignment, partials and the local map runner."""
+
+import os
+import sys
+import textwrap
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from aggregate import aggregate_records
+from sharding import (
+    chains_for_task,
+    partial_path,
+    read_partial,
+    reduce_partials,
+    run_local_shards,
+    task_from_env,
+    wait_for_partials,
+    write_partial,
+)
+
+
+def _records(supplier, *barcodes):
+    return [{"barcode": bc, "name": f"Item {bc}", "price": 5.0, "supplier": supplier} for bc in barcodes]
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 4, 7])
+def test_chain_slices_are_disjoint_and_ordered(count):
+    chains = list("abcde")
+    slices = [chains_for_task(chains, i, count) for i in range(count)]
+    assert [c for s in slices for c in s] == chains
+    sizes = [len(s) for s in slices]
+    assert max(sizes) - min(sizes) <= 1
+
+
+def test_chain_slice_rejects_bad_index():
+    with pytest.raises(ValueError):
+        chains_for_task(["a"], 2, 2)
+
+
+def test_task_from_env(monkeypatch):
+    monkeypatch.delenv("CLOUD_RUN_TASK_INDEX", raising=False)
+    monkeypatch.delenv("CLOUD_RUN_TASK_COUNT", raising=False)
+    assert task_from_env() == (0, 1)
+    monkeypatch.setenv("CLOUD_RUN_TASK_INDEX", "2")
+    monkeypatch.setenv("CLOUD_RUN_TASK_COUNT", "3")
+    assert task_from_env() == (2, 3)
+
+
+def test_reduce_matches_single_pass(tmp_path):
+    shard_a = _records("Chain A", "1", "2")
+    shard_b = _records("Chain B", "2", "3")
+    for index, records in enumerate([shard_a, shard_b]):
+        aggregates, count = aggregate_records(records)
+        write_partial(partial_path(tmp_path, "run", index, 2), aggregates, count)
+
+    paths = wait_for_partials(tmp_path, "run", 2, timeout=0)
+    aggregates, count = reduce_partials(paths)
+
+    expected, expected_count = aggregate_records(shard_a + shard_b)
+    assert count == expected_count == 4
+    assert aggregates == expected
+    assert aggregates["2"].suppliers == {"Chain A", "Chain B"}
+
+
+def test_wait_times_out_on_missing_partial(tmp_path):
+    write_partial(partial_path(tmp_path, "run", 0, 2), {}, 0)
+    with pytest.raises(TimeoutError, match=r"\[1\]"):
+        wait_for_partials(tmp_path, "run", 2, timeout=0, sleep=lambda s: None)
+
+
+def test_local_shards_run_as_subprocesses(tmp_path):
+    # Stand-in map task: writes a partial for its task index, as main.py --map-only does
+    script = tmp_path / "map_task.py"
+    script.write_text(
+        textwrap.dedent(
+            f"""
+            import os, sys
+            sys.path.insert(0, {os.path.join(os.path.dirname(__file__), "..")!r})
+            from aggregate import aggregate_records
+            from sharding import partial_path, task_from_env, write_partial
+
+            index, count = task_from_env()
+            assert os.environ["IMPORT_DATA_DIR"].endswith(f"task-{{index}}/dumps")
+            records = [{{"barcode": "1", "name": "Milk", "price": 5.0, "supplier": f"Chain {{index}}"}}]
+            write_partial(
+                partial_path(os.environ["IMPORT_SHARD_DIR"], os.environ["CLOUD_RUN_EXECUTION"], index, count),
+                *aggregate_records(records),
+            )
+            """
+        )
+    )
+
+    run_local_shards(3, "run", shard_dir=tmp_path, command=[sys.executable, str(script)])
+
+    aggregates, count = reduce_partials(wait_for_partials(tmp_path, "run", 3, timeout=0))
+    assert count == 3
+    assert aggregates["1"].suppliers == {"Chain 0", "Chain 1", "Chain 2"}
+    assert read_partial(partial_path(tmp_path, "run", 0, 3))[1] == 1
+
+
+def test_local_shards_run_main_without_firestore(tmp_path, monkeypatch):
+    # Fake scraper: each chain publishes one PriceFull file with the same item.
+    # google-cloud isn't importable in the subprocesses, so the real
+    # main.py --map-only path must get by on the settings handed down.
+    fake = tmp_path / "fake_modules"
+    package = fake / "il_supermarket_scarper"
+    package.mkdir(parents=True)
+    (package / "scrappers_factory.py").write_text(
+        "import enum\n"
+        "ScraperFactory = enum.Enum('ScraperFactory', ['SHUFERSAL', 'RAMI_LEVY', 'VICTORY', 'YAYNO_BITAN'])\n"
+    )
+    (package / "__init__.py").write_text(
+        textwrap.dedent(
+            """
+            import os
+
+            class ScarpingTask:
+                def __init__(self, dump_folder_name, files_types, enabled_scrapers, limit):
+                    self.folder = dump_folder_name
+                    self.scrapers = enabled_scrapers
+
+                def start(self):
+                    for scraper in self.scrapers:
+                        chain_dir = os.path.join(self.folder, scraper.name.lower())
+                        os.makedirs(chain_dir, exist_ok=True)
+                        with open(os.path.join(chain_dir, "PriceFull1-001-202601040200.xml"), "w") as f:
+                            f.write(
+                                "<root><Items><Item><ItemCode>42</ItemCode><ItemName>Milk</ItemName>"
+                                "<ItemPrice>6</ItemPrice></Item></Items></root>"
+                            )
+            """
+        )
+    )
+    (fake / "google.py").write_text("raise ImportError('google-cloud is not available here')\n")
+    monkeypatch.setenv("PYTHONPATH", str(fake))
+    monkeypatch.setenv("IMPORT_CACHE_DIR", str(tmp_path / "cache"))
+
+    settings = {"parserEngine": "xml", "downloadCache": False, "checkpoints": False, "runHistory": [object()]}
+    run_local_shards(2, "run", shard_dir=tmp_path, settings=settings)
+
+    aggregates, count = reduce_partials(wait_for_partials(tmp_path, "run", 2, timeout=0))
+    assert count == 4
+    assert len(aggregates["42"].suppliers) == 4
+
+
+def test_local_shards_report_failures(tmp_path):
+    command = [sys.executable, "-c", "import os, sys; sys.exit(int(os.environ['CLOUD_RUN_TASK_INDEX']))"]
+    with pytest.raises(RuntimeError, match=r"\[1\]"):
+        run_local_shards(2, "run", shard_dir=tmp_path, command=command)
@@ -0,0 +1,110 @@
+"""Tests for spill.SpillingAggregator — external-memory aggregation."""
+
+import os
+import sys
+import tracemalloc
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import spill
+from aggregate import aggregate_records
+from parser import deduplicate_products, finalize_products
+from sharding import partial_path, reduce_partials, write_partial
+from spill import SpilledAggregates, SpillingAggregator
+
+
+@pytest.fixture(autouse=True)
+def _small_checks(monkeypatch, tmp_path):
+    monkeypatch.setattr(spill, "CHECK_EVERY", 50)
+    monkeypatch.setattr(spill, "SPILL_FOLDER", str(tmp_path))
+
+
+def _records(n, barcodes=300):
+    """Records with shared barcodes, name ties and several suppliers."""
+    for i in range(n):
+        barcode = str(1000 + (i * 7) % barcodes)
+        yield {
+            "barcode": barcode,
+            "name": f"Item {barcode} {'A' if i % 3 else 'B'}",
+            "price": 3.0 + (i % 11),
+            "category": "Dairy" if i % 5 else "Snacks",
+            "supplier": f"Chain {i % 4}",
+        }
+
+
+def test_spilled_result_matches_in_memory(tmp_path):
+    expected, expected_count = aggregate_records(_records(3000))
+
+    spiller = SpillingAggregator(0.01, spill_dir=str(tmp_path))
+    count = spiller.add_records(_records(3000))
+    aggregates = spiller.finish()
+
+    assert spiller.stats["spills"] > 1
+    assert isinstance(aggregates, SpilledAggregates)
+    assert count == expected_count
+    assert len(aggregates) == len(expected)
+    assert aggregates.to_dict() == expected
+    # Tie-breaks depend on tally order, which must survive the merge
+    for barcode, agg in aggregates.items():
+        assert list(agg.names) == list(expected[barcode].names)
+
+    assert finalize_products(aggregates, min_suppliers=2) == finalize_products(expected, min_suppliers=2)
+    aggregates.close()
+    assert not any(tmp_path.iterdir())
+
+
+def test_no_spill_returns_plain_dict(tmp_path):
+    spiller = SpillingAggregator(1024, spill_dir=str(tmp_path))
+    spiller.add_records(_records(500))
+    aggregates = spiller.finish()
+    assert isinstance(aggregates, dict)
+    assert spiller.stats["spills"] == 0
+
+
+def test_merge_partials_in_order(tmp_path):
+    first, _ = aggregate_records(_records(1000))
+    second, _ = aggregate_records(_records(1000, barcodes=500))
+    expected, _ = aggregate_records(list(_records(1000)) + list(_records(1000, barcodes=500)))
+
+    spiller = SpillingAggregator(0.01, spill_dir=str(tmp_path))
+    spiller.merge(first.items())
+    spiller.merge(second.items())
+    assert spiller.finish().to_dict() == expected
+
+
+def test_deduplicate_products_with_memory_limit():
+    expected = deduplicate_products(_records(3000), min_suppliers=2)
+    assert deduplicate_products(_records(3000), min_suppliers=2, memory_limit_mb=0.01) == expected
+
+
+def test_reduce_partials_with_memory_limit(tmp_path):
+    shards = [aggregate_records(_records(800)), aggregate_records(_records(800, barcodes=450))]
+    for index, (aggregates, count) in enumerate(shards):
+        write_partial(partial_path(tmp_path, "run", index, 2), aggregates, count)
+    paths = [partial_path(tmp_path, "run", i, 2) for i in range(2)]
+
+    expected, expected_count = reduce_partials(paths)
+    aggregates, count = reduce_partials(paths, memory_limit_mb=0.01)
+    assert count == expected_count == 1600
+    assert aggregates.to_dict() == expected
+
+
+def test_peak_memory_stays_near_budget(tmp_path):
+    def peak(fn):
+        tracemalloc.start()
+        try:
+            fn()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    in_memory = peak(lambda: aggregate_records(_records(20000, barcodes=20000)))
+
+    def spilled():
+        spiller = SpillingAggregator(0.5, spill_dir=str(tmp_path))
+        spiller.add_records(_records(20000, barcodes=20000))
+        spiller.finish().close()
+
+    assert peak(spilled) < in_memory / 2
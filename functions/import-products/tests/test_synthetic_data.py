@@ -0,0 +1,61 @@
+"""Tests for synthetic_data.generate_dump() and the benchmark runner."""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from benchmark import run_benchmark
+from parser import _read_parsed_output, _read_raw_xml, deduplicate_products
+from synthetic_data import FORMAT_CSV, FORMAT_XML, chain_names, generate_dump
+
+
+def _records(fmt, rows, seed=0, **kwargs):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        files = generate_dump(tmpdir, rows, fmt=fmt, seed=seed, **kwargs)
+        read = _read_parsed_output if fmt == FORMAT_CSV else _read_raw_xml
+        return files, read(tmpdir)
+
+
+def test_generates_requested_row_count():
+    files, records = _records(FORMAT_CSV, 1000, chains=3, stores_per_chain=2)
+    assert len(files) == 6
+    assert len(records) == 1000
+
+
+def test_same_seed_same_data():
+    assert _records(FORMAT_CSV, 300)[1] == _records(FORMAT_CSV, 300)[1]
+    assert _records(FORMAT_CSV, 300, seed=1)[1] != _records(FORMAT_CSV, 300, seed=2)[1]
+
+
+def test_csv_and_xml_hold_the_same_rows():
+    _, csv_records = _records(FORMAT_CSV, 500)
+    _, xml_records = _records(FORMAT_XML, 500)
+    key = lambda r: (r["supplier"], r["barcode"], r["name"], r["price"])
+    assert sorted(map(key, csv_records)) == sorted(map(key, xml_records))
+
+
+def test_data_has_realistic_quirks():
+    _, records = _records(FORMAT_CSV, 3000)
+    names = [r["name"] for r in records]
+    barcodes = [r["barcode"] for r in records]
+
+    assert any("במשקל" in n for n in names)
+    assert any(n.endswith(chain) for n in names for chain in chain_names())
+    assert len(set(barcodes)) < len(barcodes)
+
+    products = deduplicate_products(records, min_suppliers=2, chain_names=chain_names())
+    assert products
+    assert all(len(p["suppliers"]) >= 2 for p in products.values())
+
+
+def test_benchmark_reports_each_stage():
+    result = run_benchmark(
+        600, stages=["read_csv", "read_xml", "clean_product_name", "deduplicate_products"]
+    )
+    assert result["rows"] == 600
+    assert set(result["stages"]) == {"read_csv", "read_xml", "clean_product_name", "deduplicate_products"}
+    for stats in result["stages"].values():
+        assert stats["seconds"] >= 0
+        assert stats["peakMemoryMb"] is not None
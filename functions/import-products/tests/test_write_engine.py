@@ -0,0 +1,151 @@
+"""Tests for write_engine.BatchWriteEngine — uses a mocked Firestore client."""
+
+import os
+import sys
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from write_engine import BatchWriteEngine
+
+
+class TransientError(Exception):
+    pass
+
+
+class _RecordingDb:
+    """Fake client whose batches record their ops and commit via a callback."""
+
+    def __init__(self, commit=None):
+        self.committed = []
+        self._commit = commit
+        self._lock = threading.Lock()
+
+    def batch(self):
+        db = self
+        ops = []
+        batch = MagicMock()
+        batch.set.side_effect = lambda ref, data, **kw: ops.append(("set", ref))
+        batch.update.side_effect = lambda ref, data: ops.append(("update", ref))
+        batch.create.side_effect = lambda ref, data: ops.append(("create", ref))
+
+        def commit():
+            if db._commit:
+                db._commit(ops)
+            with db._lock:
+                db.committed.append(list(ops))
+
+        batch.commit.side_effect = commit
+        return batch
+
+
+def test_splits_ops_into_batches():
+    db = _RecordingDb()
+    with BatchWriteEngine(db, batch_size=3, ramp=False) as writer:
+        for i in range(7):
+            writer.set(f"ref-{i}", {"i": i})
+
+    assert sorted(len(ops) for ops in db.committed) == [1, 3, 3]
+    assert writer.stats["commits"] == 3
+    assert writer.stats["ops"] == 7
+    assert sum(writer.stats["latencyHistogram"].values()) == 3
+
+
+def test_create_is_committed_as_create():
+    db = _RecordingDb()
+    with BatchWriteEngine(db, ramp=False) as writer:
+        writer.create("ref-new", {"a": 1})
+        writer.update("ref-old", {"a": 2})
+
+    assert db.committed == [[("create", "ref-new"), ("update", "ref-old")]]
+
+
+def test_retries_transient_errors():
+    failures = {"left": 2}
+
+    def flaky(ops):
+        if failures["left"]:
+            failures["left"] -= 1
+            raise TransientError("try again")
+
+    db = _RecordingDb(commit=flaky)
+    writer = BatchWriteEngine(db, ramp=False, retryable=[TransientError], sleep=lambda s: None)
+    writer.update("ref", {"a": 1})
+    stats = writer.close()
+
+    assert stats["retries"] == 2
+    assert stats["commits"] == 1
+    assert db.committed == [[("update", "ref")]]
+
+
+def test_gives_up_after_max_retries():
+    def always_fail(ops):
+        raise TransientError("down")
+
+    db = _RecordingDb(commit=always_fail)
+    writer = BatchWriteEngine(
+        db, ramp=False, max_retries=2, retryable=[TransientError], sleep=lambda s: None
+    )
+    writer.set("ref", {})
+    with pytest.raises(TransientError):
+        writer.close()
+    assert writer.stats["retries"] == 2
+
+
+def test_non_transient_errors_are_not_retried():
+    def broken(ops):
+        raise ValueError("bad request")
+
+    db = _RecordingDb(commit=broken)
+    writer = BatchWriteEngine(db, ramp=False, retryable=[TransientError])
+    writer.set("ref", {})
+    with pytest.raises(ValueError):
+        writer.close()
+    assert writer.stats["retries"] == 0
+
+
+def test_ramp_throttles_to_initial_rate():
+    now = {"t": 0.0}
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now["t"] += seconds
+
+    db = _RecordingDb()
+    with BatchWriteEngine(db, batch_size=500, clock=lambda: now["t"], sleep=sleep) as writer:
+        for i in range(1500):
+            writer.set(f"ref-{i}", {})
+
+    # 500 ops/s: the first batch is free, the next two wait ~1s each
+    assert sum(sleeps) == pytest.approx(2.0)
+
+
+def test_mark_fires_in_order_after_commits():
+    db = _RecordingDb()
+    fired = []
+    with BatchWriteEngine(db, batch_size=2, max_in_flight=4, ramp=False) as writer:
+        for i in range(3):
+            writer.set(f"ref-{i}", {})
+            writer.mark(lambda i=i: fired.append((i, sum(len(ops) for ops in db.committed))))
+
+    assert [i for i, _ in fired] == [0, 1, 2]
+    # Every op added before a marker had committed when it fired
+    assert all(committed_ops >= i + 1 for i, committed_ops in fired)
+
+
+def test_mark_does_not_fire_after_failed_commit():
+    def broken(ops):
+        raise ValueError("bad request")
+
+    db = _RecordingDb(commit=broken)
+    fired = []
+    writer = BatchWriteEngine(db, ramp=False, retryable=[TransientError])
+    writer.set("ref", {})
+    writer.mark(lambda: fired.append(True))
+    with pytest.raises(ValueError):
+        writer.close()
+    assert fired == []
@@ -0,0 +1,297 @@
+"""
+Concurrent commit engine for Firestore writes.
+
+Collects set/update operations into WriteBatches of up to BATCH_SIZE ops
+and commits them on a bounded thread pool, so network round-trips overlap
+instead of running one after another. Throughput follows Firestore's
+"500/50/5" ramp-up rule: start at 500 ops/s and grow by 50% every
+5 minutes. Transient errors are retried with jittered exponential backoff.
+Per-commit latencies are collected into a histogram.
+
+Usage:
+    with BatchWriteEngine(db) as writer:
+        writer.set(ref, data)
+        writer.update(ref, fields)
+    writer.stats  # commits, ops, retries, latency histogram
+
+mark(callback) flushes and calls callback() once every operation added so
+far has committed, which lets callers persist a resume cursor.
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+MAX_IN_FLIGHT = 8
+
+# 500/50/5: 500 ops/s to start, +50% every 5 minutes
+RAMP_INITIAL_OPS_PER_S = 500
+RAMP_GROWTH = 1.5
+RAMP_INTERVAL_S = 300
+
+MAX_RETRIES = 5
+BACKOFF_BASE_S = 0.5
+BACKOFF_MAX_S = 30.0
+
+# Upper bounds (ms) of the commit latency histogram buckets
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000)
+
+
+def _transient_errors():
+    """Exception types worth retrying (empty if google-api-core is missing)."""
+    try:
+        from google.api_core import exceptions
+    except ImportError:
+        return ()
+    return (
+        exceptions.Aborted,
+        exceptions.DeadlineExceeded,
+        exceptions.InternalServerError,
+        exceptions.ServiceUnavailable,
+        exceptions.TooManyRequests,
+    )
+
+
+def _bucket_label(latency_ms):
+    for bound in LATENCY_BUCKETS_MS:
+        if latency_ms <= bound:
+            return f"<={bound}ms"
+    return f">{LATENCY_BUCKETS_MS[-1]}ms"
+
+
+class BatchWriteEngine:
+    """Pipelines WriteBatch commits with bounded in-flight concurrency."""
+
+    def __init__(
+        self,
+        db,
+        batch_size=BATCH_SIZE,
+        max_in_flight=MAX_IN_FLIGHT,
+        ramp=True,
+        max_retries=MAX_RETRIES,
+        retryable=None,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self.db = db
+        self.batch_size = batch_size
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_retries = max_retries
+        self._clock = clock
+        self._sleep = sleep
+        self._retryable = _transient_errors() if retryable is None else tuple(retryable)
+
+        self._started = clock()
+        self._limiter = None
+        if ramp:
+            self._limiter = TokenBucket(
+                RAMP_INITIAL_OPS_PER_S,
+                capacity=max(batch_size, RAMP_INITIAL_OPS_PER_S),
+                clock=clock,
+                sleep=sleep,
+            )
+
+        self._pool = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="commit")
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._lock = threading.Lock()
+        self._pending = []
+        self._futures = []
+        self._error = None
+        self._closed = False
+
+        # Batches are numbered in submission order; markers fire once the
+        # contiguous prefix of committed batches reaches them
+        self._submitted = 0
+        self._committed = set()
+        self._committed_prefix = 0
+        self._markers = deque()
+        self._marker_lock = threading.Lock()
+
+        self.stats = {
+            "commits": 0,
+            "ops": 0,
+            "retries": 0,
+            "latencyMsTotal": 0.0,
+            "latencyMsMax": 0.0,
+            "latencyHistogram": {},
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._shutdown()
+        return False
+
+    def set(self, ref, data, merge=False):
+        self._add(("set", ref, data, merge))
+
+    def create(self, ref, data):
+        """Like set(), but the batch fails if the document already exists."""
+        self._add(("create", ref, data, None))
+
+    def update(self, ref, data):
+        self._add(("update", ref, data, None))
+
+    def delete(self, ref):
+        self._add(("delete", ref, None, None))
+
+    def _add(self, op):
+        if self._closed:
+            raise RuntimeError("BatchWriteEngine is closed")
+        self._raise_if_failed()
+        self._pending.append(op)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Submit the pending operations as one batch (non-blocking)."""
+        if not self._pending:
+            return
+        ops = self._pending
+        self._pending = []
+
+        self._throttle(len(ops))
+        self._slots.acquire()
+        try:
+            self._futures.append(self._pool.submit(self._commit, ops, self._submitted))
+        except Exception:
+            self._slots.release()
+            raise
+        self._submitted += 1
+
+    def mark(self, callback):
+        """
+        Flush, then call callback() once every operation added so far has
+        committed. Callbacks run in order, on the thread completing the
+        last outstanding commit; they never run if that commit fails.
+        """
+        self._raise_if_failed()
+        self.flush()
+        with self._lock:
+            self._markers.append((self._submitted, callback))
+        self._fire_markers()
+
+    def _fire_markers(self):
+        with self._marker_lock:
+            while True:
+                with self._lock:
+                    if not self._markers or self._markers[0][0] > self._committed_prefix:
+                        return
+                    _, callback = self._markers.popleft()
+                callback()
+
+    def close(self):
+        """Flush, wait for every in-flight commit and re-raise the first failure."""
+        if self._closed:
+            return self.stats
+        try:
+            self.flush()
+            for future in self._futures:
+                future.result()
+        finally:
+            self._shutdown()
+        self._raise_if_failed()
+
+        if self.stats["commits"]:
+            logger.info(
+                "Committed %d ops in %d batches (%d retries, avg %.0fms, max %.0fms): %s",
+                self.stats["ops"],
+                self.stats["commits"],
+                self.stats["retries"],
+                self.stats["latencyMsTotal"] / self.stats["commits"],
+                self.stats["latencyMsMax"],
+                self.stats["latencyHistogram"],
+            )
+        return self.stats
+
+    def _shutdown(self):
+        self._closed = True
+        self._pool.shutdown(wait=True)
+
+    def _raise_if_failed(self):
+        if self._error is not None:
+            raise self._error
+
+    def _throttle(self, op_count):
+        """Apply the 500/50/5 ramp before handing a batch to the pool."""
+        if self._limiter is None:
+            return
+        steps = int((self._clock() - self._started) // RAMP_INTERVAL_S)
+        self._limiter.rate = RAMP_INITIAL_OPS_PER_S * (RAMP_GROWTH ** steps)
+        self._limiter.capacity = max(self.batch_size, self._limiter.rate)
+        self._limiter.acquire(min(op_count, self._limiter.capacity))
+
+    def _commit(self, ops, seq):
+        try:
+            attempt = 0
+            while True:
+                batch = self.db.batch()
+                for kind, ref, data, merge in ops:
+                    if kind == "set":
+                        if merge:
+                            batch.set(ref, data, merge=True)
+                        else:
+                            batch.set(ref, data)
+                    elif kind == "create":
+                        batch.create(ref, data)
+                    elif kind == "update":
+                        batch.update(ref, data)
+                    else:
+                        batch.delete(ref)
+
+                started = self._clock()
+                try:
+                    batch.commit()
+                except self._retryable as e:
+                    if attempt >= self.max_retries:
+                        raise
+                    attempt += 1
+                    backoff = random.uniform(0, min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** attempt))
+                    logger.warning(
+                        "Transient commit error (%s), retry %d/%d in %.1fs",
+                        e.__class__.__name__,
+                        attempt,
+                        self.max_retries,
+                        backoff,
+                    )
+                    with self._lock:
+                        self.stats["retries"] += 1
+                    self._sleep(backoff)
+                    continue
+
+                self._record(len(ops), (self._clock() - started) * 1000.0, seq)
+                self._fire_markers()
+                return
+        except Exception as e:
+            with self._lock:
+                if self._error is None:
+                    self._error = e
+            logger.exception("Batch commit of %d ops failed", len(ops))
+        finally:
+            self._slots.release()
+
+    def _record(self, op_count, latency_ms, seq):
+        with self._lock:
+            self._committed.add(seq)
+            while self._committed_prefix in self._committed:
+                self._committed.remove(self._committed_prefix)
+                self._committed_prefix += 1
+            self.stats["commits"] += 1
+            self.stats["ops"] += op_count
+            self.stats["latencyMsTotal"] += latency_ms
+            self.stats["latencyMsMax"] = max(self.stats["latencyMsMax"], latency_ms)
+            label = _bucket_label(latency_ms)
+            histogram = self.stats["latencyHistogram"]
+            histogram[label] = histogram.get(label, 0) + 1